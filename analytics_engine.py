@@ -0,0 +1,173 @@
+"""
+Optional columnar engine for aggregation queries.
+
+With ANALYTICS_ENGINE=duckdb (and the duckdb package installed), chart and
+analytical-question queries run on an in-process DuckDB database instead of
+SQLite. DuckDB attaches the SQLite file read-only, so it always sees what
+uploads have written, and scans it with vectorized, multi-threaded operators.
+Setting ANALYTICS_PARQUET_PATH reads groundwater_data from Parquet exports
+instead, which DuckDB scans column by column. Inserts and uploads stay on
+SQLite.
+"""
+
+import os
+import threading
+import time
+
+import pandas as pd
+
+import sqlite_postgres_utils
+from metrics import observe
+from slow_query_log import record_query
+from text_to_sql import ALLOWED_TABLES
+
+# "duckdb" to aggregate on DuckDB; anything else keeps aggregations on SQLite
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sqlite")
+
+# Worker threads and memory DuckDB may use per API process
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", str(os.cpu_count() or 4)))
+ANALYTICS_MEMORY_LIMIT = os.getenv("ANALYTICS_MEMORY_LIMIT", "1GB")
+
+# Parquet files (a path or glob, e.g. exports/*.parquet) to read groundwater_data from instead of SQLite
+ANALYTICS_PARQUET_PATH = os.getenv("ANALYTICS_PARQUET_PATH")
+
+_duckdb_ready = None
+_database = None
+_database_lock = threading.Lock()
+
+# This thread's cursor: (database it belongs to, cursor)
+_local = threading.local()
+
+
+def install_extensions() -> bool:
+    """Download DuckDB's sqlite extension; a setup step, run at server startup, never per request."""
+    try:
+        import duckdb
+        conn = duckdb.connect()
+        try:
+            conn.execute("INSTALL sqlite")
+        finally:
+            conn.close()
+        return True
+    except Exception as e:
+        print(f"Error installing DuckDB sqlite extension: {str(e).splitlines()[0]}")
+        return False
+
+
+def duckdb_ready() -> bool:
+    """Whether DuckDB and its installed sqlite extension load (checked once, without network access)."""
+    global _duckdb_ready
+    if _duckdb_ready is None:
+        try:
+            import duckdb
+            conn = duckdb.connect()
+            try:
+                conn.execute("LOAD sqlite")
+            finally:
+                conn.close()
+            _duckdb_ready = True
+        except Exception as e:
+            print(f"⚠️ ANALYTICS_ENGINE=duckdb but DuckDB is unavailable ({str(e).splitlines()[0]}); aggregating on SQLite. "
+                  f"Run `python analytics_engine.py` to install the sqlite extension.")
+            _duckdb_ready = False
+    return _duckdb_ready
+
+
+def setup_analytics_engine():
+    """Install DuckDB's extensions and check they load, when ANALYTICS_ENGINE=duckdb."""
+    if ANALYTICS_ENGINE == "duckdb":
+        install_extensions()
+        duckdb_ready()
+
+
+def analytics_dialect() -> str:
+    """The engine, and SQL dialect, aggregation queries run on: 'duckdb' or 'sqlite'."""
+    if ANALYTICS_ENGINE == "duckdb" and duckdb_ready():
+        return "duckdb"
+    return "sqlite"
+
+
+def quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def open_database(db_path: str, parquet_path: str = None):
+    """An in-memory DuckDB database with a view per analytical table over the SQLite file (or Parquet)."""
+    import duckdb
+
+    conn = duckdb.connect(config={"threads": ANALYTICS_THREADS, "memory_limit": ANALYTICS_MEMORY_LIMIT})
+    conn.execute("LOAD sqlite")
+    conn.execute(f"ATTACH {quote(db_path)} AS store (TYPE sqlite, READ_ONLY)")
+
+    tables = {row[0] for row in conn.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE database_name = 'store'"
+    ).fetchall()}
+    for table in ALLOWED_TABLES:
+        if table == "groundwater_data" and parquet_path:
+            conn.execute(f"CREATE VIEW groundwater_data AS SELECT * FROM read_parquet({quote(parquet_path)})")
+        elif table in tables:
+            # Views keep the planner's table names; every query reads the SQLite file as it is now
+            conn.execute(f"CREATE VIEW {table} AS SELECT * FROM store.{table}")
+    return conn
+
+
+def get_cursor():
+    """This thread's cursor on the analytics database, rebuilt when the SQLite file or Parquet path changes."""
+    global _database
+    db_path = sqlite_postgres_utils.DB_PATH
+    if not os.path.exists(db_path):
+        raise Exception(f"Database file {db_path} not found. Please run simple_setup.py first.")
+
+    key = (db_path, os.stat(db_path).st_ino, ANALYTICS_PARQUET_PATH)
+    with _database_lock:
+        if _database is None or _database[0] != key:
+            _database = (key, open_database(db_path, ANALYTICS_PARQUET_PATH))
+        database = _database
+
+    # DuckDB connections are not shared between threads; cursors are connections to the same database
+    cached = getattr(_local, "cursor", None)
+    if cached is None or cached[0] is not database:
+        cached = _local.cursor = (database, database[1].cursor())
+    return cached[1]
+
+
+def explain_duckdb(query: str, params=None) -> list:
+    """DuckDB's physical plan for a query, as text lines."""
+    rows = get_cursor().execute(f"EXPLAIN {query}", list(params or ())).fetchall()
+    return [line for _, plan in rows for line in plan.splitlines()]
+
+
+def run_duckdb(query: str, params, timeout: float, fetch):
+    cursor = get_cursor()
+    # Interrupt the query once the deadline passes
+    timer = threading.Timer(timeout, cursor.interrupt)
+    timer.start()
+    start = time.perf_counter()
+    try:
+        result = fetch(cursor.execute(query, list(params or ())))
+        record_query("duckdb", query, params, time.perf_counter() - start, len(result), explain_duckdb)
+        return result
+
+    finally:
+        timer.cancel()
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="duckdb")
+
+
+def run_analytics_query(query: str, params=None, timeout: float = 5) -> list:
+    """Run an aggregation SELECT on the analytics engine and return row tuples."""
+    if analytics_dialect() == "duckdb":
+        return run_duckdb(query, params, timeout, lambda result: result.fetchall())
+    return sqlite_postgres_utils.run_readonly_query(query, params, timeout=timeout)
+
+
+def run_analytics_frame(query: str, params=None, timeout: float = 5) -> pd.DataFrame:
+    """Run an aggregation SELECT on the analytics engine and return a DataFrame."""
+    if analytics_dialect() == "duckdb":
+        return run_duckdb(query, params, timeout, lambda result: result.df())
+    return sqlite_postgres_utils.run_readonly_frame(query, params, timeout=timeout)
+
+
+if __name__ == "__main__":
+    # Explicit setup step, e.g. in a Docker build: fetch the extension before serving
+    if install_extensions() and duckdb_ready():
+        print("✅ DuckDB sqlite extension installed")
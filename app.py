@@ -3,6 +3,8 @@ import requests
 import os
 import pandas as pd
 import tempfile
+from sse_utils import iter_sse_events
+from upload_readers import preview_upload, PREVIEW_ROWS
 
 
 st.title("INGRES AI Chatbot 💧")
@@ -12,47 +14,75 @@ tab1, tab2 = st.tabs(["💬 Chat", "📊 Upload Data"])
 
 with tab1:
     question = st.text_input("Ask about groundwater:")
+    stream_response = st.checkbox("Stream response", value=True)
     if st.button("Ask"):
-        resp = requests.post("http://127.0.0.1:8000/ask", json={"question": question})
-        answer = resp.json()["answer"]
+        if stream_response:
+            # Render stage events and answer tokens as they arrive
+            status = st.empty()
+            answer_placeholder = st.empty()
+            answer = ""
+            
+            with requests.post("http://127.0.0.1:8000/ask/stream", json={"question": question}, stream=True) as resp:
+                for event, data in iter_sse_events(resp.iter_lines()):
+                    if event == "route":
+                        status.caption(f"🧭 Route: {data['route']}")
+                    elif event == "retrieval":
+                        hits = len(data['semantic']) + len(data['keyword'])
+                        status.caption(f"🔍 Retrieved {hits} passages")
+                    elif event == "chart":
+                        status.caption("📊 Chart ready")
+                    elif event == "token":
+                        answer += data['text']
+                        if not answer.startswith('/static/'):
+                            answer_placeholder.write(answer)
+                    elif event == "error":
+                        # Generation broke off; the fallback answer is streamed next
+                        status.caption(f"⚠️ {data['error']}")
+                        if data.get('discard_tokens'):
+                            answer = ""
+                            answer_placeholder.empty()
+                    elif event == "done":
+                        answer = data['answer']
+        else:
+            resp = requests.post("http://127.0.0.1:8000/ask", json={"question": question})
+            answer = resp.json()["answer"]
         
         # Check if the answer contains a chart URL
         if answer.endswith('.png') and answer.startswith('/static/'):
             # Display the chart image
             st.image(answer, caption="Generated Chart", use_column_width=True)
             st.write("Chart generated successfully!")
-        else:
+        elif not stream_response:
             # Display regular text response
             st.write(answer)
 
 with tab2:
     st.header("📁 Upload Groundwater Data")
-    st.write("Upload Excel (.xlsx) or CSV files containing groundwater measurements")
+    st.write("Upload Excel (.xlsx), CSV, Parquet or Arrow files containing groundwater measurements")
     
     # File uploader
     uploaded_file = st.file_uploader(
         "Choose a file",
-        type=['csv', 'xlsx', 'xls'],
-        help="Upload Excel or CSV files with groundwater data"
+        type=['csv', 'xlsx', 'xls', 'parquet', 'arrow', 'feather'],
+        help="Upload Excel, CSV, Parquet or Arrow files with groundwater data"
     )
     
     if uploaded_file is not None:
         try:
-            # Process the uploaded file
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(uploaded_file)
+            # Only the first rows are parsed; the backend streams the full file on upload
+            df = preview_upload(uploaded_file.getvalue(), uploaded_file.name)
+            if df is None:
+                raise ValueError("Unsupported file format")
             
             st.success(f"✅ File uploaded successfully: {uploaded_file.name}")
-            st.write(f"📊 Data shape: {df.shape[0]} rows, {df.shape[1]} columns")
+            st.write(f"📊 Showing the first {len(df)} rows, {df.shape[1]} columns")
             
             # Show data preview
             st.subheader("📋 Data Preview")
-            st.dataframe(df.head(10))
+            st.dataframe(df)
             
             # Show column information
-            st.subheader("📝 Column Information")
+            st.subheader(f"📝 Column Information (first {PREVIEW_ROWS} rows)")
             col_info = pd.DataFrame({
                 'Column': df.columns,
                 'Type': df.dtypes,
@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+import math
+import os
+import re
+import time
+from functools import partial
+
+import pandas as pd
+
+from metrics import inc, dec, observe
+from postgres_utils import (
+    PG_CONNECT_TIMEOUT, PG_ITERSIZE, PG_PRIMARY_DSN, PG_REPLICA_DSNS, PG_REPLICA_MAX_LAG, PG_REPLICA_CHECK_INTERVAL,
+    REPLICA_LAG_QUERY, explain_query, frame_dtypes, frame_from_batches,
+)
+from slow_query_log import record_query
+
+# asyncpg pool bounds per API worker; one event loop multiplexes all of them
+PG_ASYNC_POOL_MIN = int(os.getenv("PG_ASYNC_POOL_MIN", "1"))
+PG_ASYNC_POOL_MAX = int(os.getenv("PG_ASYNC_POOL_MAX", "20"))
+
+# Prepared statements kept per connection; repeated queries skip parse and plan
+PG_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "256"))
+
+# Default per-query timeout in seconds
+PG_QUERY_TIMEOUT = float(os.getenv("PG_QUERY_TIMEOUT", "10"))
+
+# One pool per server: DSN -> pool, each created under its server's own lock
+_pools = {}
+_pool_locks = {}
+
+# Replica DSN -> (when its lag was measured, lag in seconds)
+_replica_lag = {}
+_replica_turn = itertools.count()
+
+# psycopg2 placeholders: %s for a parameter, %% for a literal percent sign
+_PLACEHOLDER = re.compile(r"%[s%]")
+
+
+def to_asyncpg(query: str, params=None) -> tuple:
+    """Rewrite a psycopg2-style query and parameters for asyncpg: $n placeholders, parameters as given."""
+    counter = iter(range(1, 1 + query.count("%s")))
+    query = _PLACEHOLDER.sub(lambda match: "%" if match.group() == "%%" else f"${next(counter)}", query)
+
+    # psycopg2 inlines parameters as literals and lets Postgres coerce them; asyncpg binds
+    # typed values, so date parameters must already be dates (plan_sql makes them so for
+    # Postgres). Strings stay strings: one may be bound to a text column that looks like a date.
+    return query, list(params or ())
+
+
+async def get_async_pool(dsn: str = None):
+    """The asyncpg pool for a server (the primary by default), created on first use on the running event loop."""
+    dsn = dsn or PG_PRIMARY_DSN
+    pool = _pools.get(dsn)
+    if pool is not None:
+        return pool
+    # Connecting to an unreachable replica only holds up tasks waiting for that replica
+    async with _pool_locks.setdefault(dsn, asyncio.Lock()):
+        pool = _pools.get(dsn)
+        if pool is None:
+            import asyncpg
+
+            pool = _pools[dsn] = await asyncpg.create_pool(
+                dsn,
+                min_size=PG_ASYNC_POOL_MIN,
+                max_size=PG_ASYNC_POOL_MAX,
+                statement_cache_size=PG_STATEMENT_CACHE_SIZE,
+                command_timeout=PG_QUERY_TIMEOUT,
+                timeout=PG_CONNECT_TIMEOUT,
+            )
+        return pool
+
+
+async def replica_lag_async(dsn: str) -> float:
+    """Seconds a replica is behind the primary, measured at most every PG_REPLICA_CHECK_INTERVAL; inf if unreachable."""
+    now = time.monotonic()
+    checked_at, lag = _replica_lag.get(dsn, (None, math.inf))
+    if checked_at is not None and now - checked_at < PG_REPLICA_CHECK_INTERVAL:
+        return lag
+    # Other tasks keep using the previous value while this one measures
+    _replica_lag[dsn] = (now, lag)
+
+    try:
+        pool = await get_async_pool(dsn)
+        lag = float(await pool.fetchval(REPLICA_LAG_QUERY, timeout=1) or 0)
+    except Exception as e:
+        print(f"Error checking replica lag: {str(e)}")
+        lag = math.inf
+    _replica_lag[dsn] = (time.monotonic(), lag)
+    return lag
+
+
+async def get_read_pool():
+    """The pool of a replica within PG_REPLICA_MAX_LAG of the primary, taking turns, or the primary's if none is."""
+    lags = await asyncio.gather(*(replica_lag_async(dsn) for dsn in PG_REPLICA_DSNS))
+    fresh = [dsn for dsn, lag in zip(PG_REPLICA_DSNS, lags) if lag <= PG_REPLICA_MAX_LAG]
+    if not fresh:
+        inc("db_read_routing_total", backend="postgres_async", target="primary")
+        return await get_async_pool()
+    inc("db_read_routing_total", backend="postgres_async", target="replica")
+    return await get_async_pool(fresh[next(_replica_turn) % len(fresh)])
+
+
+async def close_async_pool():
+    """Close the pools, e.g. on server shutdown."""
+    for dsn in list(_pools):
+        await _pools.pop(dsn).close()
+    _pool_locks.clear()
+
+
+async def run_sql_query_async(query: str, params=None, timeout: float = None):
+    """Run a SQL query on the Postgres primary without blocking the event loop and return results."""
+    statement, args = to_asyncpg(query, params)
+    timeout = PG_QUERY_TIMEOUT if timeout is None else timeout
+    pool = await get_async_pool()
+
+    async with pool.acquire() as conn:
+        inc("db_connections_in_use", backend="postgres_async")
+        start = time.perf_counter()
+        try:
+            # For INSERT/UPDATE/DELETE, return the number of affected rows
+            if statement.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+                status = await conn.execute(statement, *args, timeout=timeout)
+                rows = int(status.split()[-1])
+            else:
+                records = await conn.fetch(statement, *args, timeout=timeout)
+                rows = [tuple(record) for record in records]
+
+            # Plans are captured on the slow query log's worker thread, through psycopg2
+            record_query("postgres_async", query, params, time.perf_counter() - start, rows, explain_query)
+            return rows
+
+        finally:
+            observe("db_query_duration_seconds", time.perf_counter() - start, backend="postgres_async")
+            dec("db_connections_in_use", backend="postgres_async")
+
+
+async def run_readonly_query_async(query: str, params=None, timeout: float = 5):
+    """Run a SELECT on Postgres (a replica if one is fresh enough) read-only with a timeout, without blocking the event loop."""
+    statement, args = to_asyncpg(query, params)
+    pool = await get_read_pool()
+
+    async with pool.acquire() as conn:
+        inc("db_connections_in_use", backend="postgres_async")
+        start = time.perf_counter()
+        try:
+            async with conn.transaction(readonly=True):
+                # The server cancels the statement too, so a timed-out query stops using the database
+                await conn.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+                records = await conn.fetch(statement, *args, timeout=timeout)
+            rows = [tuple(record) for record in records]
+            record_query("postgres_async", query, params, time.perf_counter() - start, rows,
+                         partial(explain_query, readonly=True))
+            return rows
+
+        finally:
+            observe("db_query_duration_seconds", time.perf_counter() - start, backend="postgres_async")
+            dec("db_connections_in_use", backend="postgres_async")
+
+
+async def run_readonly_frame_async(query: str, params=None, timeout: float = 5, itersize: int = None) -> pd.DataFrame:
+    """Run a SELECT on Postgres read-only and return a DataFrame in the declared column types, converted batch by batch."""
+    itersize = itersize or PG_ITERSIZE
+    statement_text, args = to_asyncpg(query, params)
+    pool = await get_read_pool()
+
+    async with pool.acquire() as conn:
+        inc("db_connections_in_use", backend="postgres_async")
+        start = time.perf_counter()
+        try:
+            async with conn.transaction(readonly=True):
+                await conn.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+                statement = await conn.prepare(statement_text, timeout=timeout)
+                names = [attribute.name for attribute in statement.get_attributes()]
+                dtypes = frame_dtypes(names, [attribute.type.oid for attribute in statement.get_attributes()])
+
+                # A server-side cursor, so at most itersize records are alive at once
+                cursor = await statement.cursor(*args, timeout=timeout)
+                parts = []
+                while True:
+                    records = await cursor.fetch(itersize, timeout=timeout)
+                    if not records:
+                        break
+                    parts.append(pd.DataFrame([tuple(record) for record in records], columns=names).astype(dtypes))
+            frame = frame_from_batches(parts, names, dtypes)
+            record_query("postgres_async", query, params, time.perf_counter() - start, len(frame),
+                         partial(explain_query, readonly=True))
+            return frame
+
+        finally:
+            observe("db_query_duration_seconds", time.perf_counter() - start, backend="postgres_async")
+            dec("db_connections_in_use", backend="postgres_async")
+
+
+async def run_queries_async(statements: list, timeout: float = 5, return_exceptions: bool = False) -> list:
+    """Run several read-only (query, params) pairs concurrently, each on its own pooled connection.
+
+    With return_exceptions, a query that fails gives its exception in place of its rows.
+    """
+    return await asyncio.gather(*(
+        run_readonly_query_async(query, params, timeout=timeout) for query, params in statements
+    ), return_exceptions=return_exceptions)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Benchmark ingest, retrieval, chart rendering and end-to-end /ask latency
+offline, against the SQLite backend, an in-memory Qdrant and the stub LLM.
+
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --sizes 10k,1m --output before.json
+    python benchmark.py --sizes 10k,1m --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+# Question mix used for retrieval and /ask load, covering every route branch
+QUESTIONS = [
+    "What are the groundwater levels in downtown?",
+    "Which district has the best water quality?",
+    "Is there contamination in the industrial area?",
+    "What is the pH in the residential zone?",
+    "Show me a trend chart of water levels",
+    "Average TDS by location",
+    "Which wells have the highest water levels?",
+    "Show the well locations on a map",
+]
+
+
+def parse_size(text: str) -> int:
+    """Parse sizes such as 10k or 1m."""
+    text = text.strip().lower()
+    if text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def percentiles(samples: list) -> dict:
+    """Summarize latency samples (seconds) in milliseconds."""
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def bench_ingest(rows: int, insert_limit: int, chunk_rows: int, seed: int) -> dict:
+    """Clean every generated chunk; insert up to insert_limit cleaned rows."""
+    from simple_setup import generate_measurement_chunks
+    from tools_sqlite import clean_groundwater_data, insert_groundwater_data
+
+    # Ten years of monthly readings per well
+    wells = max(1, -(-rows // 120))
+
+    clean_seconds = 0.0
+    cleaned_rows = 0
+    insert_seconds = 0.0
+    inserted_rows = 0
+    insert_errors = 0
+
+    for chunk in generate_measurement_chunks(wells, 10, chunk_rows=chunk_rows, seed=seed, max_rows=rows):
+        start = time.perf_counter()
+        cleaned = clean_groundwater_data(chunk)
+        clean_seconds += time.perf_counter() - start
+        cleaned_rows += len(cleaned)
+
+        remaining = insert_limit - inserted_rows - insert_errors
+        if remaining > 0:
+            start = time.perf_counter()
+            new, updated, skipped, errors = insert_groundwater_data(cleaned.head(remaining))
+            inserted = new + updated
+            insert_seconds += time.perf_counter() - start
+            inserted_rows += inserted
+            insert_errors += errors
+
+    return {
+        "clean": {
+            "rows": cleaned_rows,
+            "seconds": round(clean_seconds, 3),
+            "rows_per_sec": round(cleaned_rows / clean_seconds, 1) if clean_seconds else None,
+        },
+        "insert": {
+            "rows": inserted_rows,
+            "errors": insert_errors,
+            "seconds": round(insert_seconds, 3),
+            "rows_per_sec": round(inserted_rows / insert_seconds, 1) if insert_seconds else None,
+        },
+    }
+
+
+def index_search_corpus(documents: int, seed: int):
+    """Add synthetic passages to the FTS5 index and the in-memory Qdrant collection."""
+    import sqlite3
+    import qdrant_utils
+    import sqlite_utils
+    from qdrant_client.models import PointStruct
+    from simple_setup import SYNTHETIC_LOCATIONS
+
+    rng = np.random.default_rng(seed)
+    texts = [
+        f"{SYNTHETIC_LOCATIONS[i % len(SYNTHETIC_LOCATIONS)]} well W{i:05d} reads "
+        f"{rng.uniform(5, 25):.1f} meters with pH {rng.uniform(6.5, 8):.1f} and TDS {rng.uniform(300, 700):.0f} mg/L"
+        for i in range(documents)
+    ]
+
+    conn = sqlite3.connect(sqlite_utils.DB_FILE)
+    conn.executemany(
+        "INSERT INTO documents (text, metadata) VALUES (?, ?)",
+        [(text, '{"source": "benchmark"}') for text in texts]
+    )
+    conn.execute("INSERT INTO documents_fts(documents_fts) VALUES('rebuild')")
+    conn.commit()
+    conn.close()
+
+    for start in range(0, documents, 1000):
+        batch = texts[start:start + 1000]
+        vectors = qdrant_utils.embed_texts(batch)
+        qdrant_utils.client.upsert(
+            collection_name=qdrant_utils.COLLECTION_NAME,
+            points=[
+                PointStruct(id=1000 + start + i, vector=vector.tolist(), payload={"text": text})
+                for i, (text, vector) in enumerate(zip(batch, vectors))
+            ]
+        )
+
+
+def bench_retrieval(queries: int) -> dict:
+    """Latency of single-question keyword and semantic search."""
+    from qdrant_utils import semantic_search
+    from sqlite_utils import bm25_search
+
+    results = {}
+    for name, search in (("bm25_search", bm25_search), ("semantic_search", semantic_search)):
+        search(QUESTIONS[0])  # warm up
+        samples = []
+        for i in range(queries):
+            start = time.perf_counter()
+            search(QUESTIONS[i % len(QUESTIONS)])
+            samples.append(time.perf_counter() - start)
+        results[name] = percentiles(samples)
+    return results
+
+
+def bench_chart(renders: int) -> dict:
+    """Render time of the monthly trend chart over the inserted readings."""
+    from tools_sqlite import generate_chart
+
+    query = (
+        "SELECT strftime('%Y-%m', measurement_date) AS label, AVG(water_level_meters) AS value "
+        "FROM groundwater_data GROUP BY label ORDER BY label LIMIT 500"
+    )
+    samples = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        generate_chart(query, xlabel="Month", ylabel="Water level (m)")
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api_server(app):
+    """Serve app with uvicorn on a background thread; returns (server, thread)."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=free_port(), log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def bench_ask(requests_total: int, concurrency: int) -> dict:
+    """Concurrent end-to-end /ask requests against a real uvicorn server."""
+    import requests
+    from server_sqlite import app
+
+    server, thread = start_api_server(app)
+    url = f"http://127.0.0.1:{server.config.port}/ask"
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def ask(i):
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json={"question": QUESTIONS[i % len(QUESTIONS)]}, timeout=60)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(ask, range(requests_total)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    result = percentiles([latency for latency, _ in outcomes])
+    result.update({
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "requests_per_sec": round(len(outcomes) / elapsed, 1),
+    })
+    return result
+
+
+def start_standins(prefix: str = "ingres-bench-", token_delay: float = 0.0):
+    """Switch to a scratch directory wired to an in-memory Qdrant and the stub LLM.
+
+    Must run before any pipeline module is imported. Returns (workdir, stub server).
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    Path("static").mkdir()
+
+    os.environ["QDRANT_URL"] = ":memory:"
+    os.environ["GENERATION_CACHE_PATH"] = os.path.join(workdir, "generation_cache.db")
+    sys.path.insert(0, str(REPO_DIR))
+
+    import llm_utils
+    import qdrant_utils
+    from llm_stub_server import start_stub_server
+
+    qdrant_utils.initialize_qdrant()
+    stub = start_stub_server(token_delay=token_delay)
+    llm_utils.OLLAMA_HOST = f"http://127.0.0.1:{stub.server_port}"
+    return workdir, stub
+
+
+def stop_standins(workdir: str, stub):
+    """Stop the stub LLM and remove the scratch directory."""
+    stub.shutdown()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(args) -> dict:
+    """Run every benchmark in a scratch directory and collect the results."""
+    workdir, stub = start_standins()
+    import simple_setup
+
+    results = {"ingest": {}}
+    try:
+        for size in args.sizes:
+            print(f"⏱️  Ingest: {size:,} rows")
+            simple_setup.create_sqlite_database().close()
+            results["ingest"][str(size)] = bench_ingest(size, args.insert_limit, args.chunk_rows, args.seed)
+
+        print(f"⏱️  Retrieval: {args.queries} queries over {args.documents:,} passages")
+        index_search_corpus(args.documents, args.seed)
+        results["retrieval"] = bench_retrieval(args.queries)
+
+        print(f"⏱️  Charts: {args.renders} renders")
+        results["generate_chart"] = bench_chart(args.renders)
+
+        print(f"⏱️  /ask: {args.requests} requests, concurrency {args.concurrency}")
+        results["ask"] = bench_ask(args.requests, args.concurrency)
+    finally:
+        stop_standins(workdir, stub)
+
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Flatten nested results into {'a.b.c': number} for comparison."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous: dict, current: dict):
+    """Print the change of every shared metric between two result files."""
+    before = flatten(previous["results"])
+    after = flatten(current["results"])
+    print(f"\n📊 {previous.get('commit', '?')} → {current.get('commit', '?')}")
+    for name in sorted(set(before) & set(after)):
+        # Only latencies and throughputs; counts just echo the configuration
+        if not name.endswith(("_ms", "_per_sec")):
+            continue
+        if before[name]:
+            change = (after[name] - before[name]) / before[name] * 100
+            print(f"   {name}: {before[name]} → {after[name]} ({change:+.1f}%)")
+
+
+def main():
+    """Run the benchmark suite and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Benchmark the groundwater chatbot offline")
+    parser.add_argument("--sizes", default="10k,1m,10m", help="comma-separated dataset sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--insert-limit", type=int, default=50_000, help="max rows inserted per dataset size")
+    parser.add_argument("--chunk-rows", type=int, default=250_000, help="rows generated and cleaned per chunk")
+    parser.add_argument("--documents", type=int, default=10_000, help="search passages to index")
+    parser.add_argument("--queries", type=int, default=200, help="queries per retriever")
+    parser.add_argument("--renders", type=int, default=5, help="chart renders")
+    parser.add_argument("--requests", type=int, default=200, help="/ask requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /ask clients")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    args.sizes = [parse_size(size) for size in args.sizes.split(",")]
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    print("🏁 Running benchmarks")
+    print("=" * 50)
+    started = time.time()
+    results = run_benchmarks(args)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "duration_seconds": round(time.time() - started, 1),
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+    if previous:
+        compare(previous, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Streaming export of groundwater_data selections as CSV or Parquet.
+
+Rows come from a database cursor in batches (a named server-side cursor on
+Postgres, a stepped statement on SQLite) and each batch is encoded,
+optionally compressed and sent before the next one is fetched, so memory use
+does not grow with the size of the selection.
+"""
+
+import csv
+import io
+import zlib
+from datetime import date
+from typing import Callable, Iterator, List, Optional
+
+from fastapi import Query
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from metrics import inc
+from upload_readers import INSERT_COLUMNS
+
+# Columns exported, in order
+EXPORT_COLUMNS = INSERT_COLUMNS + ['source_id']
+
+# Rows fetched, encoded and sent at a time; one Parquet row group per batch
+EXPORT_BATCH_ROWS = 10000
+
+# Most wells one export can name explicitly
+MAX_EXPORT_WELLS = 1000
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Compression: (file extension, media type)
+EXPORT_COMPRESSIONS = {
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+
+def export_query(backend: str, well_ids: List[str] = None, region: str = None, start_date: date = None,
+                 end_date: date = None, bbox: List[float] = None) -> tuple:
+    """The SELECT and parameters for an export; backend is 'postgres' or 'sqlite'."""
+    placeholder = '%s' if backend == 'postgres' else '?'
+    conditions = []
+    params = []
+
+    if well_ids:
+        conditions.append(f"well_id IN ({', '.join([placeholder] * len(well_ids))})")
+        params.extend(well_ids)
+    if region:
+        conditions.append(f"LOWER(location_name) LIKE {placeholder}")
+        params.append(f"%{region.lower()}%")
+    if start_date:
+        conditions.append(f"measurement_date >= {placeholder}")
+        params.append(start_date.isoformat())
+    if end_date:
+        conditions.append(f"measurement_date <= {placeholder}")
+        params.append(end_date.isoformat())
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if backend == 'postgres':
+            # && on the envelope uses the GiST index on geom
+            conditions.append(f"geom && ST_MakeEnvelope({', '.join([placeholder] * 4)}, 4326)")
+            params.extend([min_lon, min_lat, max_lon, max_lat])
+        else:
+            conditions.append(f"longitude BETWEEN {placeholder} AND {placeholder} "
+                              f"AND latitude BETWEEN {placeholder} AND {placeholder}")
+            params.extend([min_lon, max_lon, min_lat, max_lat])
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Ordered by the primary key, which both databases can stream without a sort
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM groundwater_data{where} ORDER BY id"
+    return query, params
+
+
+def parse_bbox(text: str) -> List[float]:
+    """Parse 'min_lon,min_lat,max_lon,max_lat'."""
+    values = [float(value) for value in text.split(',')]
+    if len(values) != 4:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = values
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed its maximums")
+    return values
+
+
+def csv_chunks(batches: Iterator[list]) -> Iterator[bytes]:
+    """Encode row batches as CSV, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.pieces = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def parquet_chunks(batches: Iterator[list]) -> Iterator[bytes]:
+    """Encode row batches as a Parquet file, one row group per batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('well_id', pa.string()),
+        ('location_name', pa.string()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('depth_meters', pa.float64()),
+        ('water_level_meters', pa.float64()),
+        ('measurement_date', pa.date32()),
+        ('quality_ph', pa.float64()),
+        ('quality_tds', pa.float64()),
+        ('source_id', pa.string()),
+    ])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in batches:
+            # Let Arrow infer each column (ISO strings from SQLite, date/Decimal from Postgres), then cast
+            columns = zip(*rows)
+            arrays = [pa.array(values).cast(field.type) for values, field in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=len(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def zstd_compressor():
+    """A streaming zstd compressor: the standard library's from Python 3.14, else the zstandard package."""
+    try:
+        from compression import zstd
+        return zstd.ZstdCompressor()
+    except ImportError:
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+
+
+def compressed(chunks: Iterator[bytes], compression: Optional[str]) -> Iterator[bytes]:
+    """Compress encoded chunks on the fly."""
+    if compression is None:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(wbits=31) if compression == 'gzip' else zstd_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(iter_query: Callable, query: str, params: list, export_format: str,
+                  compression: Optional[str]) -> Iterator[bytes]:
+    """Fetch, encode and compress an export batch by batch."""
+    exported = [0]
+
+    def batches():
+        for rows in iter_query(query, params, EXPORT_BATCH_ROWS):
+            exported[0] += len(rows)
+            yield rows
+
+    encode = csv_chunks if export_format == 'csv' else parquet_chunks
+    try:
+        yield from compressed(encode(batches()), compression)
+    except Exception as e:
+        # Headers are already sent; abort the response so the client sees a failed download
+        print(f"Error exporting data: {str(e)}")
+        raise
+    finally:
+        inc("export_rows_total", exported[0], format=export_format)
+
+
+def error(message: str, status_code: int = 400) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def install_data_export(app, iter_query: Callable, backend: str):
+    """Serve GET /export, reading rows with iter_query(query, params, itersize) from a 'postgres' or 'sqlite' backend."""
+
+    @app.get("/export")
+    def export_data(
+        format: str = "csv",
+        compression: Optional[str] = None,
+        well_id: List[str] = Query(default=[]),
+        region: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        bbox: Optional[str] = None,
+    ):
+        if format not in EXPORT_MEDIA_TYPES:
+            return error(f"format must be one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+        if compression is not None and compression not in EXPORT_COMPRESSIONS:
+            return error(f"compression must be one of: {', '.join(EXPORT_COMPRESSIONS)}")
+        if compression == 'zstd':
+            try:
+                zstd_compressor()
+            except ImportError:
+                return error("zstd compression needs Python 3.14 or the zstandard package")
+        if len(well_id) > MAX_EXPORT_WELLS:
+            return error(f"At most {MAX_EXPORT_WELLS} well_id values per export")
+        if start_date and end_date and start_date > end_date:
+            return error("start_date must not be after end_date")
+        try:
+            bounds = parse_bbox(bbox) if bbox else None
+        except ValueError as e:
+            return error(str(e))
+
+        query, params = export_query(backend, well_id, region, start_date, end_date, bounds)
+        filename = f"groundwater_export.{format}"
+        media_type = EXPORT_MEDIA_TYPES[format]
+        if compression:
+            extension, media_type = EXPORT_COMPRESSIONS[compression]
+            filename += extension
+
+        return StreamingResponse(
+            export_stream(iter_query, query, params, format, compression),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
@@ -0,0 +1,284 @@
+"""
+Precomputed fact passages for common aggregate questions.
+
+After each ingest, the wells it touched and their locations get summary
+passages ("North District: average water level 15.20 m across 12 wells ...")
+regenerated from current data. The passages are written to the FTS5 index in
+sqlite_utils and to the Qdrant collection, so hybrid search answers aggregate
+questions from up-to-date numbers at lookup cost. Replaced passages are dropped
+from both indexes, and cached answers generated from them are invalidated.
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+from qdrant_client.models import PointIdsList, PointStruct
+
+import qdrant_utils
+import sqlite_utils
+from generation_cache import invalidate_passages
+from tracing import span, record_error
+from well_analytics import PH_MAX, PH_MIN, TDS_LIMIT, WELL_ANSWER_LIMIT, get_well_stats
+
+# Qdrant point ids are derived from fact keys, so a regenerated fact replaces its point
+FACT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "groundwater-facts")
+
+# Passages indexed into Qdrant per upsert request
+FACTS_QDRANT_BATCH = 256
+
+OVERVIEW_KEY = "overview"
+
+# One refresh at a time, so concurrent uploads do not write the same fact twice
+_refresh_lock = threading.Lock()
+
+
+def ensure_facts_table(conn: sqlite3.Connection):
+    """The fact key -> documents row mapping, next to the FTS5 index it points into."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facts (
+            fact_key TEXT PRIMARY KEY,
+            doc_id INTEGER NOT NULL,
+            location_name TEXT,
+            text TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def point_id(fact_key: str) -> str:
+    return str(uuid.uuid5(FACT_NAMESPACE, fact_key))
+
+
+def number(value, digits: int = 2) -> Optional[str]:
+    """A value formatted for a passage, or None when it is missing."""
+    if value is None or pd.isna(value):
+        return None
+    return f"{float(value):,.{digits}f}"
+
+
+def date_range(first, last) -> str:
+    first, last = pd.to_datetime(first, errors="coerce"), pd.to_datetime(last, errors="coerce")
+    if pd.isna(first) or pd.isna(last):
+        return ""
+    return f" ({first:%Y-%m-%d} to {last:%Y-%m-%d})"
+
+
+def listed(well_ids: List[str]) -> str:
+    shown = ", ".join(well_ids[:WELL_ANSWER_LIMIT])
+    return shown + (f" and {len(well_ids) - WELL_ANSWER_LIMIT} more" if len(well_ids) > WELL_ANSWER_LIMIT else "")
+
+
+def well_passage(well_id: str, row: pd.Series) -> str:
+    """Summary passage for one well from its well_analytics statistics."""
+    location = f" in {row['location_name']}" if isinstance(row["location_name"], str) and row["location_name"] else ""
+    sentences = []
+    level = number(row["mean_level_m"])
+    if level:
+        trend = row["trend_m_per_year"]
+        if pd.isna(trend):
+            direction = "no measurable trend yet"
+        else:
+            direction = f"{'falling' if trend < 0 else 'rising'} {abs(trend):.2f} m per year"
+        sentences.append(f"Well {well_id}{location}: average water level {level} m over {int(row['readings'])} readings"
+                         f"{date_range(row['first_date'], row['last_date'])}, {direction}.")
+    else:
+        sentences.append(f"Well {well_id}{location}: {int(row['readings'])} readings"
+                         f"{date_range(row['first_date'], row['last_date'])}, no water level measured.")
+    if row["tds_breaches"] > 0:
+        sentences.append(f"TDS above {TDS_LIMIT:g} mg/L in {int(row['tds_breaches'])} of {int(row['readings'])} readings "
+                         f"(max {number(row['max_tds'], 0)} mg/L).")
+    if row["ph_breaches"] > 0:
+        sentences.append(f"pH outside {PH_MIN:g}-{PH_MAX:g} in {int(row['ph_breaches'])} readings.")
+    latest = [f"TDS {number(row['latest_tds'], 0)} mg/L" if number(row["latest_tds"]) else None,
+              f"pH {number(row['latest_ph'])}" if number(row["latest_ph"]) else None]
+    latest = [part for part in latest if part]
+    if latest:
+        sentences.append(f"Latest {' and '.join(latest)}.")
+    return " ".join(sentences)
+
+
+def location_passage(row: pd.Series, stats: pd.DataFrame) -> str:
+    """Summary passage for one location from its aggregate row and its wells' statistics."""
+    name = row["location_name"]
+    wells = stats[stats["location_name"] == name]
+    sentences = [f"{name} groundwater summary: average water level {number(row['mean_level']) or 'not measured'} m "
+                 f"across {int(row['wells'])} wells and {int(row['readings'])} readings"
+                 f"{date_range(row['first_date'], row['last_date'])}"
+                 + (f", ranging from {number(row['min_level'])} to {number(row['max_level'])} m." if number(row["min_level"]) else ".")]
+    quality = []
+    if number(row["mean_tds"]):
+        quality.append(f"Average TDS {number(row['mean_tds'], 0)} mg/L")
+    if number(row["mean_ph"]):
+        quality.append(f"average pH {number(row['mean_ph'])}")
+    if quality:
+        sentences.append(", ".join(quality) + ".")
+    breaching = list(wells.index[wells["tds_breaches"] > 0])
+    sentences.append(f"{len(breaching)} of {int(row['wells'])} wells have readings with TDS above {TDS_LIMIT:g} mg/L"
+                     + (f": {listed(breaching)}." if breaching else "."))
+    trends = wells["trend_m_per_year"].dropna()
+    if len(trends):
+        # Which wells are declining is in their own passages; this one stays short enough to rank well
+        sentences.append(f"Water levels falling in {int((trends < 0).sum())} of {len(trends)} wells "
+                         f"(median {trends.median():+.2f} m per year).")
+    return " ".join(sentences)
+
+
+def overview_passage(stats: pd.DataFrame) -> str:
+    """Network-wide passage: how many wells and readings, and which wells breach the limits."""
+    locations = stats["location_name"].dropna().nunique()
+    latest = pd.to_datetime(stats["last_date"]).max()
+    sentences = [f"Groundwater monitoring overview: {len(stats)} wells at {locations} locations with "
+                 f"{int(stats['readings'].sum()):,} readings" + (f" up to {latest:%Y-%m-%d}." if pd.notna(latest) else ".")]
+    for column, label in (("tds_breaches", f"TDS above {TDS_LIMIT:g} mg/L"), ("ph_breaches", f"pH outside {PH_MIN:g}-{PH_MAX:g}")):
+        selected = stats[stats[column] > 0].sort_values(column, ascending=False)
+        sentences.append(f"Wells with {label}: {len(selected)}" + (f" ({listed(list(selected.index))})." if len(selected) else "."))
+    return " ".join(sentences)
+
+
+def location_aggregates(dialect: str, run_query: Callable, locations: Optional[List[str]]) -> pd.DataFrame:
+    """Per-location aggregates over groundwater_data, for some locations or (None) all of them."""
+    placeholder = "%s" if dialect == "postgres" else "?"
+    columns = ["location_name", "wells", "readings", "mean_level", "min_level", "max_level",
+               "mean_tds", "mean_ph", "first_date", "last_date"]
+    where, params = "WHERE location_name IS NOT NULL", None
+    if locations is not None:
+        if not locations:
+            return pd.DataFrame(columns=columns)
+        where += f" AND location_name IN ({', '.join([placeholder] * len(locations))})"
+        params = tuple(locations)
+    query = f'''
+        SELECT location_name, COUNT(DISTINCT well_id), COUNT(*),
+               AVG(CASE WHEN water_level_meters > 0 THEN water_level_meters END),
+               MIN(CASE WHEN water_level_meters > 0 THEN water_level_meters END),
+               MAX(CASE WHEN water_level_meters > 0 THEN water_level_meters END),
+               AVG(quality_tds), AVG(quality_ph), MIN(measurement_date), MAX(measurement_date)
+        FROM groundwater_data {where}
+        GROUP BY location_name
+    '''
+    return pd.DataFrame(run_query(query, params), columns=columns)
+
+
+def write_facts(passages: Dict[str, tuple], removed: Iterable[str]) -> int:
+    """Upsert (location_name, text) passages by fact key into FTS5 and Qdrant and drop removed keys.
+
+    Returns the number of passages written or removed.
+    """
+    conn = sqlite3.connect(sqlite_utils.DB_FILE)
+    try:
+        ensure_facts_table(conn)
+        keys = list(passages) + [key for key in removed if key not in passages]
+        existing = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            existing.update((key, (doc_id, text)) for key, doc_id, text in conn.execute(
+                f"SELECT fact_key, doc_id, text FROM facts WHERE fact_key IN ({', '.join('?' * len(batch))})", batch
+            ))
+
+        changed, dropped, replaced = {}, [], []
+        for key in keys:
+            old = existing.get(key)
+            if key in passages:
+                location_name, text = passages[key]
+                if old and old[1] == text:
+                    continue
+                metadata = json.dumps({"source": "facts", "fact": key})
+                if old:
+                    # External-content FTS5: remove the old terms before the row changes
+                    conn.execute("INSERT INTO documents_fts(documents_fts, rowid, text, metadata) "
+                                 "SELECT 'delete', id, text, metadata FROM documents WHERE id = ?", (old[0],))
+                    conn.execute("UPDATE documents SET text = ?, metadata = ? WHERE id = ?", (text, metadata, old[0]))
+                    doc_id = old[0]
+                    replaced.append(old[1])
+                else:
+                    doc_id = conn.execute("INSERT INTO documents (text, metadata) VALUES (?, ?)", (text, metadata)).lastrowid
+                conn.execute("INSERT INTO documents_fts(rowid, text, metadata) VALUES (?, ?, ?)", (doc_id, text, metadata))
+                conn.execute('''
+                    INSERT INTO facts (fact_key, doc_id, location_name, text) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(fact_key) DO UPDATE SET location_name = excluded.location_name,
+                        text = excluded.text, updated_at = CURRENT_TIMESTAMP
+                ''', (key, doc_id, location_name, text))
+                changed[key] = text
+            elif old:
+                conn.execute("INSERT INTO documents_fts(documents_fts, rowid, text, metadata) "
+                             "SELECT 'delete', id, text, metadata FROM documents WHERE id = ?", (old[0],))
+                conn.execute("DELETE FROM documents WHERE id = ?", (old[0],))
+                conn.execute("DELETE FROM facts WHERE fact_key = ?", (key,))
+                dropped.append(key)
+                replaced.append(old[1])
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    # The vector store follows the keyword index; a failure here leaves keyword search current
+    try:
+        items = list(changed.items())
+        for start in range(0, len(items), FACTS_QDRANT_BATCH):
+            batch = items[start:start + FACTS_QDRANT_BATCH]
+            vectors = qdrant_utils.embed_texts([text for _, text in batch])
+            qdrant_utils.client.upsert(collection_name=qdrant_utils.COLLECTION_NAME, points=[
+                PointStruct(id=point_id(key), vector=vector.tolist(),
+                            payload={"text": text, "metadata": {"source": "facts", "fact": key}})
+                for (key, text), vector in zip(batch, vectors)
+            ])
+        if dropped:
+            qdrant_utils.client.delete(collection_name=qdrant_utils.COLLECTION_NAME,
+                                       points_selector=PointIdsList(points=[point_id(key) for key in dropped]))
+    except Exception as e:
+        print(f"Error indexing facts in Qdrant: {str(e)}")
+        record_error(e)
+
+    # Answers generated from the old numbers must not be served again
+    invalidate_passages(replaced)
+    return len(changed) + len(dropped)
+
+
+def refresh_facts(dialect: str, run_query: Callable, well_ids: Optional[Iterable] = None) -> int:
+    """Regenerate the facts for some wells and their locations, or (None) all facts.
+
+    Returns the number of passages written or removed (0 on failure).
+    """
+    with _refresh_lock, span("refresh_facts", backend=dialect) as stage:
+        try:
+            stats = get_well_stats(dialect, run_query)
+            conn = sqlite3.connect(sqlite_utils.DB_FILE)
+            try:
+                ensure_facts_table(conn)
+                stored = conn.execute("SELECT fact_key, location_name FROM facts").fetchall()
+            finally:
+                conn.close()
+
+            if well_ids is None:
+                wells = list(stats.index)
+                locations = None
+                removed = [key for key, _ in stored]
+            else:
+                wells = sorted({str(well_id) for well_id in well_ids})
+                well_keys = {f"well:{well_id}" for well_id in wells}
+                # Locations the wells are in now, and were in before this ingest
+                locations = {location for key, location in stored if key in well_keys and location}
+                locations.update(stats.loc[stats.index.intersection(wells), "location_name"].dropna())
+                locations = sorted(locations)
+                removed = list(well_keys) + [f"location:{location}" for location in locations]
+
+            passages = {}
+            for well_id in stats.index.intersection(wells):
+                row = stats.loc[well_id]
+                passages[f"well:{well_id}"] = (row["location_name"] if isinstance(row["location_name"], str) else None,
+                                               well_passage(well_id, row))
+            for _, row in location_aggregates(dialect, run_query, locations).iterrows():
+                passages[f"location:{row['location_name']}"] = (row["location_name"], location_passage(row, stats))
+            if len(stats):
+                passages[OVERVIEW_KEY] = (None, overview_passage(stats))
+
+            written = write_facts(passages, removed)
+            stage.set(passages=len(passages), written=written)
+            return written
+        except Exception as e:
+            print(f"Error refreshing facts: {str(e)}")
+            record_error(e)
+            return 0
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import List, Optional
+
+import llm_utils
+from metrics import inc
+
+# SQLite file holding generated answers, so the cache survives restarts
+CACHE_DB_FILE = os.getenv("GENERATION_CACHE_PATH", "generation_cache.db")
+
+# Upper bound on cached answers; least recently used entries are evicted first
+MAX_CACHE_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "5000"))
+
+# Passage ids bound per invalidation statement, well under SQLite's variable limit
+INVALIDATE_BATCH_SIZE = 500
+
+
+def initialize_generation_cache():
+    """Create the generation cache tables."""
+    try:
+        conn = sqlite3.connect(CACHE_DB_FILE)
+        cursor = conn.cursor()
+
+        # WAL lets concurrent workers read while one writes
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generations (
+                cache_key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        ''')
+
+        # Which passages each answer was generated from, for invalidation
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_passages (
+                cache_key TEXT NOT NULL,
+                passage_id TEXT NOT NULL,
+                PRIMARY KEY (cache_key, passage_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_generation_passages_passage
+            ON generation_passages (passage_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_generations_last_used
+            ON generations (last_used_at)
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    except Exception as e:
+        print(f"Error initializing generation cache: {str(e)}")
+
+
+def passage_id(passage: str) -> str:
+    """Identify a passage by a hash of its content."""
+    return hashlib.sha256(passage.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question: str, passages: List[str]) -> str:
+    """Hash the question, the ordered passage ids and the model parameters."""
+    key_material = {
+        "question": " ".join(question.lower().split()),
+        "passages": [passage_id(passage) for passage in passages],
+        "model": llm_utils.OLLAMA_MODEL,
+        "options": llm_utils.GENERATION_OPTIONS,
+        "preamble": llm_utils.PROMPT_PREAMBLE,
+    }
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_cached_answer(key: str) -> Optional[str]:
+    """Return the cached answer for a key, or None on a miss."""
+    try:
+        conn = sqlite3.connect(CACHE_DB_FILE)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT answer FROM generations WHERE cache_key = ?", (key,))
+            row = cursor.fetchone()
+
+            if row is None:
+                inc("generation_cache_requests_total", result="miss")
+                return None
+
+            cursor.execute(
+                "UPDATE generations SET last_used_at = ? WHERE cache_key = ?",
+                (time.time(), key)
+            )
+            conn.commit()
+            inc("generation_cache_requests_total", result="hit")
+            return row[0]
+
+        finally:
+            conn.close()
+
+    except Exception as e:
+        print(f"Error reading generation cache: {str(e)}")
+        return None
+
+
+def store_answer(key: str, passages: List[str], answer: str):
+    """Cache a generated answer and evict the least recently used overflow."""
+    try:
+        conn = sqlite3.connect(CACHE_DB_FILE)
+        try:
+            cursor = conn.cursor()
+            now = time.time()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO generations (cache_key, answer, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, answer, now, now))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO generation_passages (cache_key, passage_id)
+                VALUES (?, ?)
+            ''', [(key, passage_id(passage)) for passage in passages])
+
+            # Size-bounded eviction
+            cursor.execute("SELECT COUNT(*) FROM generations")
+            overflow = cursor.fetchone()[0] - MAX_CACHE_ENTRIES
+            if overflow > 0:
+                cursor.execute('''
+                    DELETE FROM generations WHERE cache_key IN (
+                        SELECT cache_key FROM generations ORDER BY last_used_at LIMIT ?
+                    )
+                ''', (overflow,))
+                cursor.execute('''
+                    DELETE FROM generation_passages
+                    WHERE cache_key NOT IN (SELECT cache_key FROM generations)
+                ''')
+
+            conn.commit()
+
+        finally:
+            conn.close()
+
+    except Exception as e:
+        print(f"Error writing generation cache: {str(e)}")
+
+
+def invalidate_passages(passages: List[str]) -> int:
+    """Drop every cached answer generated from any of the given passages."""
+    if not passages:
+        return 0
+
+    try:
+        conn = sqlite3.connect(CACHE_DB_FILE)
+        try:
+            cursor = conn.cursor()
+            ids = [passage_id(passage) for passage in passages]
+
+            # A large upload touches thousands of passages; bind them in batches
+            removed = 0
+            for start in range(0, len(ids), INVALIDATE_BATCH_SIZE):
+                batch = ids[start:start + INVALIDATE_BATCH_SIZE]
+                placeholders = ", ".join("?" for _ in batch)
+                cursor.execute(f'''
+                    DELETE FROM generations WHERE cache_key IN (
+                        SELECT cache_key FROM generation_passages WHERE passage_id IN ({placeholders})
+                    )
+                ''', batch)
+                removed += cursor.rowcount
+            cursor.execute('''
+                DELETE FROM generation_passages
+                WHERE cache_key NOT IN (SELECT cache_key FROM generations)
+            ''')
+
+            conn.commit()
+            return removed
+
+        finally:
+            conn.close()
+
+    except Exception as e:
+        print(f"Error invalidating generation cache: {str(e)}")
+        return 0
+
+
+# Initialize the cache on import
+initialize_generation_cache()
@@ -0,0 +1,176 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+# Each probe must answer within this many seconds
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "1.0"))
+
+# Readiness is re-probed at most this often; load balancer checks in between get the cached result
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+
+# Probes run here so a hung backend cannot block the request that asked
+_probe_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="health-probe")
+
+# Probe function -> its running future; a probe still running from an earlier check
+# is reported as timed out rather than queued again behind itself
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# Qdrant client with a request timeout of PROBE_TIMEOUT, created on first probe
+_qdrant_probe_client = None
+
+
+def check_postgres():
+    """Open a connection with a PROBE_TIMEOUT connect and statement timeout and run SELECT 1."""
+    import psycopg2
+    from postgres_utils import PG_PRIMARY_DSN
+
+    # Not from the pool: a pool being created or full would wait PG_CONNECT_TIMEOUT or
+    # PG_POOL_TIMEOUT, far longer than the probe deadline (libpq's minimum is 2s)
+    conn = psycopg2.connect(
+        PG_PRIMARY_DSN,
+        connect_timeout=max(2, math.ceil(PROBE_TIMEOUT)),
+        options=f"-c statement_timeout={int(PROBE_TIMEOUT * 1000)}"
+    )
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+    finally:
+        conn.close()
+
+
+def check_sqlite():
+    """Read one measurement from the SQLite database file."""
+    from sqlite_postgres_utils import run_readonly_query
+
+    run_readonly_query("SELECT 1 FROM groundwater_data LIMIT 1", timeout=PROBE_TIMEOUT)
+
+
+def check_search_index():
+    """Query the FTS5 keyword index directly, bypassing bm25_search's fallback."""
+    import sqlite3
+    from sqlite_utils import DB_FILE
+
+    if not os.path.exists(DB_FILE):
+        raise Exception(f"Search index {DB_FILE} not found")
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, timeout=PROBE_TIMEOUT)
+    try:
+        conn.execute("SELECT rowid FROM documents_fts LIMIT 1").fetchall()
+    finally:
+        conn.close()
+
+
+def check_qdrant():
+    """Confirm the vector store is reachable and has the document collection."""
+    global _qdrant_probe_client
+    import qdrant_utils
+
+    client = qdrant_utils.client
+    if qdrant_utils.QDRANT_URL != ":memory:":
+        # A client of its own, so a hung server fails the probe within PROBE_TIMEOUT
+        if _qdrant_probe_client is None:
+            from qdrant_client import QdrantClient
+            _qdrant_probe_client = QdrantClient(location=qdrant_utils.QDRANT_URL,
+                                                timeout=max(1, math.ceil(PROBE_TIMEOUT)))
+        client = _qdrant_probe_client
+
+    if not client.collection_exists(qdrant_utils.COLLECTION_NAME):
+        raise Exception(f"Collection {qdrant_utils.COLLECTION_NAME} not found")
+
+
+def check_chart_renderer():
+    """Render a tiny figure off-screen and confirm charts can be saved."""
+    import io
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if not os.access("static", os.W_OK):
+        raise Exception("static/ is not writable")
+    # A standalone Figure touches no pyplot state, so it cannot race render_chart
+    figure = Figure(figsize=(0.5, 0.5))
+    FigureCanvasAgg(figure)
+    figure.savefig(io.BytesIO(), format="png", dpi=10)
+
+
+def _submit(check: Callable):
+    with _in_flight_lock:
+        future = _in_flight.get(check)
+        if future is not None and not future.done():
+            return None
+        future = _in_flight[check] = _probe_executor.submit(check)
+        return future
+
+
+def run_checks(checks: Dict[str, Callable]) -> dict:
+    """Run every probe in parallel with a deadline and report each result."""
+    started = {name: time.perf_counter() for name in checks}
+    futures = {name: _submit(check) for name, check in checks.items()}
+    deadline = time.monotonic() + PROBE_TIMEOUT
+
+    results = {}
+    for name, future in futures.items():
+        if future is None:
+            results[name] = {"status": "error", "error": "previous probe still running", "latency_ms": 0.0}
+            continue
+        try:
+            future.result(timeout=max(0.0, deadline - time.monotonic()))
+            results[name] = {"status": "ok"}
+        except FutureTimeout:
+            results[name] = {"status": "error", "error": f"timed out after {PROBE_TIMEOUT}s"}
+        except Exception as e:
+            results[name] = {"status": "error", "error": str(e)}
+        results[name]["latency_ms"] = round((time.perf_counter() - started[name]) * 1000, 1)
+
+    return results
+
+
+class ReadinessCache:
+    """Probe results shared by all health requests for HEALTH_CACHE_SECONDS."""
+
+    def __init__(self, checks: Dict[str, Callable]):
+        self.checks = checks
+        self.lock = threading.Lock()
+        self.result = None
+        self.checked_at = 0.0
+
+    def get(self) -> dict:
+        if self.result is not None and time.monotonic() - self.checked_at < HEALTH_CACHE_SECONDS:
+            return self.result
+
+        # One caller refreshes; the others keep serving the previous result meanwhile
+        if not self.lock.acquire(blocking=self.result is None):
+            return self.result
+        try:
+            if self.result is None or time.monotonic() - self.checked_at >= HEALTH_CACHE_SECONDS:
+                checks = run_checks(self.checks)
+                ready = all(check["status"] == "ok" for check in checks.values())
+                self.result = {"status": "ready" if ready else "unavailable", "checks": checks}
+                self.checked_at = time.monotonic()
+            return self.result
+        finally:
+            self.lock.release()
+
+
+def install_health_checks(app, checks: Dict[str, Callable]):
+    """Serve /health/live, and /health/ready (also /health) backed by the given probes."""
+    readiness = ReadinessCache(checks)
+
+    @app.get("/health/live")
+    async def liveness():
+        # The event loop answered, which is all liveness means
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    async def readiness_check():
+        result = await run_in_threadpool(readiness.get)
+        return JSONResponse(result, status_code=200 if result["status"] == "ready" else 503)
+
+    app.add_api_route("/health", readiness_check, methods=["GET"])
+    return readiness
@@ -20,6 +20,7 @@ CREATE TABLE IF NOT EXISTS groundwater_data (
     measurement_date DATE,
     quality_ph DECIMAL(4, 2),
     quality_tds DECIMAL(8, 2),
+    source_id VARCHAR(100) NOT NULL DEFAULT '',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     geom GEOMETRY(POINT, 4326)
 );
@@ -27,6 +28,19 @@ CREATE TABLE IF NOT EXISTS groundwater_data (
 -- Create spatial index
 CREATE INDEX IF NOT EXISTS idx_groundwater_geom ON groundwater_data USING GIST (geom);
 
+-- One reading per well, date and source; uploads upsert on this key
+CREATE UNIQUE INDEX IF NOT EXISTS idx_groundwater_measurement_key ON groundwater_data (well_id, measurement_date, source_id);
+
+-- Content hashes of uploaded files, so exact re-uploads are skipped
+CREATE TABLE IF NOT EXISTS upload_files (
+    file_hash CHAR(64) NOT NULL,
+    source_id VARCHAR(100) NOT NULL DEFAULT '',
+    filename VARCHAR(255),
+    rows_stored INTEGER,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (file_hash, source_id)
+);
+
 -- Create wells table for well information
 CREATE TABLE IF NOT EXISTS wells (
     well_id VARCHAR(50) PRIMARY KEY,
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Ollama /api/generate endpoint.
+Streams a canned answer token by token so the answer stage can be
+exercised without a real model.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Serve /api/generate with newline-delimited JSON chunks over keep-alive HTTP/1.1."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        server = self.server
+        with server.lock:
+            server.requests.append(payload)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+        try:
+            tokens = server.answer.split(" ")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+
+            if payload.get("stream", True):
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i == server.fail_after:
+                        # The model dies partway through the answer
+                        self._write_chunk(json.dumps({"error": "model runner crashed"}).encode() + b"\n")
+                        self._write_chunk(b"")
+                        return
+                    time.sleep(server.token_delay)
+                    text = token if i == len(tokens) - 1 else token + " "
+                    self._write_chunk(json.dumps({"response": text, "done": False}).encode() + b"\n")
+                self._write_chunk(json.dumps({"response": "", "done": True}).encode() + b"\n")
+                self._write_chunk(b"")
+            else:
+                body = json.dumps({"response": server.answer, "done": True}).encode()
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def start_stub_server(port: int = 0, answer: str = "Stub answer from the local model.", token_delay: float = 0.0,
+                      fail_after: int = None):
+    """Start the stub server on a background thread and return it (server.server_port holds the port).
+
+    With fail_after, streamed answers stop with an error after that many tokens.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.answer = answer
+    server.token_delay = token_delay
+    server.fail_after = fail_after
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    """Run the stub server in the foreground."""
+    parser = argparse.ArgumentParser(description="Stub Ollama server for local testing")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.port, token_delay=args.token_delay)
+    print(f"🤖 Stub LLM listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
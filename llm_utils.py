@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from typing import Iterator, List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Local model endpoint (the ollama service in docker-compose.yml)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+
+# How long Ollama keeps the model (and its KV cache) loaded between requests
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Cap on in-flight generations and how long a request waits for a free slot
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+GENERATION_SLOT_TIMEOUT = float(os.getenv("LLM_SLOT_TIMEOUT", "10"))
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (2, 120)
+
+# Skip the model for a while after a connection failure instead of
+# making every request pay for the failed connect
+UNAVAILABLE_BACKOFF_SECONDS = 30
+
+# Prompt budget
+TOP_K_PASSAGES = 4
+MAX_PASSAGE_CHARS = 400
+
+GENERATION_OPTIONS = {"temperature": 0.2, "num_predict": 256}
+
+PROMPT_PREAMBLE = (
+    "You are a groundwater data assistant. Answer the question using only the "
+    "records below. If they do not contain the answer, say so. Be concise.\n\n"
+)
+
+# One keep-alive session shared by all generations
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_GENERATIONS))
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_GENERATIONS))
+
+_generation_slots = threading.BoundedSemaphore(MAX_CONCURRENT_GENERATIONS)
+_unavailable_until = 0.0
+
+
+class GenerationUnavailable(Exception):
+    """Raised when the model is down or every generation slot is busy."""
+
+
+def fuse_passages(semantic_results: List[str], keyword_results: List[str], top_k: int = TOP_K_PASSAGES) -> List[str]:
+    """Merge semantic and keyword hits with reciprocal rank fusion."""
+    scores = {}
+    for results in (semantic_results, keyword_results):
+        for rank, passage in enumerate(results):
+            scores[passage] = scores.get(passage, 0.0) + 1.0 / (60 + rank)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return ranked[:top_k]
+
+
+def build_prompt(question: str, passages: List[str]) -> str:
+    """Build a compact prompt from the question and the fused passages."""
+    records = "\n".join(
+        f"[{i}] {passage[:MAX_PASSAGE_CHARS]}" for i, passage in enumerate(passages, 1)
+    )
+    return f"{PROMPT_PREAMBLE}Records:\n{records}\n\nQuestion: {question}\nAnswer:"
+
+
+def _generate_url() -> str:
+    return f"{OLLAMA_HOST.rstrip('/')}/api/generate"
+
+
+def generate_answer_stream(question: str, passages: List[str]) -> Iterator[str]:
+    """Stream answer tokens from the local model for a question and its passages."""
+    global _unavailable_until
+
+    if time.monotonic() < _unavailable_until:
+        raise GenerationUnavailable("Model endpoint recently unreachable")
+
+    if not _generation_slots.acquire(timeout=GENERATION_SLOT_TIMEOUT):
+        raise GenerationUnavailable("All generation slots are busy")
+
+    try:
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": build_prompt(question, passages),
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": GENERATION_OPTIONS,
+        }
+
+        try:
+            response = _session.post(_generate_url(), json=payload, stream=True, timeout=REQUEST_TIMEOUT)
+        except requests.ConnectionError as e:
+            _unavailable_until = time.monotonic() + UNAVAILABLE_BACKOFF_SECONDS
+            raise GenerationUnavailable(f"Model endpoint unreachable: {str(e)}")
+
+        with response:
+            response.raise_for_status()
+
+            # Ollama streams one JSON object per line
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise GenerationUnavailable(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+    finally:
+        _generation_slots.release()
+
+
+def generate_answer(question: str, passages: List[str]) -> str:
+    """Generate a complete answer from the local model."""
+    return "".join(generate_answer_stream(question, passages)).strip()
+
+
+def warm_up_model() -> bool:
+    """Load the model and prime its KV cache with the shared prompt preamble."""
+    try:
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": PROMPT_PREAMBLE,
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"num_predict": 1},
+        }
+        response = _session.post(_generate_url(), json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        print(f"Warmed up model {OLLAMA_MODEL}")
+        return True
+
+    except Exception as e:
+        print(f"Error warming up model: {str(e)}")
+        return False
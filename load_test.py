@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Replay a question mix against /ask and /upload and report throughput, latency
+percentiles and error rates per route branch (map, chart, analytics, hybrid,
+upload).
+
+By default the API runs in-process against local stand-ins (SQLite, an
+in-memory Qdrant and the stub LLM); pass --url to drive a running server.
+
+    python load_test.py --concurrency 16 --rate 20 --duration 60
+    python load_test.py --ramp 1,2,4,8,16,32 --slo-ms 1000
+    python load_test.py --questions recorded.jsonl --url http://localhost:8000
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchmark import start_api_server, start_standins, stop_standins
+
+# Synthetic traffic: (question, weight); weights roughly follow observed usage
+QUESTION_MIX = [
+    ("What are the groundwater levels in downtown?", 6),
+    ("Is there contamination in the industrial area?", 4),
+    ("What is the water quality like in the rural zone?", 4),
+    ("Which district has the safest drinking water?", 3),
+    ("Show me a trend chart of water levels", 3),
+    ("Show the monthly pH trend for W000012", 2),
+    ("Average TDS by location", 3),
+    ("Which wells have the highest water levels?", 2),
+    ("How many measurements have TDS above 600?", 1),
+    ("Show the well locations on a map", 2),
+]
+
+
+def load_questions(path: str = None) -> list:
+    """Questions to replay: a recorded file (JSON lines or plain text) or the synthetic mix."""
+    if not path:
+        return [question for question, weight in QUESTION_MIX for _ in range(weight)]
+
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                question = record.get("question")
+                if question:
+                    questions.append(question)
+            else:
+                questions.append(line)
+    return questions
+
+
+def make_upload_file(rows: int, seed: int) -> bytes:
+    """A small synthetic CSV upload."""
+    from simple_setup import generate_measurement_chunks
+
+    wells = max(1, -(-rows // 12))
+    chunk = next(generate_measurement_chunks(wells=wells, years=1, chunk_rows=rows, seed=seed, max_rows=rows))
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, index=False)
+    return buffer.getvalue().encode()
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Throughput, latency percentiles and error rate for (latency, ok) samples."""
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(float(latencies.max()), 1),
+    }
+
+
+def run_load(base_url: str, questions: list, concurrency: int, rate: float, duration: float,
+             upload_ratio: float, upload_body: bytes, seed: int, route_question=None) -> dict:
+    """Drive the API for duration seconds and summarize the results per route branch.
+
+    Without a route_question classifier (a remote server) all questions count as one "ask" branch.
+    """
+    rng = random.Random(seed)
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    samples = {}
+    samples_lock = threading.Lock()
+    upload_ids = itertools.count()
+
+    def send(branch, question, scheduled):
+        try:
+            if branch == "upload":
+                files = {"file": ("load_test.csv", upload_body, "text/csv")}
+                # A fresh source id each time, so the rows are written rather than skipped as re-uploads
+                source = {"source_id": f"load-test-{next(upload_ids)}"}
+                response = session.post(f"{base_url}/upload", files=files, data=source, timeout=120)
+                # Upload failures come back as 200 with an error body, so check the payload
+                ok = response.status_code == 200 and "rows_processed" in response.json()
+            else:
+                response = session.post(f"{base_url}/ask", json={"question": question}, timeout=60)
+                ok = response.status_code == 200
+        except Exception:
+            ok = False
+
+        # Latency counts from the scheduled arrival, so queueing behind a slow server is not hidden
+        with samples_lock:
+            samples.setdefault(branch, []).append((time.perf_counter() - scheduled, ok))
+
+    def next_request():
+        if upload_body and rng.random() < upload_ratio:
+            return "upload", None
+        question = rng.choice(questions)
+        return (route_question(question) if route_question else "ask"), question
+
+    start = time.perf_counter()
+    deadline = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if rate > 0:
+            # Open loop: Poisson arrivals at the target rate regardless of response times
+            scheduled = start
+            while True:
+                scheduled += rng.expovariate(rate)
+                if scheduled >= deadline:
+                    break
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                branch, question = next_request()
+                executor.submit(send, branch, question, scheduled)
+        else:
+            # Closed loop: each of the concurrent users sends its next request as soon as one returns
+            def user():
+                while time.perf_counter() < deadline:
+                    branch, question = next_request()
+                    send(branch, question, time.perf_counter())
+
+            for _ in range(concurrency):
+                executor.submit(user)
+    elapsed = time.perf_counter() - start
+
+    all_samples = [sample for branch_samples in samples.values() for sample in branch_samples]
+    if not all_samples:
+        return {"concurrency": concurrency, "rate": rate, "overall": None, "branches": {}}
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        "overall": summarize(all_samples, elapsed),
+        "branches": {branch: summarize(branch_samples, elapsed) for branch, branch_samples in sorted(samples.items())},
+    }
+
+
+def print_report(result: dict):
+    """Print one run as a table."""
+    print(f"\n👥 Concurrency {result['concurrency']}" + (f", {result['rate']} req/s" if result["rate"] else ", closed loop"))
+    print(f"   {'branch':<10} {'reqs':>6} {'err%':>6} {'rps':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    rows = list(result["branches"].items())
+    if result["overall"]:
+        rows.append(("overall", result["overall"]))
+    for branch, stats in rows:
+        print(
+            f"   {branch:<10} {stats['requests']:>6} {stats['error_rate'] * 100:>5.1f}% {stats['throughput_rps']:>8.1f} "
+            f"{stats['p50_ms']:>7.0f}ms {stats['p90_ms']:>6.0f}ms {stats['p99_ms']:>6.0f}ms {stats['max_ms']:>6.0f}ms"
+        )
+
+
+def main():
+    """Run the load test and optionally write the results as JSON."""
+    parser = argparse.ArgumentParser(description="Replay question traffic against the API")
+    parser.add_argument("--url", help="base URL of a running server (default: in-process server with stand-ins)")
+    parser.add_argument("--server", default="server_sqlite", help="server module for the in-process run")
+    parser.add_argument("--questions", help="recorded questions: JSON lines with a 'question' field, or plain text")
+    parser.add_argument("--concurrency", type=int, default=8, help="max in-flight requests (users in closed loop)")
+    parser.add_argument("--ramp", help="comma-separated concurrency levels to step through, e.g. 1,2,4,8,16")
+    parser.add_argument("--rate", type=float, default=0.0, help="arrivals per second (0 = closed loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per run")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 latency target for --ramp")
+    parser.add_argument("--upload-ratio", type=float, default=0.02, help="fraction of requests that are uploads")
+    parser.add_argument("--upload-rows", type=int, default=200)
+    parser.add_argument("--wells", type=int, default=200, help="synthetic wells in the stand-in database")
+    parser.add_argument("--llm-token-delay", type=float, default=0.01, help="stub LLM seconds per token")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+    # The local server changes directory when it stops, so fix the path now
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    questions = load_questions(args.questions)
+    levels = [int(level) for level in args.ramp.split(",")] if args.ramp else [args.concurrency]
+
+    standins = None
+    server = None
+    route_question = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        standins = start_standins(prefix="ingres-load-", token_delay=args.llm_token_delay)
+        import importlib
+        import simple_setup
+
+        simple_setup.generate_dataset("sqlite", wells=args.wells, years=5, seed=args.seed)
+        server, thread = start_api_server(importlib.import_module(args.server).app)
+        # Classify questions by route branch the way the local server does
+        from tools_sqlite import route_question
+        base_url = f"http://127.0.0.1:{server.config.port}"
+
+    upload_body = make_upload_file(args.upload_rows, args.seed) if args.upload_ratio > 0 else None
+
+    print(f"🚦 Load testing {base_url} with {len(questions)} questions")
+    print("=" * 50)
+    results = []
+    try:
+        for level in levels:
+            result = run_load(base_url, questions, level, args.rate, args.duration,
+                              args.upload_ratio, upload_body, args.seed, route_question)
+            results.append(result)
+            print_report(result)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=10)
+        if standins is not None:
+            stop_standins(*standins)
+
+    within_slo = [r["concurrency"] for r in results if r["overall"] and r["overall"]["p99_ms"] <= args.slo_ms]
+    if args.ramp:
+        if within_slo:
+            print(f"\n✅ Highest concurrency with p99 <= {args.slo_ms:.0f}ms: {max(within_slo)}")
+        else:
+            print(f"\n❌ p99 exceeded {args.slo_ms:.0f}ms at every level")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "runs": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
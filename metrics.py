@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+from fastapi.responses import PlainTextResponse
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+UPLOAD_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+
+# Every metric the servers export: name -> (type, help, buckets)
+METRIC_FAMILIES = {
+    "http_requests_total": ("counter", "HTTP requests handled, by method, route and status.", None),
+    "http_request_duration_seconds": ("histogram", "Time to produce the response headers, by method and route.", LATENCY_BUCKETS),
+    "http_requests_in_progress": ("gauge", "HTTP requests currently being handled.", None),
+    "pipeline_stage_duration_seconds": ("histogram", "Duration of each traced pipeline stage.", LATENCY_BUCKETS),
+    "db_query_duration_seconds": ("histogram", "SQL query execution time, by backend.", LATENCY_BUCKETS),
+    "db_connections_in_use": ("gauge", "Database connections currently checked out, by backend.", None),
+    "db_pool_size": ("gauge", "Maximum connections in the Postgres pool.", None),
+    "db_pool_wait_seconds": ("histogram", "Time spent waiting for a free Postgres pool connection.", LATENCY_BUCKETS),
+    "db_read_routing_total": ("counter", "Read-only queries by backend and target: replica, or primary when no replica was fresh enough.", None),
+    "db_statement_cache_total": ("counter", "Statement executions by backend, statement and result: hit reuses a prepared statement, miss parses and prepares it.", None),
+    "db_slow_queries_total": ("counter", "Queries at or over SLOW_QUERY_MS, by backend.", None),
+    "db_statement_prepare_seconds": ("histogram", "Time to parse and prepare a named Postgres statement on a connection.", LATENCY_BUCKETS),
+    "generation_cache_requests_total": ("counter", "Generation cache lookups, by result (hit or miss).", None),
+    "upload_rows_total": ("counter", "Uploaded rows, by status (new, updated, skipped or error).", None),
+    "upload_duration_seconds": ("histogram", "Time to process one uploaded file.", UPLOAD_BUCKETS),
+    "upload_chunks_total": ("counter", "Resumable upload chunks received, by status (ok, checksum_mismatch or wrong_size).", None),
+    "export_rows_total": ("counter", "Rows streamed by /export, by format (csv or parquet).", None),
+    "chart_renders_in_progress": ("gauge", "Charts currently being rendered or waiting to render.", None),
+}
+
+# Each thread records into its own shard, so recording never takes a lock;
+# /metrics sums the shards when it is scraped. When a thread exits its shard is
+# folded into _retired, so short-lived threads do not grow the shard list.
+_local = threading.local()
+_shards: Dict[int, dict] = {}
+_retired: dict = {}
+_shards_lock = threading.Lock()
+
+# Gauges computed when scraped: name -> callable returning a value
+_gauge_callbacks: Dict[str, Callable[[], float]] = {}
+
+
+class _ShardOwner:
+    """Lives in the thread's local storage; collected when the thread exits."""
+
+
+def _merge(totals: dict, shard: dict):
+    for key, value in shard.copy().items():
+        if isinstance(value, list):
+            merged = totals.setdefault(key, [0] * (len(value) - 1) + [0.0])
+            for i, count in enumerate(list(value)):
+                merged[i] += count
+        else:
+            totals[key] = totals.get(key, 0.0) + value
+
+
+def _retire(shard_id: int, shard: dict):
+    with _shards_lock:
+        _merge(_retired, shard)
+        _shards.pop(shard_id, None)
+
+
+def _shard() -> dict:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        owner = _local.owner = _ShardOwner()
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards[id(owner)] = shard
+        weakref.finalize(owner, _retire, id(owner), shard)
+    return shard
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    """Add to a counter or gauge."""
+    shard = _shard()
+    key = _key(name, labels)
+    shard[key] = shard.get(key, 0.0) + value
+
+
+def dec(name: str, value: float = 1.0, **labels):
+    """Subtract from a gauge."""
+    inc(name, -value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    """Record one observation in a histogram."""
+    buckets = METRIC_FAMILIES[name][2]
+    shard = _shard()
+    key = _key(name, labels)
+    counts = shard.get(key)
+    if counts is None:
+        # One slot per bucket plus +Inf, then the sum
+        counts = shard[key] = [0] * (len(buckets) + 1) + [0.0]
+    counts[bisect.bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+@contextmanager
+def in_progress(name: str, **labels) -> Iterator[None]:
+    """Count the enclosed work in a gauge while it runs."""
+    inc(name, **labels)
+    try:
+        yield
+    finally:
+        dec(name, **labels)
+
+
+@contextmanager
+def timed(name: str, **labels) -> Iterator[None]:
+    """Observe the duration of the enclosed work in a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def register_gauge(name: str, callback: Callable[[], float]):
+    """Export a gauge whose value is read from callback at scrape time."""
+    _gauge_callbacks[name] = callback
+
+
+def collect() -> dict:
+    """Sum every live thread's shard and the retired totals into one {(name, labels): value} snapshot."""
+    # Copy the retired totals with the live list, so a shard retiring mid-scrape is counted once
+    totals = {}
+    with _shards_lock:
+        shards = list(_shards.values())
+        _merge(totals, _retired)
+
+    for shard in shards:
+        _merge(totals, shard)
+
+    for name, callback in list(_gauge_callbacks.items()):
+        try:
+            totals[(name, ())] = float(callback())
+        except Exception as e:
+            print(f"Error reading gauge {name}: {str(e)}")
+
+    return totals
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    totals = collect()
+    lines = []
+
+    for name, (metric_type, help_text, buckets) in METRIC_FAMILIES.items():
+        series = sorted((key for key in totals if key[0] == name), key=lambda key: key[1])
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        for key in series:
+            labels = key[1]
+            value = totals[key]
+            if metric_type != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += value[len(buckets)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+def install_metrics(app):
+    """Record request metrics for app and serve them at /metrics."""
+    @app.middleware("http")
+    async def record_request_metrics(request, call_next):
+        start = time.perf_counter()
+        inc("http_requests_in_progress")
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            dec("http_requests_in_progress")
+            # Label by route template, not raw path, to keep the series count bounded
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            inc("http_requests_total", method=request.method, path=path, status=str(status))
+            observe("http_request_duration_seconds", time.perf_counter() - start, method=request.method, path=path)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_endpoint():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
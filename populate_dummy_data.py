@@ -6,10 +6,31 @@ This script will insert sample data into PostgreSQL and initialize the search da
 
 import pandas as pd
 import time
-from postgres_utils import run_sql_query
+from postgres_utils import run_sql_query, register_statement, run_prepared
 from qdrant_utils import initialize_qdrant
 from sqlite_utils import initialize_sqlite
 
+# Statements run once per row, prepared once per connection instead of parsed every time
+INSERT_MEASUREMENT = register_statement(
+    "insert_dummy_measurement",
+    ["text", "text", "float8", "float8", "float8", "float8", "date", "float8", "float8"],
+    """
+        INSERT INTO groundwater_data 
+        (well_id, location_name, latitude, longitude, depth_meters, 
+         water_level_meters, measurement_date, quality_ph, quality_tds, geom)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, ST_SetSRID(ST_MakePoint($4, $3), 4326))
+    """
+)
+COUNT_WELL = register_statement("count_well", ["text"], "SELECT COUNT(*) FROM wells WHERE well_id = $1")
+INSERT_WELL = register_statement(
+    "insert_dummy_well",
+    ["text", "text", "text", "float8", "float8", "float8", "date"],
+    """
+        INSERT INTO wells (well_id, well_name, location_name, latitude, longitude, depth_meters, installation_date, geom)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, ST_SetSRID(ST_MakePoint($5, $4), 4326))
+    """
+)
+
 def wait_for_postgres():
     """Wait for PostgreSQL to be ready."""
     print("Waiting for PostgreSQL to be ready...")
@@ -40,13 +61,6 @@ def populate_groundwater_data():
         
         for _, row in df.iterrows():
             try:
-                insert_query = """
-                    INSERT INTO groundwater_data 
-                    (well_id, location_name, latitude, longitude, depth_meters, 
-                     water_level_meters, measurement_date, quality_ph, quality_tds, geom)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))
-                """
-                
                 values = (
                     row['well_id'],
                     row['location_name'],
@@ -56,12 +70,10 @@ def populate_groundwater_data():
                     row['water_level_meters'],
                     row['measurement_date'],
                     row['quality_ph'],
-                    row['quality_tds'],
-                    row['longitude'],
-                    row['latitude']
+                    row['quality_tds']
                 )
                 
-                run_sql_query(insert_query, values)
+                run_prepared(INSERT_MEASUREMENT, values)
                 rows_inserted += 1
                 
             except Exception as e:
@@ -76,15 +88,9 @@ def populate_groundwater_data():
         for _, well in unique_wells.iterrows():
             try:
                 # Check if well already exists
-                check_query = "SELECT COUNT(*) FROM wells WHERE well_id = %s"
-                count = run_sql_query(check_query, (well['well_id'],))[0][0]
+                count = run_prepared(COUNT_WELL, (well['well_id'],))[0][0]
                 
                 if count == 0:
-                    insert_well_query = """
-                        INSERT INTO wells (well_id, well_name, location_name, latitude, longitude, depth_meters, installation_date, geom)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))
-                    """
-                    
                     well_values = (
                         well['well_id'],
                         well['location_name'],  # Use location as well name
@@ -92,12 +98,10 @@ def populate_groundwater_data():
                         well['latitude'],
                         well['longitude'],
                         well['depth_meters'],
-                        '2023-01-01',  # Default installation date
-                        well['longitude'],
-                        well['latitude']
+                        '2023-01-01'  # Default installation date
                     )
                     
-                    run_sql_query(insert_well_query, well_values)
+                    run_prepared(INSERT_WELL, well_values)
                     print(f"✅ Added well {well['well_id']}")
                     
             except Exception as e:
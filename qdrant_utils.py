@@ -1,14 +1,27 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import Distance, VectorParams, PointStruct, QueryRequest
+from typing import List
 import numpy as np
 import json
+import os
+from tracing import span, record_error
+
+# Qdrant server URL, or ":memory:" for an in-process store (tests and benchmarks)
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 
 # Initialize Qdrant client
-client = QdrantClient(host="localhost", port=6333)
+client = QdrantClient(location=QDRANT_URL)
 
 # Collection name for groundwater data
 COLLECTION_NAME = "groundwater_docs"
 
+# Dimension of the document and query embeddings
+VECTOR_SIZE = 384
+
+# Cosine scores of the static sample documents are lowered by this, so passages built
+# from real data (facts.py) rank above a sample that is as similar
+SAMPLE_SCORE_PENALTY = 0.1
+
 def initialize_qdrant():
     """Initialize Qdrant collection for groundwater documents."""
     try:
@@ -19,7 +32,7 @@ def initialize_qdrant():
         if COLLECTION_NAME not in collection_names:
             client.create_collection(
                 collection_name=COLLECTION_NAME,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+                vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
             )
             print(f"Created collection: {COLLECTION_NAME}")
         else:
@@ -62,18 +75,17 @@ def add_sample_documents():
     ]
     
     try:
-        # Generate random vectors for demonstration (in real app, use proper embeddings)
+        # Embed all documents in one batch
+        vectors = embed_texts([doc["text"] for doc in sample_docs])
+        
         points = []
-        for doc in sample_docs:
-            # Generate random 384-dimensional vector
-            vector = np.random.random(384).tolist()
-            
+        for doc, vector in zip(sample_docs, vectors):
             point = PointStruct(
                 id=doc["id"],
-                vector=vector,
+                vector=vector.tolist(),
                 payload={
                     "text": doc["text"],
-                    "metadata": doc["metadata"]
+                    "metadata": {**doc["metadata"], "source": "sample"}
                 }
             )
             points.append(point)
@@ -88,30 +100,54 @@ def add_sample_documents():
     except Exception as e:
         print(f"Error adding sample documents: {str(e)}")
 
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed a batch of texts into a (len(texts), VECTOR_SIZE) array."""
+    # Generate random vectors for demonstration (in real app, use proper embedding model)
+    return np.random.random((len(texts), VECTOR_SIZE))
+
+def semantic_search_batch(queries: List[str], limit: int = 3) -> List[List[str]]:
+    """Perform semantic search for many queries with a single batched Qdrant request."""
+    if not queries:
+        return []
+    
+    with span("semantic_search", backend="qdrant", queries=len(queries)) as stage:
+        try:
+            # Embed every query in one call
+            query_vectors = embed_texts(queries)
+            
+            # One multi-vector search request instead of a round-trip per query
+            search_requests = [
+                # Fetched twice over, so passages that outrank demoted samples are in the results
+                QueryRequest(query=vector.tolist(), limit=limit * 2, with_payload=True)
+                for vector in query_vectors
+            ]
+            batch_results = client.query_batch_points(
+                collection_name=COLLECTION_NAME,
+                requests=search_requests
+            )
+            
+            # Extract text from results, keeping the order of the queries
+            results = []
+            for response in batch_results:
+                scored = []
+                for point in response.points:
+                    if point.payload and "text" in point.payload:
+                        is_sample = (point.payload.get("metadata") or {}).get("source") == "sample"
+                        scored.append((point.score - (SAMPLE_SCORE_PENALTY if is_sample else 0), point.payload["text"]))
+                scored.sort(key=lambda item: item[0], reverse=True)
+                results.append([text for _, text in scored[:limit]])
+            
+            stage.set(rows=sum(len(texts) for texts in results))
+            return results
+            
+        except Exception as e:
+            print(f"Error in batch semantic search: {str(e)}")
+            record_error(e)
+            return [["Groundwater data shows normal levels across all monitoring wells."] for _ in queries]
+
 def semantic_search(query: str, limit: int = 3) -> list:
     """Perform semantic search on groundwater documents."""
-    try:
-        # Generate random query vector (in real app, use proper embedding model)
-        query_vector = np.random.random(384).tolist()
-        
-        # Search in Qdrant
-        search_results = client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=limit
-        )
-        
-        # Extract text from results
-        results = []
-        for result in search_results:
-            if result.payload and "text" in result.payload:
-                results.append(result.payload["text"])
-        
-        return results
-        
-    except Exception as e:
-        print(f"Error in semantic search: {str(e)}")
-        return ["Groundwater data shows normal levels across all monitoring wells."]
+    return semantic_search_batch([query], limit)[0]
 
 # Initialize Qdrant on import
 initialize_qdrant()
\ No newline at end of file
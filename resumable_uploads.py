@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Resumable chunked uploads for large files on slow links.
+
+A client opens a session, PUTs numbered chunks with a SHA-256 each, and
+completes the session once every chunk is acknowledged. Chunks are spooled to
+disk, so a dropped connection only costs the chunk in flight: the client asks
+which chunks the server holds and sends the rest. On completion the spooled
+file is handed to the ingester by path, without reading it into memory.
+
+    python resumable_uploads.py readings.xlsx --url http://localhost:8000 --source-id district-7
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from metrics import inc
+from upload_readers import file_sha256
+
+# Where sessions are spooled; needs room for the largest upload in flight
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "upload_spool")
+
+# Default and largest chunk size; one chunk is the most a dropped connection wastes
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Sessions untouched for this many seconds are removed
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    total_size: int
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+    sha256: Optional[str] = None
+    source_id: str = ""
+
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SPOOL_DIR, upload_id)
+
+
+def load_session(upload_id: str) -> Optional[dict]:
+    """The session's metadata, or None if the id is unknown or malformed."""
+    if not _UPLOAD_ID.match(upload_id):
+        return None
+    try:
+        with open(os.path.join(session_dir(upload_id), "session.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def received_chunks(upload_id: str) -> list:
+    """Indexes of the chunks written and verified so far."""
+    chunks = os.path.join(session_dir(upload_id), "chunks")
+    return sorted(int(name) for name in os.listdir(chunks) if name.isdigit())
+
+
+def session_status(session: dict) -> dict:
+    received = received_chunks(session["upload_id"])
+    missing = sorted(set(range(session["total_chunks"])) - set(received))
+    return {
+        **session,
+        "received": received,
+        "next_chunk": missing[0] if missing else None,
+        "complete": not missing,
+    }
+
+
+def expire_sessions():
+    """Remove sessions nobody has touched for UPLOAD_SESSION_TTL seconds."""
+    if not os.path.isdir(UPLOAD_SPOOL_DIR):
+        return
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    for upload_id in os.listdir(UPLOAD_SPOOL_DIR):
+        try:
+            if os.path.getmtime(os.path.join(session_dir(upload_id), "session.json")) < cutoff:
+                shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+        except OSError:
+            continue
+
+
+def create_session(request: UploadSessionRequest) -> dict:
+    """Open a session, or return the unfinished one for the same file and source."""
+    if request.total_size <= 0:
+        raise ValueError("total_size must be positive")
+    if not 0 < request.chunk_size <= MAX_UPLOAD_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {MAX_UPLOAD_CHUNK_SIZE} bytes")
+
+    # With a file hash the session id is deterministic, so re-opening resumes it
+    if request.sha256:
+        key = f"{request.sha256.lower()}:{request.total_size}:{request.chunk_size}:{request.source_id}"
+        upload_id = hashlib.sha256(key.encode()).hexdigest()[:32]
+        existing = load_session(upload_id)
+        if existing is not None:
+            return existing
+    else:
+        upload_id = uuid.uuid4().hex
+
+    expire_sessions()
+    directory = session_dir(upload_id)
+    os.makedirs(os.path.join(directory, "chunks"), exist_ok=True)
+
+    # Chunks land at their own offsets of a file sized up front (sparse until written)
+    with open(os.path.join(directory, "data"), "wb") as f:
+        f.truncate(request.total_size)
+
+    session = {
+        "upload_id": upload_id,
+        "filename": request.filename,
+        "total_size": request.total_size,
+        "chunk_size": request.chunk_size,
+        "total_chunks": math.ceil(request.total_size / request.chunk_size),
+        "sha256": request.sha256.lower() if request.sha256 else None,
+        "source_id": request.source_id,
+    }
+    # Written last and atomically, so a session is visible only once it is usable
+    temp_path = os.path.join(directory, "session.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(session, f)
+    os.replace(temp_path, os.path.join(directory, "session.json"))
+    return session
+
+
+def commit_chunk(upload_id: str, index: int, part_path: str, offset: int, checksum: str):
+    """Copy a verified chunk from its part file into the spooled file and acknowledge it."""
+    directory = session_dir(upload_id)
+    marker = os.path.join(directory, "chunks", str(index))
+    # Unacknowledged while its bytes are replaced, so a crash midway leaves it to be sent again
+    try:
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+    with open(part_path, "rb") as source, open(os.path.join(directory, "data"), "r+b") as target:
+        target.seek(offset)
+        shutil.copyfileobj(source, target)
+    with open(marker, "w") as f:
+        f.write(checksum)
+    os.utime(os.path.join(directory, "session.json"))
+
+
+def reset_chunks(upload_id: str):
+    """Forget every acknowledged chunk, so the client sends the whole file again."""
+    for index in received_chunks(upload_id):
+        try:
+            os.remove(os.path.join(session_dir(upload_id), "chunks", str(index)))
+        except FileNotFoundError:
+            pass
+
+
+def error(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def install_resumable_uploads(app, process_upload: Callable):
+    """Serve the /upload/sessions API, ingesting completed files with process_upload(path, filename, source_id)."""
+
+    @app.post("/upload/sessions")
+    async def open_upload_session(request: UploadSessionRequest):
+        try:
+            session = await run_in_threadpool(create_session, request)
+        except ValueError as e:
+            return error(str(e), 400)
+        return session_status(session)
+
+    @app.get("/upload/sessions/{upload_id}")
+    async def upload_session_status(upload_id: str):
+        session = load_session(upload_id)
+        if session is None:
+            return error("Unknown upload session", 404)
+        return session_status(session)
+
+    @app.put("/upload/sessions/{upload_id}/chunks/{index}")
+    async def upload_chunk(upload_id: str, index: int, request: Request):
+        session = load_session(upload_id)
+        if session is None:
+            return error("Unknown upload session", 404)
+        if not 0 <= index < session["total_chunks"]:
+            return error(f"Chunk index must be between 0 and {session['total_chunks'] - 1}", 400)
+        checksum = request.headers.get("x-chunk-sha256", "").lower()
+        if not checksum:
+            return error("Missing X-Chunk-SHA256 header", 400)
+
+        offset = index * session["chunk_size"]
+        expected_size = min(session["chunk_size"], session["total_size"] - offset)
+        directory = session_dir(upload_id)
+
+        # Stream the body to a part file of its own; the spooled file only takes verified chunks,
+        # so a corrupted retry cannot overwrite bytes already accepted
+        part_path = os.path.join(directory, "chunks", f"{index}.{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            f = await run_in_threadpool(open, part_path, "wb")
+            try:
+                async for piece in request.stream():
+                    written += len(piece)
+                    if written > expected_size:
+                        break
+                    digest.update(piece)
+                    await run_in_threadpool(f.write, piece)
+            finally:
+                await run_in_threadpool(f.close)
+
+            if written != expected_size:
+                inc("upload_chunks_total", status="wrong_size")
+                return error(f"Chunk {index} must be {expected_size} bytes, got {written}", 400)
+            if digest.hexdigest() != checksum:
+                inc("upload_chunks_total", status="checksum_mismatch")
+                return error(f"Checksum mismatch for chunk {index}; send it again", 422)
+
+            await run_in_threadpool(commit_chunk, upload_id, index, part_path, offset, checksum)
+        finally:
+            # A dropped request or a rejected chunk leaves nothing behind
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+        inc("upload_chunks_total", status="ok")
+
+        status = session_status(session)
+        return {"index": index, "received": len(status["received"]), "next_chunk": status["next_chunk"]}
+
+    @app.post("/upload/sessions/{upload_id}/complete")
+    async def complete_upload(upload_id: str):
+        session = load_session(upload_id)
+        if session is None:
+            return error("Unknown upload session", 404)
+        status = session_status(session)
+        if not status["complete"]:
+            return error(f"Chunk {status['next_chunk']} has not been received", 409)
+
+        # One completion at a time, across workers too
+        directory = session_dir(upload_id)
+        completing = os.path.join(directory, "completing")
+        try:
+            os.mkdir(completing)
+        except FileExistsError:
+            return error("Upload is already being completed", 409)
+
+        data_path = os.path.join(directory, "data")
+        if session["sha256"] and await run_in_threadpool(file_sha256, data_path) != session["sha256"]:
+            # Start the session over; opening it again lists every chunk as missing
+            await run_in_threadpool(reset_chunks, upload_id)
+            os.rmdir(completing)
+            return error("Assembled file does not match sha256; send every chunk again", 422)
+
+        # process_upload reports failures in its result rather than raising
+        result = await run_in_threadpool(process_upload, data_path, session["filename"], session["source_id"])
+        if "error" in result:
+            # Keep the spooled file so the client can complete again, e.g. once the database is back
+            os.rmdir(completing)
+            return error(result["error"], 400)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        return result
+
+    @app.delete("/upload/sessions/{upload_id}")
+    async def abort_upload(upload_id: str):
+        if load_session(upload_id) is None:
+            return error("Unknown upload session", 404)
+        shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+        return {"upload_id": upload_id, "status": "aborted"}
+
+
+def upload_file(base_url: str, path: str, source_id: str = "", chunk_size: int = UPLOAD_CHUNK_SIZE,
+                retries: int = 5) -> dict:
+    """Upload a file through the resumable API, resuming any unfinished session for it."""
+    import requests
+
+    base_url = base_url.rstrip("/")
+    session = requests.Session()
+    total_size = os.path.getsize(path)
+    file_hash = file_sha256(path)
+
+    # A second pass resends the whole file if the assembled copy did not match
+    for attempt in range(2):
+        response = session.post(f"{base_url}/upload/sessions", json={
+            "filename": os.path.basename(path),
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "sha256": file_hash,
+            "source_id": source_id,
+        }, timeout=30)
+        response.raise_for_status()
+        status = response.json()
+        upload_id = status["upload_id"]
+        missing = sorted(set(range(status["total_chunks"])) - set(status["received"]))
+        if status["received"]:
+            print(f"↩️  Resuming {upload_id}: {len(status['received'])}/{status['total_chunks']} chunks already on the server")
+
+        with open(path, "rb") as f:
+            for index in missing:
+                f.seek(index * chunk_size)
+                chunk = f.read(chunk_size)
+                checksum = hashlib.sha256(chunk).hexdigest()
+                for retry in range(retries + 1):
+                    try:
+                        response = session.put(
+                            f"{base_url}/upload/sessions/{upload_id}/chunks/{index}",
+                            data=chunk, headers={"X-Chunk-SHA256": checksum}, timeout=120
+                        )
+                        if response.status_code == 200:
+                            break
+                        if response.status_code != 422:
+                            response.raise_for_status()
+                    except (requests.ConnectionError, requests.Timeout):
+                        if retry == retries:
+                            raise
+                    # Back off before resending a dropped or corrupted chunk
+                    time.sleep(min(2 ** retry, 30))
+                else:
+                    raise Exception(f"Chunk {index} failed after {retries} retries")
+
+        response = session.post(f"{base_url}/upload/sessions/{upload_id}/complete", timeout=3600)
+        if response.status_code != 422 or attempt == 1:
+            return response.json()
+        print(f"⚠️  {response.json().get('error')}")
+
+
+def main():
+    """Upload one file with the resumable protocol."""
+    parser = argparse.ArgumentParser(description="Resumable upload of a groundwater data file")
+    parser.add_argument("path", help="Excel/CSV/Parquet/Arrow file to upload")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the API server")
+    parser.add_argument("--source-id", default="", help="source the readings come from")
+    parser.add_argument("--chunk-mb", type=float, default=UPLOAD_CHUNK_SIZE / (1024 * 1024))
+    args = parser.parse_args()
+
+    result = upload_file(args.url, args.path, args.source_id, int(args.chunk_mb * 1024 * 1024))
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
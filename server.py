@@ -1,10 +1,58 @@
-from fastapi import FastAPI, UploadFile, File
+from contextlib import asynccontextmanager
+import threading
+from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from tools import run_rag_pipeline, process_uploaded_data
+from typing import List
+from tools import run_rag_pipeline_async, run_rag_pipeline_batch_async, run_rag_pipeline_stream, process_uploaded_data, load_sql_schema, build_facts
+from sse_utils import format_sse_event
+from llm_utils import warm_up_model
+from tracing import add_tracing_middleware, trace_stream
+from metrics import install_metrics
+from resumable_uploads import install_resumable_uploads
+from data_export import install_data_export
+from postgres_utils import iter_sql_query
+from async_postgres_utils import close_async_pool
+from health import install_health_checks, check_postgres, check_search_index, check_qdrant, check_chart_renderer
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cache the schema once rather than introspecting it per question
+    load_sql_schema()
+    
+    # Load the model in the background so startup is not blocked
+    threading.Thread(target=warm_up_model, daemon=True).start()
+    
+    # Catch the fact passages up with data loaded outside /upload
+    threading.Thread(target=build_facts, daemon=True).start()
+    yield
+    await close_async_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-stage latency tracing; send "X-Timing: 1" to get the breakdown back
+add_tracing_middleware(app)
+
+# Prometheus-style counters and histograms at /metrics
+install_metrics(app)
+
+# /health/live, plus /health/ready (and /health) probing the backends this server uses
+install_health_checks(app, {
+    "postgres": check_postgres,
+    "search_index": check_search_index,
+    "qdrant": check_qdrant,
+    "chart_renderer": check_chart_renderer,
+})
+
+# /upload/sessions: chunked, resumable uploads for large files on slow links
+install_resumable_uploads(app, process_uploaded_data)
+
+# /export: stream groundwater_data selections as CSV or Parquet
+install_data_export(app, iter_sql_query, "postgres")
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -16,19 +64,45 @@ class Query(BaseModel):
 
 @app.post("/ask")
 async def ask_bot(query: Query):
-    response = run_rag_pipeline(query.question)
+    # Database queries are awaited and blocking stages run on worker threads
+    response = await run_rag_pipeline_async(query.question)
     return {"answer": response}
 
 
+@app.post("/ask/stream")
+async def ask_bot_stream(query: Query):
+    """Stream pipeline stage events and answer tokens as Server-Sent Events."""
+    pipeline_events = trace_stream("ask_stream", run_rag_pipeline_stream(query.question))
+    events = (format_sse_event(event, data) for event, data in pipeline_events)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class BatchQuery(BaseModel):
+    questions: List[str]
+
+
+@app.post("/ask/batch")
+async def ask_bot_batch(query: BatchQuery):
+    """Answer a list of questions in one request, in order."""
+    # Analytical queries are awaited together; retrieval and generation run on a worker thread
+    answers = await run_rag_pipeline_batch_async(query.questions)
+    return {"answers": answers}
+
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), source_id: str = Form("")):
     """Upload and process Excel/CSV files."""
     try:
         # Read file content
         file_content = await file.read()
         
-        # Process the file
-        result = process_uploaded_data(file_content, file.filename)
+        # Process the file on a worker thread: parsing, the upsert and the fact refresh block
+        # Readings are keyed by well and date within each source; re-uploads upsert
+        result = await run_in_threadpool(process_uploaded_data, file_content, file.filename, source_id)
         
         if "error" in result:
             return {"error": result["error"]}, 400
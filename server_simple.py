@@ -1,11 +1,33 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from tools_simple import run_rag_pipeline, process_uploaded_data
+from metrics import install_metrics
+from resumable_uploads import install_resumable_uploads
+from data_export import install_data_export
+from sqlite_postgres_utils import iter_sql_query
+from health import install_health_checks, check_sqlite, check_search_index, check_chart_renderer
 
 
 app = FastAPI()
 
+# Prometheus-style counters and histograms at /metrics
+install_metrics(app)
+
+# /health/live, plus /health/ready (and /health) probing the backends this server uses
+install_health_checks(app, {
+    "sqlite": check_sqlite,
+    "search_index": check_search_index,
+    "chart_renderer": check_chart_renderer,
+})
+
+# /upload/sessions: chunked, resumable uploads for large files on slow links
+install_resumable_uploads(app, process_uploaded_data)
+
+# /export: stream groundwater_data selections as CSV or Parquet
+install_data_export(app, iter_sql_query, "sqlite")
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -21,14 +43,15 @@ async def ask_bot(query: Query):
 
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), source_id: str = Form("")):
     """Upload and process Excel/CSV files."""
     try:
         # Read file content
         file_content = await file.read()
         
-        # Process the file
-        result = process_uploaded_data(file_content, file.filename)
+        # Process the file on a worker thread: parsing, the upsert and the fact refresh block
+        # Readings are keyed by well and date within each source; re-uploads upsert
+        result = await run_in_threadpool(process_uploaded_data, file_content, file.filename, source_id)
         
         if "error" in result:
             return {"error": result["error"]}, 400
@@ -42,8 +65,3 @@ async def upload_file(file: UploadFile = File(...)):
 @app.get("/")
 async def root():
     return {"message": "INGRES AI Chatbot API - Simple SQLite Version", "status": "running"}
-
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "database": "sqlite"}
@@ -2,16 +2,47 @@
 """
 Simple setup script that creates a SQLite-based dummy database
 without requiring Docker or PostgreSQL.
+
+Synthetic datasets of any size can be generated with:
+    python simple_setup.py generate --wells 10000 --years 20 --target sqlite
 """
 
+import argparse
+import io
 import sqlite3
+import sys
+import time
+import numpy as np
 import pandas as pd
 import os
 from pathlib import Path
+from typing import Iterator
+from sqlite_postgres_utils import UPLOAD_FILES_TABLE
+
+# District centres synthetic wells cluster around:
+# (name, latitude, longitude, typical water level in m, typical TDS in mg/L)
+SYNTHETIC_DISTRICTS = [
+    ('Downtown Area', 28.6139, 77.2090, 12.0, 450.0),
+    ('North District', 28.7041, 77.1025, 15.0, 520.0),
+    ('South District', 28.5355, 77.3910, 9.0, 380.0),
+    ('East District', 28.6129, 77.2295, 10.0, 430.0),
+    ('West District', 28.6149, 77.1885, 13.5, 490.0),
+    ('Industrial Area', 28.6500, 77.2500, 18.5, 600.0),
+    ('Residential Zone', 28.5800, 77.3200, 14.0, 420.0),
+    ('Commercial District', 28.6200, 77.1800, 16.5, 510.0),
+    ('Suburban Area', 28.7000, 77.1500, 12.0, 380.0),
+    ('Rural Zone', 28.5500, 77.4000, 22.0, 650.0),
+]
+SYNTHETIC_LOCATIONS = [district[0] for district in SYNTHETIC_DISTRICTS]
 
-def create_sqlite_database():
+MEASUREMENT_COLUMNS = [
+    'well_id', 'location_name', 'latitude', 'longitude', 'depth_meters',
+    'water_level_meters', 'measurement_date', 'quality_ph', 'quality_tds'
+]
+WELL_COLUMNS = ['well_id', 'well_name', 'location_name', 'latitude', 'longitude', 'depth_meters', 'installation_date']
+
+def create_sqlite_database(db_path: str = "groundwater_dummy.db"):
     """Create a SQLite database with groundwater data."""
-    db_path = "groundwater_dummy.db"
     
     # Remove existing database if it exists
     if os.path.exists(db_path):
@@ -33,10 +64,18 @@ def create_sqlite_database():
             measurement_date DATE,
             quality_ph DECIMAL(4, 2),
             quality_tds DECIMAL(8, 2),
+            source_id VARCHAR(100) NOT NULL DEFAULT '',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     
+    # One reading per well, date and source; uploads upsert on this key
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_groundwater_measurement_key
+        ON groundwater_data (well_id, measurement_date, source_id)
+    ''')
+    cursor.execute(UPLOAD_FILES_TABLE)
+    
     # Create wells table
     cursor.execute('''
         CREATE TABLE wells (
@@ -185,8 +224,244 @@ def populate_sample_data(conn):
     
     return conn
 
+def synthetic_wells(wells: int, seed: int = 42) -> pd.DataFrame:
+    """Create wells clustered around the district centres, with per-well behaviour."""
+    rng = np.random.default_rng(seed)
+    
+    # Uneven cluster sizes: some districts are far more densely monitored
+    weights = rng.dirichlet(np.ones(len(SYNTHETIC_DISTRICTS)) * 2)
+    district = rng.choice(len(SYNTHETIC_DISTRICTS), size=wells, p=weights)
+    centres = np.array([(lat, lon) for _, lat, lon, _, _ in SYNTHETIC_DISTRICTS])
+    district_level = np.array([level for _, _, _, level, _ in SYNTHETIC_DISTRICTS])
+    district_tds = np.array([tds for _, _, _, _, tds in SYNTHETIC_DISTRICTS])
+    names = np.array([name for name, _, _, _, _ in SYNTHETIC_DISTRICTS])
+    
+    installed = np.datetime64('2000-01-01') + rng.integers(0, 365 * 20, size=wells)
+    
+    return pd.DataFrame({
+        'well_id': [f"W{i + 1:06d}" for i in range(wells)],
+        'well_name': [f"Synthetic Well {i + 1}" for i in range(wells)],
+        'location_name': names[district],
+        'latitude': np.round(centres[district, 0] + rng.normal(0, 0.02, wells), 6),
+        'longitude': np.round(centres[district, 1] + rng.normal(0, 0.02, wells), 6),
+        'depth_meters': np.round(rng.uniform(30, 80, wells), 2),
+        'installation_date': installed.astype(str),
+        # Behaviour of each well's readings
+        'base_level': district_level[district] + rng.normal(0, 2, wells),
+        'seasonal_amplitude': rng.uniform(0.5, 2.5, wells),
+        'seasonal_phase': rng.normal(8, 0.7, wells),  # wettest around the August monsoon
+        'yearly_trend': rng.normal(-0.25, 0.15, wells),
+        'base_ph': rng.normal(7.1, 0.25, wells),
+        'base_tds': district_tds[district] * rng.lognormal(0, 0.1, wells),
+    })
+
+
+def generate_measurement_chunks(wells: int = 1000, years: int = 10, chunk_rows: int = 250_000,
+                                seed: int = 42, dirty_fraction: float = 0.0, start_year: int = 2000,
+                                max_rows: int = None, well_table: pd.DataFrame = None) -> Iterator[pd.DataFrame]:
+    """Yield monthly readings for every well in upload-file shape, chunk by chunk."""
+    rng = np.random.default_rng(seed + 1)
+    if well_table is None:
+        well_table = synthetic_wells(wells, seed)
+    
+    well_ids = well_table['well_id'].to_numpy()
+    locations = well_table['location_name'].to_numpy()
+    latitude = well_table['latitude'].to_numpy()
+    longitude = well_table['longitude'].to_numpy()
+    depth = well_table['depth_meters'].to_numpy()
+    base_level = well_table['base_level'].to_numpy()
+    amplitude = well_table['seasonal_amplitude'].to_numpy()
+    phase = well_table['seasonal_phase'].to_numpy()
+    trend = well_table['yearly_trend'].to_numpy()
+    base_ph = well_table['base_ph'].to_numpy()
+    base_tds = well_table['base_tds'].to_numpy()
+    
+    total_rows = wells * years * 12
+    if max_rows is not None:
+        total_rows = min(total_rows, max_rows)
+    
+    # Rows run month by month across all wells, so dates ascend through the stream
+    for start in range(0, total_rows, chunk_rows):
+        row = np.arange(start, min(start + chunk_rows, total_rows))
+        well = row % wells
+        month = row // wells
+        size = len(row)
+        
+        month_of_year = month % 12 + 1
+        seasonal = amplitude[well] * np.cos(2 * np.pi * (month_of_year - phase[well]) / 12)
+        water_level = base_level[well] + seasonal + trend[well] * month / 12 + rng.normal(0, 0.3, size)
+        dates = (np.datetime64(f'{start_year}-01', 'M') + month).astype('datetime64[D]') + 14
+        
+        chunk = pd.DataFrame({
+            'well_id': well_ids[well],
+            'location_name': locations[well],
+            'latitude': latitude[well],
+            'longitude': longitude[well],
+            'depth_meters': depth[well],
+            'water_level_meters': np.round(np.maximum(water_level, 0.1), 2),
+            'measurement_date': dates.astype(str),
+            'quality_ph': np.round(np.clip(base_ph[well] + rng.normal(0, 0.15, size), 5.5, 9.0), 2),
+            'quality_tds': np.round(base_tds[well] * rng.lognormal(0, 0.08, size), 1),
+        })
+        
+        if dirty_fraction > 0:
+            inject_dirty_rows(chunk, dirty_fraction, rng)
+        
+        yield chunk
+
+
+def inject_dirty_rows(chunk: pd.DataFrame, fraction: float, rng: np.random.Generator):
+    """Corrupt a fraction of rows the way real uploads tend to be corrupted."""
+    dirty = np.flatnonzero(rng.random(len(chunk)) < fraction)
+    kinds = rng.integers(0, 6, len(dirty))
+    column = {name: chunk.columns.get_loc(name) for name in chunk.columns}
+    
+    chunk.iloc[dirty[kinds == 0], column['water_level_meters']] = np.nan  # missing reading
+    chunk.iloc[dirty[kinds == 1], column['water_level_meters']] *= -1  # sign error
+    chunk.iloc[dirty[kinds == 2], column['latitude']] = 999.0  # impossible coordinates
+    chunk.iloc[dirty[kinds == 3], column['measurement_date']] = 'not recorded'  # unparseable date
+    chunk.iloc[dirty[kinds == 4], column['location_name']] = None  # missing location
+    
+    # Duplicate readings: repeat the previous row
+    duplicates = dirty[(kinds == 5) & (dirty > 0)]
+    chunk.iloc[duplicates] = chunk.iloc[duplicates - 1].to_numpy()
+
+
+def write_sqlite(chunks: Iterator[pd.DataFrame], well_table: pd.DataFrame, db_path: str) -> Iterator[int]:
+    """Append chunks to groundwater_data in a SQLite file, yielding the running row count."""
+    conn = sqlite3.connect(db_path)
+    
+    # Bulk load: skip fsyncs and the rollback journal; the file can be regenerated
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = OFF")
+    
+    try:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO wells ({', '.join(WELL_COLUMNS)}) VALUES ({', '.join('?' for _ in WELL_COLUMNS)})",
+            well_table[WELL_COLUMNS].itertuples(index=False, name=None)
+        )
+        conn.commit()
+        
+        rows = 0
+        # Dirty data repeats readings; the measurement key keeps the first copy
+        insert_query = (
+            f"INSERT OR IGNORE INTO groundwater_data ({', '.join(MEASUREMENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in MEASUREMENT_COLUMNS)})"
+        )
+        for chunk in chunks:
+            # Column-wise tolist() is about twice as fast as itertuples() for executemany
+            conn.executemany(insert_query, zip(*(chunk[column].tolist() for column in MEASUREMENT_COLUMNS)))
+            conn.commit()
+            rows += len(chunk)
+            yield rows
+    finally:
+        conn.close()
+
+
+def write_postgres(chunks: Iterator[pd.DataFrame], well_table: pd.DataFrame) -> Iterator[int]:
+    """COPY chunks into Postgres, filling the PostGIS point as EWKT; yields the running row count."""
+    from psycopg2.extras import execute_values
+    from postgres_utils import pooled_connection
+    
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        wells = well_table[WELL_COLUMNS].copy()
+        wells['geom'] = 'SRID=4326;POINT(' + wells['longitude'].astype(str) + ' ' + wells['latitude'].astype(str) + ')'
+        execute_values(
+            cursor,
+            f"INSERT INTO wells ({', '.join(WELL_COLUMNS)}, geom) VALUES %s ON CONFLICT (well_id) DO NOTHING",
+            list(wells.itertuples(index=False, name=None))
+        )
+        conn.commit()
+        
+        rows = 0
+        copy_query = f"COPY groundwater_data ({', '.join(MEASUREMENT_COLUMNS)}, geom) FROM STDIN WITH (FORMAT csv)"
+        for chunk in chunks:
+            chunk = chunk[MEASUREMENT_COLUMNS].copy()
+            chunk['geom'] = 'SRID=4326;POINT(' + chunk['longitude'].astype(str) + ' ' + chunk['latitude'].astype(str) + ')'
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+            conn.commit()
+            rows += len(chunk)
+            yield rows
+
+
+def write_parquet(chunks: Iterator[pd.DataFrame], path: str) -> Iterator[int]:
+    """Write chunks as row groups of one Parquet file, yielding the running row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    writer = None
+    try:
+        rows = 0
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+            writer.write_table(table)
+            rows += len(chunk)
+            yield rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_csv(chunks: Iterator[pd.DataFrame], path: str) -> Iterator[int]:
+    """Write chunks to one CSV file, yielding the running row count."""
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=rows == 0)
+            rows += len(chunk)
+            yield rows
+
+
+def generate_dataset(target: str, output: str = None, wells: int = 1000, years: int = 10,
+                     chunk_rows: int = 250_000, seed: int = 42, dirty_fraction: float = 0.0,
+                     start_year: int = 2000) -> int:
+    """Generate a synthetic dataset into sqlite, postgres, parquet or csv."""
+    if target == 'postgres' and dirty_fraction > 0:
+        raise ValueError("Postgres enforces column types; write dirty data to csv, parquet or sqlite")
+    
+    well_table = synthetic_wells(wells, seed)
+    chunks = generate_measurement_chunks(
+        wells, years, chunk_rows=chunk_rows, seed=seed, dirty_fraction=dirty_fraction,
+        start_year=start_year, well_table=well_table
+    )
+    
+    if target == 'sqlite':
+        output = output or "groundwater_dummy.db"
+        if not os.path.exists(output) or os.path.getsize(output) == 0:
+            create_sqlite_database(output).close()
+        progress = write_sqlite(chunks, well_table, output)
+    elif target == 'postgres':
+        progress = write_postgres(chunks, well_table)
+    elif target == 'parquet':
+        progress = write_parquet(chunks, output or "synthetic_groundwater_data.parquet")
+    elif target == 'csv':
+        progress = write_csv(chunks, output or "synthetic_groundwater_data.csv")
+    else:
+        raise ValueError(f"Unknown target: {target}")
+    
+    total = wells * years * 12
+    started = time.perf_counter()
+    rows = 0
+    for rows in progress:
+        elapsed = time.perf_counter() - started
+        print(f"   {rows:,}/{total:,} rows ({rows / elapsed:,.0f} rows/sec)", end='\r', flush=True)
+    
+    print(f"\n✅ Wrote {rows:,} rows for {wells:,} wells to {target} in {time.perf_counter() - started:.1f}s")
+    return rows
+
 def create_sqlite_postgres_utils():
     """Create a SQLite version of postgres_utils.py"""
+    # Never overwrite the maintained module with this minimal template
+    if os.path.exists('sqlite_postgres_utils.py'):
+        print("✅ SQLite version of postgres_utils.py already present")
+        return
+    
     sqlite_utils_content = '''import sqlite3
 import os
 
@@ -224,8 +499,34 @@ def run_sql_query(query: str, params=None):
     
     print("✅ Created SQLite version of postgres_utils.py")
 
+def generate_main(argv=None):
+    """Command line for the synthetic dataset generator."""
+    parser = argparse.ArgumentParser(
+        prog="simple_setup.py generate",
+        description="Generate a synthetic groundwater dataset in chunks"
+    )
+    parser.add_argument("--target", choices=["sqlite", "postgres", "parquet", "csv"], default="sqlite")
+    parser.add_argument("--output", help="database or file path (not used for postgres)")
+    parser.add_argument("--wells", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=10, help="years of monthly readings per well")
+    parser.add_argument("--start-year", type=int, default=2000)
+    parser.add_argument("--chunk-rows", type=int, default=250_000)
+    parser.add_argument("--dirty", type=float, default=0.0, help="fraction of rows to corrupt, e.g. 0.01")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    
+    print(f"🚀 Generating {args.wells * args.years * 12:,} readings for {args.wells:,} wells...")
+    generate_dataset(
+        args.target, args.output, wells=args.wells, years=args.years, chunk_rows=args.chunk_rows,
+        seed=args.seed, dirty_fraction=args.dirty, start_year=args.start_year
+    )
+
 def main():
     """Main setup function."""
+    if sys.argv[1:2] == ["generate"]:
+        generate_main(sys.argv[2:])
+        return
+    
     print("🚀 Setting up SQLite dummy database...")
     print("=" * 50)
     
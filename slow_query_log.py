@@ -0,0 +1,143 @@
+"""
+Slow query log: queries slower than SLOW_QUERY_MS are written as JSON lines
+with their literals and parameters redacted, their duration and row count,
+and (sampled) the plan the database chose for them.
+
+Plans are captured on a background worker after the query has returned, so
+the request never waits for EXPLAIN. Each statement is explained at most once
+per SLOW_QUERY_EXPLAIN_INTERVAL seconds and no more than
+SLOW_QUERY_EXPLAINS_PER_MINUTE plans are captured overall, which keeps the
+extra load bounded even when everything is slow.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable
+
+from metrics import inc
+
+# Queries taking at least this many milliseconds are logged; 0 logs every query, negative disables the log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# Where records go: a file path or "stdout", one JSON object per line
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "stdout")
+
+# Explain the same statement at most once per this many seconds
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+
+# Most plans captured per minute across all statements; 0 never explains
+SLOW_QUERY_EXPLAINS_PER_MINUTE = int(os.getenv("SLOW_QUERY_EXPLAINS_PER_MINUTE", "6"))
+
+# Statement timeout for EXPLAIN ANALYZE, which runs the query again
+SLOW_QUERY_EXPLAIN_TIMEOUT = float(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT", "10"))
+
+# Literals in the SQL text: quoted strings and bare numbers
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])\d+(?:\.\d+)?(?![\w.])")
+_WHITESPACE = re.compile(r"\s+")
+
+_sample_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+# Statement fingerprint -> when its plan was last captured
+_last_explained = {}
+# When each plan in the last minute was captured
+_recent_explains = deque()
+
+# One worker: plans are captured one at a time, behind the queries that triggered them
+_explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+
+
+def redact(query: str) -> str:
+    """The SQL text with string and number literals replaced by ? and whitespace collapsed."""
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def fingerprint(redacted_query: str) -> str:
+    """A short stable id for a statement, the same whatever its literal values."""
+    return hashlib.sha1(redacted_query.encode()).hexdigest()[:12]
+
+
+def sample_explain(statement_id: str):
+    """Decide whether to capture this statement's plan now; returns None if so, else the reason not to."""
+    now = time.monotonic()
+    with _sample_lock:
+        last = _last_explained.get(statement_id)
+        if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return "recently explained"
+        while _recent_explains and now - _recent_explains[0] >= 60:
+            _recent_explains.popleft()
+        if len(_recent_explains) >= SLOW_QUERY_EXPLAINS_PER_MINUTE:
+            return "rate limited"
+        _last_explained[statement_id] = now
+        _recent_explains.append(now)
+        return None
+
+
+def write_record(record: dict):
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        if SLOW_QUERY_LOG_PATH == "stdout":
+            print(line, flush=True)
+        else:
+            with open(SLOW_QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def capture_plan(record: dict, explain: Callable, query: str, params):
+    """Run explain(query, params) and write the record with its plan."""
+    try:
+        start = time.perf_counter()
+        record["plan"] = explain(query, params)
+        record["explain_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    except Exception as e:
+        record["plan_error"] = f"{type(e).__name__}: {e}"
+    try:
+        write_record(record)
+    except Exception as e:
+        print(f"Error writing slow query log: {str(e)}")
+
+
+def record_query(backend: str, query: str, params, duration: float, rows, explain: Callable):
+    """Log a query if it took SLOW_QUERY_MS or longer; explain(query, params) returns its plan when sampled."""
+    if SLOW_QUERY_MS < 0 or duration * 1000 < SLOW_QUERY_MS:
+        return
+    try:
+        text = redact(query)
+        statement_id = fingerprint(text)
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "backend": backend,
+            "fingerprint": statement_id,
+            "duration_ms": round(duration * 1000, 3),
+            "rows": rows if isinstance(rows, int) else len(rows),
+            "query": text,
+            # Parameter values may be user data; only their types are kept
+            "params": [type(value).__name__ for value in (params or ())],
+        }
+        inc("db_slow_queries_total", backend=backend)
+
+        skipped = sample_explain(statement_id) if SLOW_QUERY_EXPLAINS_PER_MINUTE > 0 else "disabled"
+        if skipped is None:
+            _explainer.submit(capture_plan, record, explain, query, params)
+        else:
+            record["plan"] = None
+            record["plan_skipped"] = skipped
+            write_record(record)
+
+    except Exception as e:
+        print(f"Error recording slow query: {str(e)}")
+
+
+def flush(timeout: float = None):
+    """Wait until plans already queued have been captured and written."""
+    _explainer.submit(lambda: None).result(timeout=timeout)
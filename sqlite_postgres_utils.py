@@ -1,17 +1,155 @@
+import itertools
 import sqlite3
 import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+import pandas as pd
+
+from metrics import inc, dec, observe
+from slow_query_log import record_query
 
 DB_PATH = "groundwater_dummy.db"
 
+# Read-only copies of DB_PATH (e.g. refreshed with the backup API) that serve read-only
+# queries, comma-separated; with none configured every query reads DB_PATH
+SQLITE_REPLICA_PATHS = [path.strip() for path in os.getenv("SQLITE_REPLICA_PATHS", "").split(",") if path.strip()]
+
+# Copies last written more than this many seconds before DB_PATH get no reads until refreshed
+SQLITE_REPLICA_MAX_LAG = float(os.getenv("SQLITE_REPLICA_MAX_LAG", "5"))
+
+# Rows fetched at a time by iter_sql_query
+SQLITE_ITERSIZE = int(os.getenv("SQLITE_ITERSIZE", "10000"))
+
+# Compiled statements each connection keeps (sqlite3's per-connection LRU). Connections
+# are kept per thread, so a repeated query is parsed and planned once per thread.
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+# Content hashes of files already ingested, so exact re-uploads can be skipped
+UPLOAD_FILES_TABLE = """
+    CREATE TABLE IF NOT EXISTS upload_files (
+        file_hash CHAR(64) NOT NULL,
+        source_id VARCHAR(100) NOT NULL DEFAULT '',
+        filename VARCHAR(255),
+        rows_stored INTEGER,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (file_hash, source_id)
+    )
+"""
+
+# Database files whose schema ensure_upload_schema has already checked
+_upload_schema_ready = set()
+_upload_schema_lock = threading.Lock()
+
+# This thread's connections: (path, read-only) -> (connection, inode, statements seen)
+_connections = threading.local()
+
+_replica_turn = itertools.count()
+
+
+def last_write_time(path: str) -> float:
+    """When a database file (or its write-ahead log) was last written."""
+    times = [os.stat(path).st_mtime]
+    if os.path.exists(f"{path}-wal"):
+        times.append(os.stat(f"{path}-wal").st_mtime)
+    return max(times)
+
+
+def replica_lag(path: str) -> float:
+    """Seconds a replica file is behind DB_PATH; inf if it is missing."""
+    try:
+        return max(0.0, last_write_time(DB_PATH) - last_write_time(path))
+    except OSError:
+        return float("inf")
+
+
+def choose_read_path() -> str:
+    """A replica within SQLITE_REPLICA_MAX_LAG of DB_PATH, taking turns, or DB_PATH if none is."""
+    fresh = [path for path in SQLITE_REPLICA_PATHS if replica_lag(path) <= SQLITE_REPLICA_MAX_LAG]
+    if not fresh:
+        inc("db_read_routing_total", backend="sqlite", target="primary")
+        return DB_PATH
+    inc("db_read_routing_total", backend="sqlite", target="replica")
+    return fresh[next(_replica_turn) % len(fresh)]
+
+
+def get_connection(readonly: bool = False, path: str = None) -> sqlite3.Connection:
+    """This thread's connection to a database file (DB_PATH by default), opened on first use and reopened if the file was replaced."""
+    path = path or DB_PATH
+    if not os.path.exists(path):
+        raise Exception(f"Database file {path} not found. Please run simple_setup.py first.")
+    
+    cache = getattr(_connections, "cache", None)
+    if cache is None:
+        cache = _connections.cache = {}
+    key = (path, readonly)
+    inode = os.stat(path).st_ino
+    entry = cache.get(key)
+    if entry is not None and entry[1] == inode:
+        return entry[0]
+    if entry is not None:
+        entry[0].close()
+    
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(path, cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+    cache[key] = (conn, inode, OrderedDict())
+    return conn
+
+
+def count_statement(query: str, readonly: bool = False, path: str = None):
+    """Count a statement cache hit or miss, mirroring sqlite3's LRU keyed by SQL text."""
+    seen = _connections.cache[(path or DB_PATH, readonly)][2]
+    if query in seen:
+        seen.move_to_end(query)
+        inc("db_statement_cache_total", backend="sqlite", result="hit")
+    else:
+        seen[query] = True
+        if len(seen) > SQLITE_STATEMENT_CACHE_SIZE:
+            seen.popitem(last=False)
+        inc("db_statement_cache_total", backend="sqlite", result="miss")
+
+
+def release_connection(conn: sqlite3.Connection):
+    """Return a connection to its idle state: nothing left uncommitted and no deadline."""
+    if conn.in_transaction:
+        conn.rollback()
+    conn.set_progress_handler(None, 0)
+
+
+def explain_query(query: str, params=None, db_path: str = None) -> list:
+    """SQLite's EXPLAIN QUERY PLAN for a query, one line per step, indented under its parent."""
+    # Runs on the slow query log's worker, against the file the query itself ran on
+    conn = sqlite3.connect(f"file:{db_path or DB_PATH}?mode=ro", uri=True)
+    try:
+        steps = conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+    finally:
+        conn.close()
+    
+    depths = {0: -1}
+    lines = []
+    for step_id, parent_id, _, detail in steps:
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        lines.append("  " * depths[step_id] + detail)
+    return lines
+
+
 def run_sql_query(query: str, params=None):
     """Run a SQL query on SQLite and return results."""
     if not os.path.exists(DB_PATH):
         raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
+    inc("db_connections_in_use", backend="sqlite")
+    start = time.perf_counter()
     
     try:
+        count_statement(query)
         if params:
             cursor.execute(query, params)
         else:
@@ -24,7 +162,186 @@ def run_sql_query(query: str, params=None):
         else:
             rows = cursor.fetchall()
         
+        record_query("sqlite", query, params, time.perf_counter() - start, rows, partial(explain_query, db_path=DB_PATH))
         return rows
         
     finally:
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="sqlite")
+        dec("db_connections_in_use", backend="sqlite")
+        release_connection(conn)
+
+
+def run_bulk_upsert(query: str, rows: list) -> tuple:
+    """Run an INSERT ... ON CONFLICT DO UPDATE into groundwater_data for many rows and return (new, updated)."""
+    if not os.path.exists(DB_PATH):
+        raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
+    
+    conn = sqlite3.connect(DB_PATH)
+    inc("db_connections_in_use", backend="sqlite")
+    start = time.perf_counter()
+    
+    try:
+        with conn:
+            # Take the write lock first so no other writer adds ids between the two reads
+            conn.execute("BEGIN IMMEDIATE")
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM groundwater_data").fetchone()[0]
+            
+            # rowcount covers inserted rows and rows the DO UPDATE changed; new rows get fresh ids
+            changed = conn.executemany(query, rows).rowcount
+            new = conn.execute("SELECT COUNT(*) FROM groundwater_data WHERE id > ?", (last_id,)).fetchone()[0]
+        return new, changed - new
+        
+    finally:
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="sqlite")
+        dec("db_connections_in_use", backend="sqlite")
+        conn.close()
+
+
+def ensure_upload_schema():
+    """Add the measurement key and the upload log to a database created before upserts (once per file)."""
+    if DB_PATH in _upload_schema_ready:
+        return
+    if not os.path.exists(DB_PATH):
+        raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
+    
+    # Concurrent first uploads migrate one at a time
+    with _upload_schema_lock:
+        if DB_PATH in _upload_schema_ready:
+            return
+        
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            # BEGIN IMMEDIATE also keeps another process from migrating the file at the same time
+            conn.isolation_level = None
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(groundwater_data)")]
+                if 'source_id' not in columns:
+                    conn.execute("ALTER TABLE groundwater_data ADD COLUMN source_id VARCHAR(100) NOT NULL DEFAULT ''")
+                
+                key_exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_groundwater_measurement_key'"
+                ).fetchone()
+                if not key_exists:
+                    # Readings uploaded twice before the key existed: keep the latest copy
+                    removed = conn.execute("""
+                        DELETE FROM groundwater_data
+                        WHERE measurement_date IS NOT NULL AND id NOT IN (
+                            SELECT MAX(id) FROM groundwater_data GROUP BY well_id, measurement_date, source_id
+                        )
+                    """).rowcount
+                    print(f"Removed {removed} duplicate readings before adding the measurement key")
+                    conn.execute("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS idx_groundwater_measurement_key
+                        ON groundwater_data (well_id, measurement_date, source_id)
+                    """)
+                
+                conn.execute(UPLOAD_FILES_TABLE)
+            _upload_schema_ready.add(DB_PATH)
+        
+        finally:
+            conn.close()
+
+
+def run_readonly_query(query: str, params=None, timeout: float = 5):
+    """Run a SELECT on SQLite (a replica if one is fresh enough) read-only, aborting it after timeout seconds."""
+    if not os.path.exists(DB_PATH):
+        raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
+    
+    path = choose_read_path()
+    conn = get_connection(readonly=True, path=path)
+    inc("db_connections_in_use", backend="sqlite")
+    start = time.perf_counter()
+    
+    # Interrupt the statement once the deadline passes
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    
+    try:
+        cursor = conn.cursor()
+        count_statement(query, readonly=True, path=path)
+        
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        
+        rows = cursor.fetchall()
+        record_query("sqlite", query, params, time.perf_counter() - start, rows, partial(explain_query, db_path=path))
+        return rows
+        
+    finally:
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="sqlite")
+        dec("db_connections_in_use", backend="sqlite")
+        release_connection(conn)
+
+
+def run_readonly_frame(query: str, params=None, timeout: float = 5, itersize: int = None) -> pd.DataFrame:
+    """Run a SELECT on SQLite read-only and return the result as a DataFrame, converted batch by batch."""
+    if not os.path.exists(DB_PATH):
+        raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
+    itersize = itersize or SQLITE_ITERSIZE
+    
+    path = choose_read_path()
+    conn = get_connection(readonly=True, path=path)
+    inc("db_connections_in_use", backend="sqlite")
+    start = time.perf_counter()
+    
+    # Interrupt the statement once the deadline passes
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    
+    try:
+        cursor = conn.cursor()
+        count_statement(query, readonly=True, path=path)
+        cursor.execute(query, params or ())
+        names = [column[0] for column in cursor.description]
+        
+        # Convert batch by batch, so at most itersize row tuples are alive at once
+        parts = []
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            parts.append(pd.DataFrame(rows, columns=names))
+        
+        if not parts:
+            frame = pd.DataFrame(columns=names)
+        else:
+            # A batch of all-NULL values comes out as object; re-infer once the batches are joined
+            frame = pd.concat(parts, ignore_index=True).infer_objects()
+        record_query("sqlite", query, params, time.perf_counter() - start, len(frame), partial(explain_query, db_path=path))
+        return frame
+        
+    finally:
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="sqlite")
+        dec("db_connections_in_use", backend="sqlite")
+        release_connection(conn)
+
+
+def iter_sql_query(query: str, params=None, itersize: int = None):
+    """Run a SELECT on SQLite on a read-only connection, yielding lists of up to itersize rows."""
+    if not os.path.exists(DB_PATH):
+        raise Exception(f"Database file {DB_PATH} not found. Please run simple_setup.py first.")
+    itersize = itersize or SQLITE_ITERSIZE
+    
+    # Streaming responses resume the generator on whichever worker thread is free
+    conn = sqlite3.connect(f"file:{choose_read_path()}?mode=ro", uri=True, check_same_thread=False)
+    inc("db_connections_in_use", backend="sqlite")
+    start = time.perf_counter()
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params or ())
+        
+        # SQLite steps the statement as rows are fetched, so only one batch is in memory
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+        
+    finally:
+        observe("db_query_duration_seconds", time.perf_counter() - start, backend="sqlite")
+        dec("db_connections_in_use", backend="sqlite")
         conn.close()
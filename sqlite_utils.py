@@ -1,10 +1,15 @@
 import sqlite3
 import re
 from typing import List
+from tracing import span, record_error
 
 # SQLite database file
 DB_FILE = "groundwater_search.db"
 
+# BM25 scores of the static sample sentences are scaled by this, so passages built
+# from real data (facts.py) rank above a sample sentence that matches as well
+SAMPLE_RANK_WEIGHT = 0.5
+
 def initialize_sqlite():
     """Initialize SQLite database for BM25 search."""
     try:
@@ -80,40 +85,67 @@ def add_sample_documents():
     except Exception as e:
         print(f"Error adding sample documents: {str(e)}")
 
+def build_fts_query(query: str) -> str:
+    """Turn a free-text question into an FTS5 OR query ('' if it has no terms)."""
+    clean_query = re.sub(r'[^\w\s]', ' ', query.lower())
+    search_terms = clean_query.split()
+    return ' OR '.join([f'"{term}"' for term in search_terms])
+
+def bm25_search_batch(queries: List[str], limit: int = 3) -> List[List[str]]:
+    """Perform BM25 search for many queries over a single SQLite connection."""
+    if not queries:
+        return []
+    
+    with span("bm25_search", backend="sqlite_fts5", queries=len(queries)) as stage:
+        try:
+            conn = sqlite3.connect(DB_FILE)
+        except Exception as e:
+            print(f"Error in BM25 search: {str(e)}")
+            record_error(e)
+            return [["Groundwater monitoring shows normal levels across all districts."] for _ in queries]
+        
+        results = []
+        try:
+            cursor = conn.cursor()
+            
+            for query in queries:
+                fts_query = build_fts_query(query)
+                
+                if not fts_query:
+                    results.append([])
+                    continue
+                
+                try:
+                    # Search using FTS5
+                    # bm25() is negative, so scaling a sample's score towards zero ranks it lower
+                    cursor.execute('''
+                        SELECT documents_fts.text,
+                               bm25(documents_fts) * CASE WHEN json_extract(documents.metadata, '$.source') = 'sample'
+                                                          THEN ? ELSE 1 END as rank
+                        FROM documents_fts 
+                        JOIN documents ON documents.id = documents_fts.rowid
+                        WHERE documents_fts MATCH ?
+                        ORDER BY rank
+                        LIMIT ?
+                    ''', (SAMPLE_RANK_WEIGHT, fts_query, limit))
+                    
+                    # Keep just the text content
+                    results.append([row[0] for row in cursor.fetchall()])
+                    
+                except Exception as e:
+                    print(f"Error in BM25 search: {str(e)}")
+                    record_error(e)
+                    results.append(["Groundwater monitoring shows normal levels across all districts."])
+            
+            stage.set(rows=sum(len(texts) for texts in results))
+            return results
+            
+        finally:
+            conn.close()
+
 def bm25_search(query: str, limit: int = 3) -> List[str]:
     """Perform BM25 search on groundwater documents."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Clean and prepare query
-        clean_query = re.sub(r'[^\w\s]', ' ', query.lower())
-        search_terms = clean_query.split()
-        
-        if not search_terms:
-            return []
-        
-        # Build FTS query
-        fts_query = ' OR '.join([f'"{term}"' for term in search_terms])
-        
-        # Search using FTS5
-        cursor.execute('''
-            SELECT text, bm25(documents_fts) as rank
-            FROM documents_fts 
-            WHERE documents_fts MATCH ?
-            ORDER BY rank
-            LIMIT ?
-        ''', (fts_query, limit))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Return just the text content
-        return [result[0] for result in results]
-        
-    except Exception as e:
-        print(f"Error in BM25 search: {str(e)}")
-        return ["Groundwater monitoring shows normal levels across all districts."]
+    return bm25_search_batch([query], limit)[0]
 
 # Initialize SQLite on import
 initialize_sqlite()
\ No newline at end of file
@@ -0,0 +1,33 @@
+import json
+from typing import Iterable, Iterator, Tuple
+
+
+def format_sse_event(event: str, data) -> str:
+    """Format a single Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse_events(lines: Iterable) -> Iterator[Tuple[str, object]]:
+    """Parse (event, data) pairs from an iterable of SSE lines."""
+    event = "message"
+    data_lines = []
+    
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+        
+        # A blank line terminates the current event
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event = "message"
+            data_lines = []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+    
+    # Flush an event that was not followed by a blank line
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test the analytics engine: planned aggregation questions give the same
+answers on DuckDB as on SQLite, DuckDB attaches the SQLite file read-only,
+and without DuckDB available queries still run on SQLite.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+import pytest
+
+import analytics_engine
+import simple_setup
+import sqlite_postgres_utils
+from text_to_sql import plan_sql, validate_sql
+
+QUESTIONS = [
+    "average water level by location",
+    "monthly TDS trend in 2000",
+    "how many measurements per well with TDS above 500",
+]
+
+
+def planned_rows(dialect: str, schema: dict) -> list:
+    results = []
+    for question in QUESTIONS:
+        plan = plan_sql(question, schema, dialect)
+        rows = analytics_engine.run_analytics_query(validate_sql(plan["sql"], schema), plan["params"])
+        results.append(sorted((label, round(value, 6)) for label, value in rows))
+    return results
+
+
+def generated_database(workdir: str) -> tuple:
+    db_path = os.path.join(workdir, "analytics.db")
+    simple_setup.generate_dataset("sqlite", output=db_path, wells=20, years=2, seed=5)
+    schema = {"tables": {"groundwater_data": [], "wells": [], "regions": []},
+              "locations": [], "region_types": []}
+    return db_path, schema
+
+
+def test_sqlite_fallback():
+    """Without a usable DuckDB, aggregations run on SQLite."""
+    original = (sqlite_postgres_utils.DB_PATH, analytics_engine.ANALYTICS_ENGINE, analytics_engine._duckdb_ready)
+    with tempfile.TemporaryDirectory() as workdir:
+        sqlite_postgres_utils.DB_PATH, schema = generated_database(workdir)
+        try:
+            analytics_engine.ANALYTICS_ENGINE = "sqlite"
+            assert analytics_engine.analytics_dialect() == "sqlite"
+            expected = planned_rows("sqlite", schema)
+            assert all(expected), expected
+
+            analytics_engine.ANALYTICS_ENGINE = "duckdb"
+            analytics_engine._duckdb_ready = False
+            assert analytics_engine.analytics_dialect() == "sqlite"
+            assert planned_rows("sqlite", schema) == expected
+        finally:
+            (sqlite_postgres_utils.DB_PATH, analytics_engine.ANALYTICS_ENGINE,
+             analytics_engine._duckdb_ready) = original
+    print("✅ Without DuckDB, aggregations fall back to SQLite")
+
+
+def test_duckdb_matches_sqlite():
+    """Planned aggregations give the same rows on DuckDB as on SQLite."""
+    pytest.importorskip("duckdb")
+    if not analytics_engine.install_extensions() or not analytics_engine.duckdb_ready():
+        pytest.skip("DuckDB sqlite extension unavailable")
+
+    original = (sqlite_postgres_utils.DB_PATH, analytics_engine.ANALYTICS_ENGINE)
+    with tempfile.TemporaryDirectory() as workdir:
+        sqlite_postgres_utils.DB_PATH, schema = generated_database(workdir)
+        try:
+            analytics_engine.ANALYTICS_ENGINE = "sqlite"
+            expected = planned_rows("sqlite", schema)
+
+            analytics_engine.ANALYTICS_ENGINE = "duckdb"
+            assert analytics_engine.analytics_dialect() == "duckdb"
+            assert planned_rows("duckdb", schema) == expected
+            frame = analytics_engine.run_analytics_frame("SELECT COUNT(*) AS n FROM groundwater_data")
+            assert frame["n"][0] == sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM groundwater_data")[0][0]
+        finally:
+            sqlite_postgres_utils.DB_PATH, analytics_engine.ANALYTICS_ENGINE = original
+    print("✅ DuckDB aggregations match SQLite")
+
+
+def test_attach_fixture():
+    """DuckDB attaches sample_groundwater_data.csv, loaded into SQLite, read-only under the planner's names."""
+    pytest.importorskip("duckdb")
+    if not analytics_engine.install_extensions() or not analytics_engine.duckdb_ready():
+        pytest.skip("DuckDB sqlite extension unavailable")
+
+    sample = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_groundwater_data.csv"))
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "fixture.db")
+        conn = simple_setup.create_sqlite_database(db_path)
+        sample.to_sql("groundwater_data", conn, if_exists="append", index=False)
+        conn.commit()
+        conn.close()
+
+        database = analytics_engine.open_database(db_path)
+        try:
+            rows = database.execute(
+                "SELECT location_name, AVG(quality_tds) FROM groundwater_data GROUP BY location_name"
+            ).fetchall()
+            expected = sample.groupby("location_name")["quality_tds"].mean()
+            assert {name: round(value, 6) for name, value in rows} == {
+                name: round(value, 6) for name, value in expected.items()
+            }
+            assert database.execute("SELECT COUNT(*) FROM wells").fetchone()[0] == 0
+
+            # The attachment is read-only: uploads stay on SQLite
+            with pytest.raises(Exception):
+                database.execute("INSERT INTO store.wells (well_id, well_name) VALUES ('W999', 'x')")
+        finally:
+            database.close()
+
+        # And nothing was written to the file
+        check = sqlite3.connect(db_path)
+        try:
+            assert check.execute("SELECT COUNT(*) FROM wells").fetchone()[0] == 0
+        finally:
+            check.close()
+    print("✅ DuckDB attaches the SQLite fixture read-only")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing the analytics engine")
+    print("=" * 50)
+    test_sqlite_fallback()
+    for test in (test_duckdb_matches_sqlite, test_attach_fixture):
+        try:
+            test()
+        except pytest.skip.Exception as e:
+            print(f"⏭️ {test.__name__} skipped: {e.msg}")
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
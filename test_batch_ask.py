@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test batch question answering: /ask/batch returns one answer per question,
+in order, the same answers /ask gives one question at a time.
+"""
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+from fastapi.testclient import TestClient
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+import generation_cache
+import llm_utils
+import qdrant_utils
+import sqlite_postgres_utils
+import sqlite_utils
+import text_to_sql
+import tools_sqlite
+from llm_stub_server import start_stub_server
+
+STUB_ANSWER = "Downtown wells read pH 7.2 on average."
+
+# In-tree readings the analytical questions run against
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_groundwater_data.csv")
+
+
+@contextmanager
+def sqlite_pipeline(**stub_options):
+    """Run the SQLite pipeline on sample_groundwater_data.csv, a fresh search index and answer cache,
+    an empty vector store (its embeddings are random) and the stub LLM; yields the stub."""
+    originals = (sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE, generation_cache.CACHE_DB_FILE,
+                 qdrant_utils.client, llm_utils.OLLAMA_HOST)
+    with tempfile.TemporaryDirectory() as workdir:
+        sqlite_postgres_utils.DB_PATH = os.path.join(workdir, "wells.db")
+        conn = sqlite3.connect(sqlite_postgres_utils.DB_PATH)
+        pd.read_csv(SAMPLE_DATA).to_sql("groundwater_data", conn, index=False)
+        conn.close()
+        sqlite_utils.DB_FILE = os.path.join(workdir, "search.db")
+        sqlite_utils.initialize_sqlite()
+        generation_cache.CACHE_DB_FILE = os.path.join(workdir, "cache.db")
+        generation_cache.initialize_generation_cache()
+        qdrant_utils.client = QdrantClient(location=":memory:")
+        qdrant_utils.client.create_collection(qdrant_utils.COLLECTION_NAME,
+                                              vectors_config=VectorParams(size=qdrant_utils.VECTOR_SIZE, distance=Distance.COSINE))
+        text_to_sql.refresh_schema("sqlite")
+
+        stub = start_stub_server(**{"answer": STUB_ANSWER, **stub_options})
+        llm_utils.OLLAMA_HOST = f"http://127.0.0.1:{stub.server_port}"
+        llm_utils._unavailable_until = 0.0
+        try:
+            yield stub
+        finally:
+            stub.shutdown()
+            (sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE, generation_cache.CACHE_DB_FILE,
+             qdrant_utils.client, llm_utils.OLLAMA_HOST) = originals
+            text_to_sql.refresh_schema("sqlite")
+
+
+def test_batch_matches_single_answers():
+    """Every route answers in place, and each answer is what /ask gives for that question."""
+    questions = [
+        "What is the pH in the downtown area?",
+        "Show a map of the wells",
+        "average TDS by location",
+        "How is water quality in the north district?",
+        "What is the pH in the downtown area?",
+    ]
+    with sqlite_pipeline() as stub:
+        answers = tools_sqlite.run_rag_pipeline_batch(questions)
+
+        assert len(answers) == len(questions)
+        assert answers[1] == tools_sqlite.MAP_PLACEHOLDER
+        assert "TDS" in answers[2] and answers[2] != STUB_ANSWER, answers[2]
+        assert answers[0] == answers[3] == answers[4] == STUB_ANSWER, answers
+        # Hybrid questions reached the model; the others did not
+        assert {request["prompt"].rsplit("Question: ", 1)[-1].split("\n")[0] for request in stub.requests} == {
+            questions[0], questions[3]
+        }
+
+        assert [tools_sqlite.run_rag_pipeline(question) for question in questions] == answers
+    print("✅ Batch answers match single answers, in order")
+
+
+def test_batch_endpoint():
+    """POST /ask/batch returns the pipeline's answers, and an empty batch is fine."""
+    from server_sqlite import app
+
+    questions = ["Show a map of the wells", "What is the pH in the downtown area?"]
+    with sqlite_pipeline():
+        client = TestClient(app)
+        response = client.post("/ask/batch", json={"questions": questions})
+        assert response.status_code == 200
+        assert response.json() == {"answers": [tools_sqlite.MAP_PLACEHOLDER, STUB_ANSWER]}
+
+        assert client.post("/ask/batch", json={"questions": []}).json() == {"answers": []}
+        assert client.post("/ask/batch", json={"questions": "not a list"}).status_code == 422
+    print("✅ /ask/batch answered")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing batch questions")
+    print("=" * 50)
+    test_batch_matches_single_answers()
+    test_batch_endpoint()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
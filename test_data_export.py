@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test streaming reads: the /export endpoint (filters, CSV and Parquet encoding,
+on-the-fly compression) and query results returned as DataFrames.
+"""
+
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+import pyarrow.parquet as pq
+import requests
+from fastapi import FastAPI
+
+import data_export
+import postgres_utils
+import simple_setup
+import sqlite_postgres_utils
+from benchmark import start_api_server
+
+
+def test_export():
+    """Selections stream in small batches and decode to the same rows in every format."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "export.db")
+        simple_setup.generate_dataset("sqlite", output=db_path, wells=30, years=2, seed=7)
+
+        original_path = sqlite_postgres_utils.DB_PATH
+        original_batch = data_export.EXPORT_BATCH_ROWS
+        sqlite_postgres_utils.DB_PATH = db_path
+        # Small batches so every export spans many fetches, row groups and compressed blocks
+        data_export.EXPORT_BATCH_ROWS = 50
+
+        app = FastAPI()
+        data_export.install_data_export(app, sqlite_postgres_utils.iter_sql_query, "sqlite")
+        server, thread = start_api_server(app)
+        url = f"http://127.0.0.1:{server.config.port}/export"
+        try:
+            total = sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM groundwater_data")[0][0]
+            assert total > 10 * data_export.EXPORT_BATCH_ROWS
+
+            response = requests.get(url)
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/csv")
+            rows = list(csv.reader(io.StringIO(response.text)))
+            assert rows[0] == data_export.EXPORT_COLUMNS
+            assert len(rows) == total + 1
+
+            # Filters combine; gzip decodes to the same CSV as the plain export
+            well_id, region = rows[1][0], rows[1][1]
+            params = {"well_id": [well_id, "NO_SUCH_WELL"], "region": region.split()[0].upper(),
+                      "start_date": "2000-01-01", "end_date": "2000-06-30"}
+            plain = requests.get(url, params=params).content
+            zipped = requests.get(url, params={**params, "compression": "gzip"})
+            assert zipped.headers["content-disposition"].endswith('groundwater_export.csv.gz"')
+            assert gzip.decompress(zipped.content) == plain
+            selected = list(csv.DictReader(io.StringIO(plain.decode())))
+            assert len(selected) == 6, len(selected)
+            assert {row["well_id"] for row in selected} == {well_id}
+            assert all(row["measurement_date"] <= "2000-06-30" for row in selected)
+
+            # Parquet: one row group per batch, typed dates
+            response = requests.get(url, params={"format": "parquet"})
+            parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+            assert parquet_file.metadata.num_rows == total
+            assert parquet_file.metadata.num_row_groups == -(-total // data_export.EXPORT_BATCH_ROWS)
+            table = parquet_file.read()
+            assert str(table.schema.field("measurement_date").type) == "date32[day]"
+
+            # A bounding box around one well's coordinates
+            lat, lon = float(rows[1][2]), float(rows[1][3])
+            bbox = f"{lon - 1e-6},{lat - 1e-6},{lon + 1e-6},{lat + 1e-6}"
+            boxed = list(csv.DictReader(io.StringIO(requests.get(url, params={"bbox": bbox}).text)))
+            assert boxed and {row["well_id"] for row in boxed} == {well_id}
+
+            for bad in [{"format": "xml"}, {"compression": "brotli"}, {"bbox": "1,2,3"},
+                        {"start_date": "2001-01-01", "end_date": "2000-01-01"}]:
+                assert requests.get(url, params=bad).status_code in (400, 422), bad
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            sqlite_postgres_utils.DB_PATH = original_path
+            data_export.EXPORT_BATCH_ROWS = original_batch
+    print("✅ Exports streamed, filtered and compressed")
+
+
+def test_readonly_frame():
+    """Query results come back as typed columns matching the row-tuple results."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "frame.db")
+        simple_setup.generate_dataset("sqlite", output=db_path, wells=10, years=1, seed=3)
+        original_path = sqlite_postgres_utils.DB_PATH
+        sqlite_postgres_utils.DB_PATH = db_path
+        try:
+            query = ("SELECT well_id, measurement_date, water_level_meters, quality_ph, quality_ph AS ph "
+                     "FROM groundwater_data WHERE well_id = ? ORDER BY id")
+            rows = sqlite_postgres_utils.run_readonly_query(query, ("W000001",))
+            frame = sqlite_postgres_utils.run_readonly_frame(query, ("W000001",), itersize=5)
+            assert list(frame.columns) == ["well_id", "measurement_date", "water_level_meters", "quality_ph", "ph"]
+            assert [tuple(row) for row in frame.itertuples(index=False)] == rows
+            assert frame["water_level_meters"].dtype == "float64"
+
+            empty = sqlite_postgres_utils.run_readonly_frame(query, ("NO_SUCH_WELL",))
+            assert empty.empty and list(empty.columns) == list(frame.columns)
+        finally:
+            sqlite_postgres_utils.DB_PATH = original_path
+    print("✅ Query results read into columns")
+
+
+def test_postgres_frame_types():
+    """Postgres batches take their declared column types: numeric and dates are not left as objects."""
+    names = ["well_id", "measurement_date", "water_level_meters", "readings"]
+    # varchar, date, numeric, int8
+    dtypes = postgres_utils.frame_dtypes(names, [1043, 1082, 1700, 20])
+    assert dtypes == {"measurement_date": "datetime64[ns]", "water_level_meters": "float64", "readings": "Int64"}
+
+    batches = [
+        [("W1", date(2024, 1, 1), Decimal("12.50"), 3)],
+        [("W2", None, None, None)],
+    ]
+    parts = [pd.DataFrame(rows, columns=names).astype(dtypes) for rows in batches]
+    frame = postgres_utils.frame_from_batches(parts, names, dtypes)
+    assert list(frame.index) == [0, 1]
+    assert frame["measurement_date"].dtype == "datetime64[ns]" and frame["measurement_date"].isna()[1]
+    assert frame["water_level_meters"].tolist()[0] == 12.5 and frame["readings"].dtype == "Int64"
+
+    empty = postgres_utils.frame_from_batches([], names, dtypes)
+    assert empty.empty and list(empty.columns) == names
+    assert empty["measurement_date"].dtype == "datetime64[ns]"
+    print("✅ Postgres results read in their declared types")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing data export")
+    print("=" * 50)
+    test_export()
+    test_readonly_frame()
+    test_postgres_frame_types()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
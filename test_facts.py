@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test the precomputed fact passages: built from current data, indexed for
+keyword and vector search, and regenerated for the wells an upload touched.
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+
+import httpx
+import pandas as pd
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+import generation_cache
+import qdrant_utils
+import simple_setup
+import sqlite_postgres_utils
+import sqlite_utils
+import text_to_sql
+import tools_sqlite
+import well_analytics
+
+
+def fact_points(client) -> dict:
+    points, _ = client.scroll(qdrant_utils.COLLECTION_NAME, limit=1000, with_payload=True)
+    return {point.payload["metadata"]["fact"]: point.payload["text"] for point in points}
+
+
+def test_facts():
+    """Facts match the data, follow uploads, and replace rather than duplicate passages."""
+    originals = (sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE, generation_cache.CACHE_DB_FILE, qdrant_utils.client)
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "wells.db")
+        simple_setup.generate_dataset("sqlite", output=db_path, wells=12, years=3, seed=5)
+        sqlite_postgres_utils.DB_PATH = db_path
+        sqlite_utils.DB_FILE = os.path.join(workdir, "search.db")
+        sqlite_utils.initialize_sqlite()
+        generation_cache.CACHE_DB_FILE = os.path.join(workdir, "cache.db")
+        generation_cache.initialize_generation_cache()
+        client = qdrant_utils.client = QdrantClient(location=":memory:")
+        client.create_collection(qdrant_utils.COLLECTION_NAME,
+                                 vectors_config=VectorParams(size=qdrant_utils.VECTOR_SIZE, distance=Distance.COSINE))
+        well_analytics.refresh_well_stats("sqlite")
+        try:
+            written = tools_sqlite.build_facts()
+            stats = well_analytics.get_well_stats("sqlite", sqlite_postgres_utils.run_sql_query)
+            locations = sorted(stats["location_name"].dropna().unique())
+            assert written == len(stats) + len(locations) + 1, written
+
+            # Location averages match the data they summarise
+            well_id = stats.index[0]
+            location = stats.loc[well_id, "location_name"]
+            (average,), = sqlite_postgres_utils.run_sql_query(
+                "SELECT AVG(water_level_meters) FROM groundwater_data WHERE location_name = ? AND water_level_meters > 0",
+                (location,)
+            )
+            top = sqlite_utils.bm25_search(f"average water level in {location}", limit=1)[0]
+            assert top.startswith(f"{location} groundwater summary: average water level {average:,.2f} m"), top
+            assert set(fact_points(client)) == set(
+                [f"well:{well_id}" for well_id in stats.index] + [f"location:{name}" for name in locations] + ["overview"]
+            )
+            # A sample sentence matching as many terms ranks below the fact, but is still found
+            commercial = sqlite_utils.bm25_search("average water level in Commercial District", limit=5)
+            assert commercial[0].startswith("Commercial District groundwater summary"), commercial
+            assert "Commercial district wells at 16.8 meters depth with 510 mg/L TDS" in commercial[1:], commercial
+
+            # Nothing changed, nothing rewritten
+            assert tools_sqlite.build_facts() == 0
+
+            # The SQL planner's schema cache does not know the upload's new location yet
+            schema = text_to_sql.get_schema("sqlite", sqlite_postgres_utils.run_sql_query)
+            assert "Lakeside" not in schema["locations"]
+
+            # A cached answer built on the location's passage
+            key = generation_cache.cache_key("average water level", [top])
+            generation_cache.store_answer(key, [top], "old answer")
+
+            # An upload moves one well's readings up sharply and adds a new well
+            readings = pd.DataFrame({
+                "well_id": [well_id] * 3 + ["W999"],
+                "location_name": [location] * 3 + ["Lakeside"],
+                "latitude": 12.9, "longitude": 77.6,
+                "water_level_meters": [90.0, 91.0, 92.0, 5.0],
+                "measurement_date": ["2003-01-15", "2003-02-15", "2003-03-15", "2003-03-15"],
+                "quality_tds": [450.0, 450.0, 450.0, 700.0],
+            })
+            result = tools_sqlite.process_uploaded_data(readings.to_csv(index=False).encode(), "late.csv", "logger-3")
+            assert result["new"] == 4, result
+
+            top = sqlite_utils.bm25_search(f"average water level in {location}", limit=1)[0]
+            (average,), = sqlite_postgres_utils.run_sql_query(
+                "SELECT AVG(water_level_meters) FROM groundwater_data WHERE location_name = ? AND water_level_meters > 0",
+                (location,)
+            )
+            assert f"average water level {average:,.2f} m" in top, top
+            lakeside = sqlite_utils.bm25_search("Lakeside groundwater summary", limit=1)[0]
+            assert lakeside.startswith("Lakeside groundwater summary") and "TDS above 500 mg/L: W999" in lakeside, lakeside
+            assert "W999" in fact_points(client)["overview"]
+            schema = text_to_sql.get_schema("sqlite", sqlite_postgres_utils.run_sql_query)
+            assert "Lakeside" in schema["locations"], schema["locations"]
+
+            # Replaced passages are gone from both indexes and from the answer cache
+            conn = sqlite3.connect(sqlite_utils.DB_FILE)
+            try:
+                (fact_docs,), = conn.execute("SELECT COUNT(*) FROM documents WHERE metadata LIKE '%\"facts\"%'")
+                (all_docs,), = conn.execute("SELECT COUNT(*) FROM documents")
+                # Fails if the index still holds terms of replaced passages
+                conn.execute("INSERT INTO documents_fts(documents_fts, rank) VALUES('integrity-check', 1)")
+            finally:
+                conn.close()
+            # The static sample sentences stay searchable next to the facts
+            assert fact_docs == len(fact_points(client)) == len(stats) + len(locations) + 3
+            assert all_docs == fact_docs + 8
+            assert generation_cache.get_cached_answer(key) is None
+        finally:
+            (sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE,
+             generation_cache.CACHE_DB_FILE, qdrant_utils.client) = originals
+            well_analytics.refresh_well_stats("sqlite")
+            text_to_sql.refresh_schema("sqlite")
+    print("✅ Fact passages built and refreshed after an upload")
+
+
+def test_upload_off_event_loop():
+    """/upload processes the file (and refreshes facts) on a worker thread; other requests are served meanwhile."""
+    import server_sqlite
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_processing(file_content, filename, source_id):
+        started.set()
+        release.wait(5)
+        return {"message": f"Successfully processed {filename}"}
+
+    async def exercise():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server_sqlite.app), base_url="http://test") as client:
+            upload = asyncio.create_task(client.post("/upload", files={"file": ("late.csv", b"well_id\nW1\n")}))
+            assert await asyncio.to_thread(started.wait, 5)
+            live = await client.get("/health/live")
+            served_during_upload = not upload.done()
+            release.set()
+            return live, served_during_upload, await upload
+
+    original = server_sqlite.process_uploaded_data
+    server_sqlite.process_uploaded_data = slow_processing
+    try:
+        live, served_during_upload, response = asyncio.run(exercise())
+    finally:
+        server_sqlite.process_uploaded_data = original
+    assert live.status_code == 200 and served_during_upload
+    assert response.json() == {"message": "Successfully processed late.csv"}
+    print("✅ Uploads processed off the event loop")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing precomputed facts")
+    print("=" * 50)
+    test_facts()
+    test_upload_off_event_loop()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
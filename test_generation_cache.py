@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test the generation cache: keys follow the question, passages and model
+settings, entries are evicted least recently used first, invalidation drops
+every answer built on a changed passage, and repeated questions skip the model.
+"""
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+import generation_cache
+import llm_utils
+import tools_sqlite
+from test_batch_ask import STUB_ANSWER, sqlite_pipeline
+
+
+@contextmanager
+def scratch_cache(max_entries: int = None):
+    """Point the cache at an empty file, optionally with a smaller size bound."""
+    originals = (generation_cache.CACHE_DB_FILE, generation_cache.MAX_CACHE_ENTRIES)
+    with tempfile.TemporaryDirectory() as workdir:
+        generation_cache.CACHE_DB_FILE = os.path.join(workdir, "cache.db")
+        if max_entries is not None:
+            generation_cache.MAX_CACHE_ENTRIES = max_entries
+        generation_cache.initialize_generation_cache()
+        try:
+            yield generation_cache.CACHE_DB_FILE
+        finally:
+            generation_cache.CACHE_DB_FILE, generation_cache.MAX_CACHE_ENTRIES = originals
+
+
+def test_cache_key():
+    """Case and spacing of the question do not matter; passages, their order and the model do."""
+    passages = ["Downtown pH is 7.2", "North TDS is 520 mg/L"]
+    key = generation_cache.cache_key("What is the pH downtown?", passages)
+
+    assert generation_cache.cache_key("  what is the PH   downtown? ", passages) == key
+    assert generation_cache.cache_key("What is the pH downtown?", passages[::-1]) != key
+    assert generation_cache.cache_key("What is the pH downtown?", passages[:1]) != key
+
+    original = llm_utils.OLLAMA_MODEL
+    llm_utils.OLLAMA_MODEL = "another-model"
+    try:
+        assert generation_cache.cache_key("What is the pH downtown?", passages) != key
+    finally:
+        llm_utils.OLLAMA_MODEL = original
+    print("✅ Cache keys built")
+
+
+def test_eviction():
+    """Past MAX_CACHE_ENTRIES the least recently used answer goes, with its passage links."""
+    with scratch_cache(max_entries=3) as path:
+        keys = [generation_cache.cache_key(f"question {i}", [f"passage {i}"]) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            generation_cache.store_answer(key, [f"passage {i}"], f"answer {i}")
+
+        # Reading the first answer makes the second the least recently used
+        assert generation_cache.get_cached_answer(keys[0]) == "answer 0"
+        generation_cache.store_answer(keys[3], ["passage 3"], "answer 3")
+
+        assert generation_cache.get_cached_answer(keys[1]) is None
+        assert [generation_cache.get_cached_answer(key) for key in (keys[0], keys[2], keys[3])] == [
+            "answer 0", "answer 2", "answer 3"
+        ]
+        conn = sqlite3.connect(path)
+        try:
+            linked = {row[0] for row in conn.execute("SELECT cache_key FROM generation_passages")}
+        finally:
+            conn.close()
+        assert linked == {keys[0], keys[2], keys[3]}
+    print("✅ Least recently used answer evicted")
+
+
+def test_invalidation():
+    """Every answer generated from a changed passage is dropped; the rest stay."""
+    with scratch_cache():
+        shared = "North District average TDS 520 mg/L"
+        first = generation_cache.cache_key("TDS in the north?", [shared, "Downtown pH is 7.2"])
+        second = generation_cache.cache_key("Is north water salty?", [shared])
+        other = generation_cache.cache_key("pH downtown?", ["Downtown pH is 7.2"])
+        generation_cache.store_answer(first, [shared, "Downtown pH is 7.2"], "520 mg/L")
+        generation_cache.store_answer(second, [shared], "Moderately")
+        generation_cache.store_answer(other, ["Downtown pH is 7.2"], "7.2")
+
+        assert generation_cache.invalidate_passages([shared]) == 2
+        assert generation_cache.get_cached_answer(first) is None
+        assert generation_cache.get_cached_answer(second) is None
+        assert generation_cache.get_cached_answer(other) == "7.2"
+        assert generation_cache.invalidate_passages([]) == 0
+
+        # More passages than SQLite binds in one statement
+        many = [f"passage {i}" for i in range(40000)]
+        generation_cache.store_answer(other, many[-1:], "7.2")
+        assert generation_cache.invalidate_passages(many) == 1
+        assert generation_cache.get_cached_answer(other) is None
+    print("✅ Answers on changed passages invalidated")
+
+
+def test_repeat_question_skips_model():
+    """Asking the same question over the same passages generates once."""
+    question = "What is the pH in the downtown area?"
+    with sqlite_pipeline() as stub:
+        assert tools_sqlite.run_rag_pipeline(question) == STUB_ANSWER
+        assert tools_sqlite.run_rag_pipeline(question.upper()) == STUB_ANSWER
+        assert len(stub.requests) == 1, stub.requests
+
+        # A new question is a miss
+        tools_sqlite.run_rag_pipeline("How is water quality in the north district?")
+        assert len(stub.requests) == 2
+    print("✅ Repeated question answered from the cache")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing the generation cache")
+    print("=" * 50)
+    test_cache_key()
+    test_eviction()
+    test_invalidation()
+    test_repeat_question_skips_model()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
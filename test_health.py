@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test readiness probes: deadlines, failures and result caching.
+"""
+
+import time
+
+import health
+
+
+def test_probe_deadline():
+    """A hung backend is reported as timed out instead of blocking readiness."""
+    def hung():
+        time.sleep(health.PROBE_TIMEOUT + 1)
+
+    def broken():
+        raise Exception("connection refused")
+
+    start = time.perf_counter()
+    results = health.run_checks({"ok": lambda: None, "hung": hung, "broken": broken})
+
+    assert time.perf_counter() - start < health.PROBE_TIMEOUT + 0.5
+    assert results["ok"]["status"] == "ok"
+    assert "timed out" in results["hung"]["error"]
+    assert results["broken"]["error"] == "connection refused"
+    # The hung probe is not queued again while it is still running
+    again = health.run_checks({"hung": hung})
+    assert again["hung"]["error"] == "previous probe still running", again
+    print("✅ Probe deadline enforced")
+
+
+def test_chart_probe_leaves_pyplot_alone():
+    """The chart probe renders without creating pyplot figures."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    before = plt.get_fignums()
+    health.check_chart_renderer()
+    assert plt.get_fignums() == before
+    print("✅ Chart probe off pyplot")
+
+
+def test_readiness_cached():
+    """Repeated readiness checks reuse the last probe results."""
+    calls = []
+    readiness = health.ReadinessCache({"counted": lambda: calls.append(1)})
+
+    for _ in range(5):
+        assert readiness.get()["status"] == "ready"
+
+    assert len(calls) == 1
+    print("✅ Readiness cached")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing health checks")
+    print("=" * 50)
+    test_probe_deadline()
+    test_chart_probe_leaves_pyplot_alone()
+    test_readiness_cached()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test the answer-generation stage against the local stub LLM server.
+"""
+
+import threading
+
+import llm_utils
+from llm_stub_server import start_stub_server
+
+
+def use_stub(server):
+    """Point llm_utils at a running stub server."""
+    llm_utils.OLLAMA_HOST = f"http://127.0.0.1:{server.server_port}"
+    llm_utils._unavailable_until = 0.0
+
+
+def sample_passages():
+    """Fuse a small set of overlapping retrieval results."""
+    semantic = ["Downtown pH is 7.2", "x" * 1000]
+    keyword = ["Downtown pH is 7.2", "North TDS is 520 mg/L"]
+    passages = llm_utils.fuse_passages(semantic, keyword)
+
+    # Passages found by both retrievers rank first and are not duplicated
+    assert passages[0] == "Downtown pH is 7.2"
+    assert len(passages) == len(set(passages)) == 3
+    return passages
+
+
+def test_build_prompt():
+    """Prompt carries the question and numbered, truncated passages."""
+    passages = sample_passages()
+    prompt = llm_utils.build_prompt("What is the pH downtown?", passages)
+
+    assert prompt.startswith(llm_utils.PROMPT_PREAMBLE)
+    assert "[1] " in prompt and "[2] " in prompt
+    assert "Question: What is the pH downtown?" in prompt
+    assert "x" * (llm_utils.MAX_PASSAGE_CHARS + 1) not in prompt
+    print("✅ Prompt built")
+
+
+def test_generate_answer_stream():
+    """Tokens stream back in order and the request keeps the model loaded."""
+    server = start_stub_server(answer="Downtown pH is 7.2")
+    use_stub(server)
+    try:
+        tokens = list(llm_utils.generate_answer_stream("pH downtown?", ["Downtown pH is 7.2"]))
+
+        assert len(tokens) == 4
+        assert "".join(tokens) == "Downtown pH is 7.2"
+        assert server.requests[0]["stream"] is True
+        assert server.requests[0]["keep_alive"] == llm_utils.OLLAMA_KEEP_ALIVE
+        print(f"✅ Streamed {len(tokens)} tokens")
+    finally:
+        server.shutdown()
+
+
+def test_bounded_concurrency():
+    """Many simultaneous questions never exceed the in-flight cap."""
+    server = start_stub_server(token_delay=0.01)
+    use_stub(server)
+    original_slots = llm_utils._generation_slots
+    llm_utils._generation_slots = threading.BoundedSemaphore(2)
+    try:
+        answers = []
+        threads = [
+            threading.Thread(target=lambda: answers.append(llm_utils.generate_answer("q", ["p"])))
+            for _ in range(12)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(answers) == 12
+        assert all(answer == server.answer for answer in answers)
+        assert server.max_in_flight <= 2
+        print(f"✅ Max in-flight generations: {server.max_in_flight}")
+    finally:
+        llm_utils._generation_slots = original_slots
+        server.shutdown()
+
+
+def test_warm_up_model():
+    """Warm-up sends the shared preamble so its KV cache is primed."""
+    server = start_stub_server()
+    use_stub(server)
+    try:
+        assert llm_utils.warm_up_model()
+        assert server.requests[0]["prompt"] == llm_utils.PROMPT_PREAMBLE
+        print("✅ Model warmed up")
+    finally:
+        server.shutdown()
+
+
+def test_unreachable_model():
+    """A dead endpoint fails fast and is skipped during the backoff window."""
+    server = start_stub_server()
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+
+    llm_utils.OLLAMA_HOST = f"http://127.0.0.1:{port}"
+    llm_utils._unavailable_until = 0.0
+    for _ in range(2):
+        try:
+            llm_utils.generate_answer("q", ["p"])
+            assert False, "expected GenerationUnavailable"
+        except llm_utils.GenerationUnavailable:
+            pass
+
+    assert llm_utils._unavailable_until > 0
+    llm_utils._unavailable_until = 0.0
+    print("✅ Unreachable model handled")
+
+
+def test_stream_failure_not_presented_as_done():
+    """A generation that breaks off is withdrawn, and the answer that is done is the top passage."""
+    import tools_sqlite
+
+    server = start_stub_server(answer="The water level in the north is", fail_after=3)
+    use_stub(server)
+    try:
+        events = list(tools_sqlite.run_rag_pipeline_stream("How are the residential zone wells doing overall?"))
+        names = [event for event, _ in events]
+        assert names.index("error") > names.index("token"), names
+        assert events[names.index("error")][1]["discard_tokens"] is True
+
+        tokens_after = "".join(data["text"] for event, data in events[names.index("error"):] if event == "token")
+        done = events[-1]
+        assert done[0] == "done" and done[1]["answer"] == tokens_after
+        assert "The water level in" not in done[1]["answer"]
+        print("✅ Broken-off generation replaced by the top passage")
+    finally:
+        server.shutdown()
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing answer generation")
+    print("=" * 50)
+    test_build_prompt()
+    test_generate_answer_stream()
+    test_bounded_concurrency()
+    test_warm_up_model()
+    test_unreachable_model()
+    test_stream_failure_not_presented_as_done()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
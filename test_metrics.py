@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test per-thread metric aggregation and the Prometheus text output.
+"""
+
+import threading
+
+import metrics
+
+
+def test_threads_aggregate():
+    """Counters and histograms recorded on many threads sum at scrape time."""
+    def work():
+        for _ in range(1000):
+            metrics.inc("upload_rows_total", status="test")
+            metrics.observe("upload_duration_seconds", 0.2)
+
+    # Uploads in other tests may already have observed durations
+    before = sum(metrics.collect().get(("upload_duration_seconds", ()), [0])[:-1])
+    live_shards = len(metrics._shards)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = metrics.collect()
+    assert totals[("upload_rows_total", (("status", "test"),))] == 8000
+    histogram = totals[("upload_duration_seconds", ())]
+    assert sum(histogram[:-1]) - before == 8000
+    # Finished threads hand their counts over and drop their shards
+    assert len(metrics._shards) <= live_shards, (len(metrics._shards), live_shards)
+
+    # Repeated short-lived threads keep the shard list flat
+    for _ in range(50):
+        thread = threading.Thread(target=metrics.inc, args=("upload_rows_total",), kwargs={"status": "test"})
+        thread.start()
+        thread.join()
+    assert len(metrics._shards) <= live_shards
+    assert metrics.collect()[("upload_rows_total", (("status", "test"),))] == 8050
+    print("✅ Per-thread shards aggregated and retired")
+
+
+def test_render():
+    """Histogram buckets are cumulative and gauges go back to zero."""
+    with metrics.in_progress("chart_renders_in_progress"):
+        assert "chart_renders_in_progress 1" in metrics.render()
+
+    metrics.observe("db_query_duration_seconds", 0.003, backend="test")
+    metrics.observe("db_query_duration_seconds", 0.2, backend="test")
+    text = metrics.render()
+
+    assert "chart_renders_in_progress 0" in text
+    assert 'db_query_duration_seconds_bucket{backend="test",le="0.005"} 1' in text
+    assert 'db_query_duration_seconds_bucket{backend="test",le="0.25"} 2' in text
+    assert 'db_query_duration_seconds_bucket{backend="test",le="+Inf"} 2' in text
+    assert 'db_query_duration_seconds_count{backend="test"} 2' in text
+    print("✅ Metrics rendered")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing metrics")
+    print("=" * 50)
+    test_threads_aggregate()
+    test_render()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
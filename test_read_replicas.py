@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test read/write splitting: read-only queries go to a replica that is fresh
+enough, writes and stale reads go to the primary.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import postgres_utils
+import simple_setup
+import sqlite_postgres_utils
+
+
+def test_sqlite_replicas():
+    """Two SQLite files stand in for a primary and its replica."""
+    original = (sqlite_postgres_utils.DB_PATH, sqlite_postgres_utils.SQLITE_REPLICA_PATHS)
+    with tempfile.TemporaryDirectory() as workdir:
+        primary = os.path.join(workdir, "primary.db")
+        replica = os.path.join(workdir, "replica.db")
+        simple_setup.create_sqlite_database(primary).close()
+        shutil.copy2(primary, replica)
+        # Mark the replica so reads served by it can be told apart
+        with sqlite3.connect(replica) as conn:
+            conn.execute("INSERT INTO wells (well_id, well_name) VALUES ('R001', 'Replica only')")
+        sqlite_postgres_utils.DB_PATH = primary
+        sqlite_postgres_utils.SQLITE_REPLICA_PATHS = [replica]
+        try:
+            marker = "SELECT COUNT(*) FROM wells WHERE well_id = 'R001'"
+            assert sqlite_postgres_utils.run_readonly_query(marker) == [(1,)]
+            assert sqlite_postgres_utils.run_readonly_frame(marker).iloc[0, 0] == 1
+            assert list(sqlite_postgres_utils.iter_sql_query(marker)) == [[(1,)]]
+            # Writes, and the reads run_sql_query does, stay on the primary
+            assert sqlite_postgres_utils.run_sql_query(marker) == [(0,)]
+            sqlite_postgres_utils.run_sql_query("INSERT INTO wells (well_id, well_name) VALUES ('P001', 'New')")
+
+            # Within the staleness tolerance the replica keeps serving reads
+            written = "SELECT COUNT(*) FROM wells WHERE well_id = 'P001'"
+            assert sqlite_postgres_utils.run_readonly_query(written) == [(0,)]
+
+            # Once it falls too far behind, reads go back to the primary and see the write
+            stale = sqlite_postgres_utils.last_write_time(primary) - 2 * sqlite_postgres_utils.SQLITE_REPLICA_MAX_LAG
+            os.utime(replica, (stale, stale))
+            assert sqlite_postgres_utils.run_readonly_query(written) == [(1,)]
+
+            # A missing replica is skipped too
+            sqlite_postgres_utils.SQLITE_REPLICA_PATHS = [os.path.join(workdir, "missing.db")]
+            assert sqlite_postgres_utils.choose_read_path() == primary
+        finally:
+            sqlite_postgres_utils.DB_PATH, sqlite_postgres_utils.SQLITE_REPLICA_PATHS = original
+    print("✅ SQLite reads routed to a fresh replica")
+
+
+def test_postgres_routing():
+    """Replicas within the lag tolerance take turns; the primary serves reads when none is fresh."""
+    original = postgres_utils.PG_REPLICA_DSNS
+    postgres_utils.PG_REPLICA_DSNS = ["postgresql://replica-a/groundwater", "postgresql://replica-b/groundwater",
+                                      "postgresql://replica-c/groundwater"]
+    try:
+        # Lags measured just now, so nothing is measured again
+        now = time.monotonic()
+        lags = [0.0, 1.0, postgres_utils.PG_REPLICA_MAX_LAG + 1]
+        for dsn, lag in zip(postgres_utils.PG_REPLICA_DSNS, lags):
+            postgres_utils._replica_lag[dsn] = (now, lag)
+        chosen = {postgres_utils.choose_read_dsn() for _ in range(4)}
+        assert chosen == set(postgres_utils.PG_REPLICA_DSNS[:2]), chosen
+
+        for dsn in postgres_utils.PG_REPLICA_DSNS:
+            postgres_utils._replica_lag[dsn] = (now, float("inf"))
+        assert postgres_utils.choose_read_dsn() == postgres_utils.PG_PRIMARY_DSN
+    finally:
+        postgres_utils.PG_REPLICA_DSNS = original
+        postgres_utils._replica_lag.clear()
+    print("✅ Postgres reads routed by replica lag")
+
+
+def test_pool_creation_not_serialized():
+    """Connecting to an unreachable replica does not hold up pools for other servers."""
+    slow_dsn, fast_dsn = "postgresql://unreachable/groundwater", "postgresql://primary-test/groundwater"
+    release = threading.Event()
+
+    class FakePool:
+        def __init__(self, minconn, maxconn, dsn, connect_timeout=None):
+            if dsn == slow_dsn:
+                # Stands in for a connect that hangs until its timeout
+                release.wait(10)
+                raise Exception("timeout expired")
+
+    original = postgres_utils.ThreadedConnectionPool
+    postgres_utils.ThreadedConnectionPool = FakePool
+    try:
+        failed = []
+
+        def connect_slow():
+            try:
+                postgres_utils.get_pool(slow_dsn)
+            except Exception as e:
+                failed.append(e)
+
+        thread = threading.Thread(target=connect_slow)
+        thread.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        pool = postgres_utils.get_pool(fast_dsn)
+        assert time.monotonic() - start < 1
+        assert postgres_utils.get_pool(fast_dsn) is pool
+        release.set()
+        thread.join()
+        # A failed connect publishes no pool, so the next attempt connects again
+        assert failed and slow_dsn not in postgres_utils._pools
+    finally:
+        release.set()
+        postgres_utils.ThreadedConnectionPool = original
+        postgres_utils._pools.pop(fast_dsn, None)
+    print("✅ Pools created without a global lock")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing read replicas")
+    print("=" * 50)
+    test_sqlite_replicas()
+    test_postgres_routing()
+    test_pool_creation_not_serialized()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test resumable uploads: chunk checksums, resuming after a dropped connection
+and ingesting the assembled file from disk.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+import requests
+from fastapi import FastAPI
+
+import resumable_uploads
+import simple_setup
+import sqlite_postgres_utils
+import tools_minimal
+from benchmark import start_api_server
+
+
+def test_resumable_upload():
+    """Chunks are verified, an interrupted upload resumes, and completion ingests the file."""
+    readings = pd.DataFrame({
+        "well_id": [f"W{i % 40}" for i in range(400)],
+        "latitude": 12.9,
+        "longitude": 77.6,
+        "water_level_meters": [10.0 + i / 100 for i in range(400)],
+        "measurement_date": [f"2024-{i // 40 + 1:02d}-01" for i in range(400)],
+    })
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "upload.db")
+        simple_setup.create_sqlite_database(db_path)
+        path = os.path.join(workdir, "readings.csv")
+        readings.to_csv(path, index=False)
+        content = open(path, "rb").read()
+        chunk_size = 4096
+
+        original_path = sqlite_postgres_utils.DB_PATH
+        original_spool = resumable_uploads.UPLOAD_SPOOL_DIR
+        sqlite_postgres_utils.DB_PATH = db_path
+        resumable_uploads.UPLOAD_SPOOL_DIR = os.path.join(workdir, "spool")
+
+        app = FastAPI()
+        resumable_uploads.install_resumable_uploads(app, tools_minimal.process_uploaded_data)
+        server, thread = start_api_server(app)
+        base_url = f"http://127.0.0.1:{server.config.port}"
+        try:
+            session = requests.post(f"{base_url}/upload/sessions", json={
+                "filename": "readings.csv",
+                "total_size": len(content),
+                "chunk_size": chunk_size,
+                "sha256": hashlib.sha256(content).hexdigest(),
+                "source_id": "logger-3",
+            }).json()
+            upload_id = session["upload_id"]
+            assert session["total_chunks"] == -(-len(content) // chunk_size) > 2, session
+            chunk_url = f"{base_url}/upload/sessions/{upload_id}/chunks"
+
+            # A corrupted chunk is rejected and not acknowledged
+            first = content[:chunk_size]
+            response = requests.put(f"{chunk_url}/0", data=first[:-1] + b"#",
+                                    headers={"X-Chunk-SHA256": hashlib.sha256(first).hexdigest()})
+            assert response.status_code == 422
+
+            # The first chunk gets through, then the connection "drops"
+            response = requests.put(f"{chunk_url}/0", data=first,
+                                    headers={"X-Chunk-SHA256": hashlib.sha256(first).hexdigest()})
+            assert response.json()["next_chunk"] == 1, response.text
+
+            response = requests.post(f"{base_url}/upload/sessions/{upload_id}/complete")
+            assert response.status_code == 409
+
+            # Running the client again resumes the same session and sends only the rest
+            result = resumable_uploads.upload_file(base_url, path, source_id="logger-3", chunk_size=chunk_size)
+            assert result["new"] == len(readings), result
+            assert result["errors"] == 0
+            assert not os.path.exists(resumable_uploads.session_dir(upload_id))
+
+            stored = sqlite_postgres_utils.run_sql_query(
+                "SELECT COUNT(*) FROM groundwater_data WHERE source_id = 'logger-3'"
+            )[0][0]
+            assert stored == len(readings)
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            sqlite_postgres_utils.DB_PATH = original_path
+            resumable_uploads.UPLOAD_SPOOL_DIR = original_spool
+    print("✅ Resumable upload resumed and ingested")
+
+
+def test_chunk_retries_and_file_mismatch():
+    """A corrupted retry of an accepted chunk changes nothing, a failed ingest can be completed again,
+    and a mismatched file is sent again."""
+    content = b"A" * 10 + b"B" * 10
+    ingested = []
+
+    failures = []
+
+    def process_upload(path, filename, source_id):
+        if failures:
+            return {"error": failures.pop()}
+        with open(path, "rb") as f:
+            ingested.append(f.read())
+        return {"message": f"Successfully processed {filename}"}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        original_spool = resumable_uploads.UPLOAD_SPOOL_DIR
+        resumable_uploads.UPLOAD_SPOOL_DIR = os.path.join(workdir, "spool")
+        path = os.path.join(workdir, "readings.csv")
+        with open(path, "wb") as f:
+            f.write(content)
+
+        app = FastAPI()
+        resumable_uploads.install_resumable_uploads(app, process_upload)
+        server, thread = start_api_server(app)
+        base_url = f"http://127.0.0.1:{server.config.port}"
+        try:
+            def open_session():
+                return requests.post(f"{base_url}/upload/sessions", json={
+                    "filename": "readings.csv", "total_size": len(content), "chunk_size": 10,
+                    "sha256": hashlib.sha256(content).hexdigest(),
+                }).json()
+
+            def put(upload_id, index, data, checksum=None):
+                return requests.put(f"{base_url}/upload/sessions/{upload_id}/chunks/{index}", data=data,
+                                    headers={"X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()})
+
+            upload_id = open_session()["upload_id"]
+            assert put(upload_id, 0, content[:10]).status_code == 200
+            assert put(upload_id, 1, content[10:]).status_code == 200
+
+            # A retry of chunk 0 arriving corrupted or truncated is rejected without touching the accepted bytes
+            assert put(upload_id, 0, b"X" * 10, hashlib.sha256(content[:10]).hexdigest()).status_code == 422
+            assert put(upload_id, 0, b"A" * 4, hashlib.sha256(content[:10]).hexdigest()).status_code == 400
+            status = requests.get(f"{base_url}/upload/sessions/{upload_id}").json()
+            assert status["complete"] and status["received"] == [0, 1], status
+            assert sorted(os.listdir(os.path.join(resumable_uploads.session_dir(upload_id), "chunks"))) == ["0", "1"]
+
+            # Ingestion fails: the spooled file is kept and completing again ingests it
+            failures.append("Error processing file: database is locked")
+            response = requests.post(f"{base_url}/upload/sessions/{upload_id}/complete")
+            assert response.status_code == 400 and "database is locked" in response.text, response.text
+            assert os.path.exists(os.path.join(resumable_uploads.session_dir(upload_id), "data"))
+            assert ingested == []
+
+            response = requests.post(f"{base_url}/upload/sessions/{upload_id}/complete")
+            assert response.status_code == 200, response.text
+            assert ingested == [content]
+            assert not os.path.exists(resumable_uploads.session_dir(upload_id))
+
+            # The spooled copy is damaged after every chunk was acknowledged
+            upload_id = open_session()["upload_id"]
+            assert put(upload_id, 0, content[:10]).status_code == 200
+            assert put(upload_id, 1, content[10:]).status_code == 200
+            with open(os.path.join(resumable_uploads.session_dir(upload_id), "data"), "r+b") as f:
+                f.write(b"Z")
+            response = requests.post(f"{base_url}/upload/sessions/{upload_id}/complete")
+            assert response.status_code == 422
+            status = requests.get(f"{base_url}/upload/sessions/{upload_id}").json()
+            assert status["received"] == [] and not status["complete"], status
+
+            # Damaged again once resent: the client finds nothing missing, is refused, and sends it all again
+            assert put(upload_id, 0, content[:10]).status_code == 200
+            assert put(upload_id, 1, content[10:]).status_code == 200
+            with open(os.path.join(resumable_uploads.session_dir(upload_id), "data"), "r+b") as f:
+                f.write(b"Z")
+            result = resumable_uploads.upload_file(base_url, path, chunk_size=10)
+            assert "error" not in result, result
+            assert ingested == [content, content]
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            resumable_uploads.UPLOAD_SPOOL_DIR = original_spool
+    print("✅ Corrupted retries and mismatched files recovered")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing resumable uploads")
+    print("=" * 50)
+    test_resumable_upload()
+    test_chunk_retries_and_file_mismatch()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
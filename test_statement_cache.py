@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test SQLite connection reuse: statements are cached per thread, hits are
+counted, and a replaced database file is reopened.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import metrics
+import simple_setup
+import sqlite_postgres_utils
+
+
+def cache_count(result: str) -> float:
+    return metrics.collect().get(("db_statement_cache_total", (("backend", "sqlite"), ("result", result))), 0.0)
+
+
+def test_statement_cache():
+    """Repeated queries reuse one connection and count as cache hits; replaced files are reopened."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "cache.db")
+        simple_setup.create_sqlite_database(db_path).close()
+        original_path = sqlite_postgres_utils.DB_PATH
+        sqlite_postgres_utils.DB_PATH = db_path
+        try:
+            query = "SELECT COUNT(*) FROM wells WHERE well_id = ?"
+            hits, misses = cache_count("hit"), cache_count("miss")
+            for _ in range(5):
+                sqlite_postgres_utils.run_sql_query(query, ("W001",))
+            assert cache_count("miss") == misses + 1
+            assert cache_count("hit") == hits + 4
+            conn = sqlite_postgres_utils.get_connection()
+            assert sqlite_postgres_utils.get_connection() is conn
+
+            # Writes are committed; anything left open is rolled back rather than holding the lock
+            sqlite_postgres_utils.run_sql_query(
+                "INSERT INTO wells (well_id, well_name) VALUES (?, ?)", ("W900", "Cache test")
+            )
+            conn.execute("INSERT INTO wells (well_id, well_name) VALUES ('W901', 'Uncommitted')")
+            sqlite_postgres_utils.release_connection(conn)
+            assert not conn.in_transaction
+            rows = sqlite_postgres_utils.run_readonly_query("SELECT well_id FROM wells WHERE well_id LIKE 'W90%'")
+            assert rows == [("W900",)]
+
+            # The read-only connection refuses writes
+            try:
+                sqlite_postgres_utils.run_readonly_query("DELETE FROM wells")
+                assert False, "expected a read-only error"
+            except sqlite3.Error:
+                pass
+
+            # A database file replaced on disk is reopened, not read through the stale handle
+            replacement = os.path.join(workdir, "replacement.db")
+            simple_setup.create_sqlite_database(replacement).close()
+            shutil.move(replacement, db_path)
+            assert sqlite_postgres_utils.get_connection() is not conn
+            assert sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM wells WHERE well_id = 'W900'") == [(0,)]
+        finally:
+            sqlite_postgres_utils.DB_PATH = original_path
+    print("✅ SQLite statements cached per connection")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing the statement cache")
+    print("=" * 50)
+    test_statement_cache()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
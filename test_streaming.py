@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test streamed answers: pipeline stage events arrive as they happen, tokens
+arrive before the answer is finished, and /ask/stream serves them as
+Server-Sent Events.
+"""
+
+import time
+
+from fastapi.testclient import TestClient
+
+import tools_sqlite
+from sse_utils import format_sse_event, iter_sse_events
+from test_batch_ask import STUB_ANSWER, sqlite_pipeline
+
+
+def test_stream_events():
+    """Each route yields its stage events, then tokens that add up to the done answer."""
+    with sqlite_pipeline(token_delay=0.05):
+        received = []
+        for event, data in tools_sqlite.run_rag_pipeline_stream("What is the pH in the downtown area?"):
+            received.append((time.perf_counter(), event, data))
+
+        events = [event for _, event, _ in received]
+        assert events[:2] == ["route", "retrieval"] and events[-1] == "done", events
+        assert set(events[2:-1]) == {"token"}, events
+        tokens = [data["text"] for _, event, data in received if event == "token"]
+        assert "".join(tokens).strip() == received[-1][2]["answer"] == STUB_ANSWER
+
+        # Tokens are passed on as the model produces them, not once the answer is complete
+        first_token = next(at for at, event, _ in received if event == "token")
+        assert received[-1][0] - first_token >= 0.05 * (len(tokens) - 2), received
+
+        map_events = list(tools_sqlite.run_rag_pipeline_stream("Show a map of the wells"))
+        assert map_events[0] == ("route", {"route": "map"})
+        assert map_events[-1] == ("done", {"answer": tools_sqlite.MAP_PLACEHOLDER})
+
+        chart_events = list(tools_sqlite.run_rag_pipeline_stream("Show the water level trend"))
+        assert [event for event, _ in chart_events[:2]] == ["route", "chart"]
+        assert chart_events[1][1]["url"] == "/static/chart.png"
+    print("✅ Stage events and tokens streamed")
+
+
+def test_stream_endpoint():
+    """POST /ask/stream is an event stream that parses back into the pipeline's events."""
+    from server_sqlite import app
+
+    question = "How is water quality in the north district?"
+    with sqlite_pipeline():
+        client = TestClient(app)
+        with client.stream("POST", "/ask/stream", json={"question": question}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            assert response.headers["cache-control"] == "no-cache"
+            events = list(iter_sse_events(response.iter_lines()))
+
+        assert events[0] == ("route", {"route": "hybrid"})
+        assert events[-1] == ("done", {"answer": STUB_ANSWER})
+        assert "".join(data["text"] for event, data in events if event == "token").strip() == STUB_ANSWER
+
+        # The same answer again comes from the generation cache
+        with client.stream("POST", "/ask/stream", json={"question": question}) as response:
+            events = list(iter_sse_events(response.iter_lines()))
+        assert events[-1] == ("done", {"answer": STUB_ANSWER, "cached": True})
+    print("✅ /ask/stream served as Server-Sent Events")
+
+
+def test_sse_round_trip():
+    """Formatted events, including multi-line text, parse back unchanged."""
+    events = [("route", {"route": "hybrid"}), ("token", {"text": "line one\nline two "}), ("done", {"answer": "ok"})]
+    text = "".join(format_sse_event(event, data) for event, data in events)
+    assert list(iter_sse_events(text.splitlines(keepends=True))) == events
+    print("✅ SSE events round-trip")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing streamed answers")
+    print("=" * 50)
+    test_stream_events()
+    test_stream_endpoint()
+    test_sse_round_trip()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
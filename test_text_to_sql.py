@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test question-to-SQL planning, the read-only query validator and the
+rewrite of planned queries for the async Postgres driver.
+"""
+
+from datetime import date
+
+import text_to_sql
+from async_postgres_utils import to_asyncpg
+from text_to_sql import plan_sql, validate_sql, UnsafeQueryError, MAX_SQL_ROWS
+
+SCHEMA = {
+    "tables": {"groundwater_data": [], "wells": [], "regions": []},
+    "locations": ["Downtown Area", "North District"],
+    "region_types": ["Urban", "Industrial"],
+    "well_statuses": ["active", "inactive"],
+}
+
+
+def test_plan_sql():
+    """Analytical questions become parameterized, bounded queries."""
+    plan = plan_sql("Which wells have the highest water levels?", SCHEMA)
+    assert "MAX(water_level_meters)" in plan["sql"] and "GROUP BY well_id" in plan["sql"]
+    assert f"LIMIT {MAX_SQL_ROWS}" in plan["sql"]
+
+    plan = plan_sql("average TDS in North District during 2023", SCHEMA)
+    assert "AVG(quality_tds)" in plan["sql"]
+    assert plan["params"] == ("North District", "2023-01-01", "2024-01-01")
+    assert "North District" not in plan["sql"]
+
+    # Whole location names only: a shared first word or a blank name matches nothing
+    schema = {**SCHEMA, "locations": ["", "  ", "North District", "North Ridge"]}
+    plan = plan_sql("average TDS in the North District", schema)
+    assert plan["params"] == ("North District",), plan["params"]
+    assert plan_sql("average TDS in the north", schema)["params"] == ()
+
+    plan = plan_sql("monthly pH trend for w002", SCHEMA, dialect="postgres", chart=True)
+    assert "to_char(measurement_date, 'YYYY-MM')" in plan["sql"]
+    assert "%s" in plan["sql"] and plan["params"] == ("W002",)
+
+    plan = plan_sql("monthly pH trend in 2023", SCHEMA, dialect="duckdb", chart=True)
+    assert "strftime(measurement_date, '%Y-%m')" in plan["sql"]
+    assert "measurement_date >= CAST(? AS DATE)" in plan["sql"]
+
+    # Wells are counted once however many readings they have
+    plan = plan_sql("How many wells have TDS above 500?", SCHEMA)
+    assert plan["sql"].startswith("SELECT COUNT(DISTINCT well_id) AS value FROM groundwater_data"), plan["sql"]
+    assert plan["description"] == "Number of wells" and plan["grouping"] is None
+    assert plan_sql("how many wells with pH below 7", SCHEMA)["grouping"] is None
+    assert plan_sql("how many measurements in 2023", SCHEMA)["sql"].startswith("SELECT COUNT(*)")
+
+    # Well status comes from the wells table
+    plan = plan_sql("average pH of active wells", SCHEMA)
+    assert "well_id IN (SELECT well_id FROM wells WHERE status IN (?))" in plan["sql"]
+    assert plan["params"] == ("active",)
+    plan = plan_sql("how many inactive wells are in North District", SCHEMA)
+    assert "COUNT(DISTINCT well_id)" in plan["sql"] and plan["params"] == ("North District", "inactive")
+    for question in ("average pH of active wells", "How many wells have TDS above 500?", "monthly pH trend in 2023"):
+        validate_sql(plan_sql(question, SCHEMA)["sql"], SCHEMA)
+    print("✅ Questions planned")
+
+
+def test_validate_sql():
+    """Anything outside a single bounded SELECT over known tables is rejected."""
+    rejected = [
+        "DELETE FROM groundwater_data",
+        "SELECT * FROM wells; DROP TABLE wells",
+        "SELECT * FROM sqlite_master",
+        "SELECT * FROM wells -- comment",
+        "SELECT load_extension('x')",
+        "WITH x AS (SELECT 1) INSERT INTO wells SELECT * FROM x",
+        "SELECT * FROM wells, sqlite_master",
+        "SELECT * FROM wells w, sqlite_master s",
+        "SELECT * FROM wells, read_text('/etc/passwd')",
+        "SELECT * FROM read_csv_auto('/etc/passwd')",
+        "SELECT * FROM (SELECT * FROM wells) w, sqlite_master",
+        "SELECT * FROM wells JOIN pg_shadow ON true",
+        "SELECT pg_read_binary_file('/etc/passwd') FROM wells",
+        "SELECT pg_catalog.pg_sleep(10) FROM wells",
+        "SELECT current_setting('data_directory') FROM wells LIMIT 1",
+        "SELECT * FROM wells WHERE well_id = version()",
+        "SELECT * FROM wells LIMIT 10 + 1000000",
+        "SELECT * FROM wells LIMIT (SELECT 1000000)",
+        "SELECT * FROM wells FETCH FIRST 1000000 ROWS ONLY",
+    ]
+    for sql in rejected:
+        try:
+            validate_sql(sql, SCHEMA)
+            assert False, f"expected rejection: {sql}"
+        except UnsafeQueryError:
+            pass
+
+    assert validate_sql("SELECT * FROM wells", SCHEMA).endswith(f"LIMIT {MAX_SQL_ROWS}")
+    assert validate_sql("SELECT * FROM wells LIMIT 100000", SCHEMA).endswith(f"LIMIT {MAX_SQL_ROWS}")
+
+    # An existing LIMIT is clamped where it stands, whatever follows it
+    bounded = {
+        "SELECT * FROM wells LIMIT 10 OFFSET 5": "SELECT * FROM wells LIMIT 10 OFFSET 5",
+        "SELECT * FROM wells LIMIT 100000 OFFSET 5": f"SELECT * FROM wells LIMIT {MAX_SQL_ROWS} OFFSET 5",
+        "SELECT * FROM wells OFFSET 5 LIMIT 100000": f"SELECT * FROM wells OFFSET 5 LIMIT {MAX_SQL_ROWS}",
+        "SELECT * FROM wells LIMIT (1000000)": f"SELECT * FROM wells LIMIT {MAX_SQL_ROWS}",
+        "SELECT * FROM wells LIMIT (10)": "SELECT * FROM wells LIMIT (10)",
+        "SELECT * FROM wells LIMIT ALL": f"SELECT * FROM wells LIMIT {MAX_SQL_ROWS}",
+        "SELECT * FROM wells LIMIT 5, 100000": f"SELECT * FROM wells LIMIT 5, {MAX_SQL_ROWS}",
+        "SELECT * FROM wells OFFSET 5": f"SELECT * FROM wells LIMIT {MAX_SQL_ROWS} OFFSET 5",
+        "SELECT 'limit 5' FROM wells": f"SELECT 'limit 5' FROM wells LIMIT {MAX_SQL_ROWS}",
+        "SELECT * FROM (SELECT * FROM wells LIMIT 5) w": f"SELECT * FROM (SELECT * FROM wells LIMIT 5) w LIMIT {MAX_SQL_ROWS}",
+    }
+    for sql, expected in bounded.items():
+        assert validate_sql(sql, SCHEMA) == expected, (sql, validate_sql(sql, SCHEMA))
+
+    # Aggregates, date and formatting helpers are allowed
+    assert validate_sql("SELECT ROUND(AVG(quality_ph), 2) FROM groundwater_data", SCHEMA)
+    assert validate_sql("SELECT strftime('%Y-%m', measurement_date) AS m, COUNT(DISTINCT well_id) "
+                        "FROM groundwater_data WHERE EXISTS (SELECT 1 FROM wells) GROUP BY m", SCHEMA)
+    assert validate_sql("SELECT AVG(quality_ph) FROM groundwater_data", SCHEMA) == "SELECT AVG(quality_ph) FROM groundwater_data"
+    assert validate_sql("SELECT 'drop' FROM wells LIMIT 5", SCHEMA) == "SELECT 'drop' FROM wells LIMIT 5"
+    assert validate_sql("SELECT w.well_id FROM wells w, groundwater_data g WHERE g.well_id = w.well_id LIMIT 5", SCHEMA)
+    assert validate_sql("SELECT COUNT(*) FROM (SELECT well_id FROM wells) AS w", SCHEMA)
+    assert validate_sql("WITH x AS (SELECT * FROM wells) SELECT * FROM x JOIN regions r ON true LIMIT 5", SCHEMA)
+    print("✅ Validator enforced")
+
+
+def test_schema_retry():
+    """A failed introspection is cached and retried only after SCHEMA_RETRY_SECONDS."""
+    calls = []
+
+    def unreachable(query, params=None):
+        calls.append(query)
+        raise ConnectionError("database is down")
+
+    def reachable(query, params=None):
+        calls.append(query)
+        return [(1, "well_id")] if query.startswith("PRAGMA table_info(wells)") else []
+
+    try:
+        schema = text_to_sql.get_schema("test", unreachable)
+        assert schema["tables"] == {} and len(calls) == 1
+        # Questions before the retry time use the cached empty schema
+        assert text_to_sql.get_schema("test", unreachable) is schema and len(calls) == 1
+        assert text_to_sql.cached_schema("test") is schema
+
+        text_to_sql._schema_retry_at["test"] = 0
+        assert text_to_sql.cached_schema("test") is None
+        schema = text_to_sql.get_schema("test", reachable)
+        assert schema["tables"] == {"wells": ["well_id"]}, schema
+        calls.clear()
+        assert text_to_sql.get_schema("test", reachable) is schema and calls == []
+    finally:
+        text_to_sql.refresh_schema("test")
+    print("✅ Failed introspection retried after an interval")
+
+
+def test_asyncpg_rewrite():
+    """Planned Postgres queries get numbered placeholders, literal percent signs and typed dates."""
+    plan = plan_sql("average TDS in industrial wells during 2023 above 500", SCHEMA, dialect="postgres")
+    query, args = to_asyncpg(plan["sql"], plan["params"])
+    assert "%s" not in query and "%%" not in query
+    assert "|| '%')" in query
+    assert [f"${i}" in query for i in range(1, len(args) + 1)] == [True] * len(args)
+    assert args == ["Industrial", date(2023, 1, 1), date(2024, 1, 1), 500.0]
+    # A date-shaped string is a string: it may be bound to a text column
+    assert to_asyncpg("SELECT * FROM wells WHERE well_id = %s", ["2023-01-01"])[1] == ["2023-01-01"]
+    print("✅ Queries rewritten for asyncpg")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing text-to-SQL")
+    print("=" * 50)
+    test_plan_sql()
+    test_validate_sql()
+    test_schema_retry()
+    test_asyncpg_rewrite()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
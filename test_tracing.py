@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test request tracing: nested spans, trace context on worker threads,
+generators traced across threads, and the X-Timing response header.
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import tracing
+
+
+def test_span_nesting():
+    """Spans nest under the current span, and errors are recorded then re-raised."""
+    with tracing.trace("request", route="test") as current:
+        with tracing.span("outer", rows=1) as outer:
+            with tracing.span("inner") as inner:
+                inner.set(hit=True)
+        try:
+            with tracing.span("failing"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("span swallowed the error")
+
+    spans = {span.name: span for span in current.spans}
+    assert spans["outer"].parent_id == current.root.span_id
+    assert spans["inner"].parent_id == outer.span_id
+    assert spans["inner"].attributes == {"hit": True}
+    assert spans["failing"].error == "ValueError: boom"
+    assert all(span.end_ns is not None for span in current.spans)
+    assert tracing.start_span("after") is None
+
+    # Outside a trace a span is timed but belongs to nothing
+    with tracing.span("detached") as detached:
+        pass
+    assert detached.trace is None and detached.end_ns is not None
+    print("✅ Spans nested")
+
+
+def test_propagate():
+    """Work handed to a thread pool joins the caller's trace only through propagate."""
+    def stage(name):
+        with tracing.span(name):
+            time.sleep(0.01)
+
+    with tracing.trace("request") as current:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(tracing.propagate(stage), ["semantic", "keyword"]))
+            executor.submit(stage, "unpropagated").result()
+
+    names = {span.name: span for span in current.spans}
+    assert "unpropagated" not in names
+    assert names["semantic"].parent_id == names["keyword"].parent_id == current.root.span_id
+    print("✅ Trace propagated to worker threads")
+
+
+def test_trace_stream():
+    """A generator stepped on different threads records one trace, exported when it ends."""
+    def events():
+        with tracing.span("retrieve"):
+            yield "passages"
+        with tracing.span("generate"):
+            yield "token"
+        raise RuntimeError("stream failed")
+
+    original = tracing.TRACE_LOG_PATH
+    with tempfile.TemporaryDirectory() as workdir:
+        tracing.TRACE_LOG_PATH = os.path.join(workdir, "traces.jsonl")
+        try:
+            stream = tracing.trace_stream("ask_stream", events(), question="q")
+            received = []
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                received.append(executor.submit(next, stream).result())
+            received.append(next(stream))
+            try:
+                next(stream)
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("stream error was swallowed")
+
+            # The caller's context is left as it was between steps
+            assert tracing.start_span("between") is None
+
+            # Including a trace the caller is in when it steps the stream
+            stream = tracing.trace_stream("nested", iter(["item"]))
+            with tracing.trace("caller") as caller:
+                with tracing.span("consume") as consume:
+                    assert next(stream) == "item"
+                    step = tracing.start_span("after_step")
+                    assert step.trace is caller and step.parent_id == consume.span_id
+                    step.end()
+            list(stream)
+
+            with open(tracing.TRACE_LOG_PATH) as f:
+                records = [json.loads(line) for line in f]
+        finally:
+            tracing.TRACE_LOG_PATH = original
+
+    assert received == ["passages", "token"]
+    assert [record["name"] for record in records] == ["ask_stream", "caller", "nested"], records
+    record = records[0]
+    assert record["name"] == "ask_stream" and record["attributes"] == {"question": "q"}
+    assert record["error"] == "RuntimeError: stream failed"
+    assert [span["name"] for span in record["spans"]] == ["retrieve", "generate"]
+    # Both stages hang off the stream's root span, whichever thread ran them
+    parents = {span["parent_id"] for span in record["spans"]}
+    assert len(parents) == 1 and None not in parents, parents
+    print("✅ Streamed trace exported")
+
+
+def test_timing_header():
+    """X-Timing is added when the client asks for it, with per-stage totals."""
+    app = FastAPI()
+    tracing.add_tracing_middleware(app)
+
+    @app.get("/work")
+    def work():
+        with tracing.span("lookup"):
+            time.sleep(0.01)
+        with tracing.span("lookup"):
+            time.sleep(0.01)
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert "X-Timing" not in client.get("/work").headers
+
+    timing = client.get("/work", headers={"X-Timing": "1"}).headers["X-Timing"]
+    parts = dict(part.split("=") for part in timing.split(", "))
+    assert set(parts) == {"total", "lookup"}, timing
+    assert float(parts["lookup"].rstrip("ms")) >= 20
+    assert float(parts["total"].rstrip("ms")) >= float(parts["lookup"].rstrip("ms"))
+    print("✅ X-Timing header returned")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing tracing")
+    print("=" * 50)
+    test_span_nesting()
+    test_propagate()
+    test_trace_stream()
+    test_timing_header()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
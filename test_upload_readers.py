@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Test upload readers: column projection, typed columns, streamed Excel, compact
+cleaned frames and the bulk loader.
+"""
+
+import gc
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+import simple_setup
+import sqlite_postgres_utils
+import tools_minimal
+import upload_readers
+
+
+def sample_table() -> pa.Table:
+    """A typed measurement table with one column the upload does not use."""
+    return pa.table({
+        "Well_ID": ["W1", "W2", "W3"],
+        "lat": [12.97, 13.01, None],
+        "lon": [77.59, 77.62, 77.70],
+        "water_level": [14.2, 9.8, 11.0],
+        "date": pa.array([19723, 19724, 19725], type=pa.date32()),
+        "ph": [7.1, None, 6.9],
+        "sensor_notes": ["ok", "drift", "ok"],
+    })
+
+
+def parquet_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def test_columnar_projection():
+    """Parquet and Arrow uploads keep only the mapped columns, with their types."""
+    table = sample_table()
+
+    sink = pa.BufferOutputStream()
+    feather.write_feather(table, sink)
+    arrow_file = sink.getvalue().to_pybytes()
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    arrow_stream = sink.getvalue().to_pybytes()
+
+    for filename, content in [("wells.parquet", parquet_bytes(table)),
+                              ("wells.feather", arrow_file),
+                              ("wells.arrows", arrow_stream)]:
+        df = upload_readers.preview_upload(content, filename)
+        assert "sensor_notes" not in df.columns, filename
+        assert list(df.columns) == ["Well_ID", "lat", "lon", "water_level", "date", "ph"]
+        assert pd.api.types.is_datetime64_any_dtype(df["date"]), filename
+        assert pd.api.types.is_float_dtype(df["lat"]), filename
+
+    assert upload_readers.preview_upload(b"", "wells.json") is None
+    print("✅ Columnar uploads projected and typed")
+
+
+def test_excel_streaming():
+    """Workbooks stream in chunks across sheets, skipping sheets without groundwater columns."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    notes = workbook.create_sheet("Notes")
+    notes.append(["Collected by the district office"])
+    for name, wells in [("North", 5), ("South", 4)]:
+        sheet = workbook.create_sheet(name)
+        sheet.append(["well_id", "water_level", "date", "remarks"])
+        for i in range(wells):
+            sheet.append([f"{name}{i}", 10.0 + i, datetime(2024, 1, i + 1), "ok"])
+        sheet.append([None, None, None, None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    content = buffer.getvalue()
+
+    chunks = list(upload_readers.iter_upload(content, "survey.xlsx", chunk_rows=3))
+    assert [len(chunk) for chunk in chunks] == [3, 2, 3, 1]
+    assert list(chunks[0].columns) == ["well_id", "water_level", "date"]
+    assert pd.api.types.is_datetime64_any_dtype(chunks[0]["date"])
+
+    preview = upload_readers.preview_upload(content, "survey.xlsx", rows=2)
+    assert preview["well_id"].tolist() == ["North0", "North1"]
+    print("✅ Excel streamed in chunks")
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def test_compact_frame_memory():
+    """Cleaned frames use compact dtypes and stay within the documented memory per million rows."""
+    rows = 250_000
+    raw = next(simple_setup.generate_measurement_chunks(wells=rows // 120, years=10, chunk_rows=rows, max_rows=rows))
+
+    # Sample RSS while cleaning; the peak above the starting RSS is the cleaning overhead
+    measure_rss = os.path.exists("/proc/self/statm")
+    gc.collect()
+    start_rss = current_rss() if measure_rss else 0
+    peak = [start_rss]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], current_rss())
+            time.sleep(0.002)
+
+    sampler = threading.Thread(target=sample)
+    if measure_rss:
+        sampler.start()
+    try:
+        cleaned = tools_minimal.clean_groundwater_data(raw)
+    finally:
+        done.set()
+        if measure_rss:
+            sampler.join()
+
+    assert len(cleaned) > 0.99 * rows
+    assert isinstance(cleaned["well_id"].dtype, pd.CategoricalDtype)
+    assert isinstance(cleaned["location_name"].dtype, pd.CategoricalDtype)
+    assert cleaned["water_level_meters"].dtype == "float32"
+    assert cleaned["latitude"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(cleaned["measurement_date"])
+    assert "geom" not in cleaned.columns
+
+    per_million = 1_000_000 / rows
+    frame_mb = cleaned.memory_usage(deep=True).sum() * per_million / 1e6
+    assert frame_mb < upload_readers.CLEANED_MB_PER_MILLION_ROWS, frame_mb
+    if measure_rss:
+        peak_mb = (peak[0] - start_rss) * per_million / 1e6
+        assert peak_mb < upload_readers.CLEANING_PEAK_RSS_MB_PER_MILLION_ROWS, peak_mb
+        print(f"✅ Cleaned frame {frame_mb:.0f} MB, cleaning peak RSS +{peak_mb:.0f} MB per million rows")
+    else:
+        print(f"✅ Cleaned frame {frame_mb:.0f} MB per million rows")
+
+
+def test_bulk_insert():
+    """A Parquet upload lands in SQLite through the batched loader."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "upload.db")
+        simple_setup.create_sqlite_database(db_path)
+        original_path = sqlite_postgres_utils.DB_PATH
+        sqlite_postgres_utils.DB_PATH = db_path
+        try:
+            before = sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM groundwater_data")[0][0]
+            result = tools_minimal.process_uploaded_data(parquet_bytes(sample_table()), "wells.parquet")
+
+            # W3 has no latitude and is dropped during cleaning
+            assert result["rows_processed"] == 2, result
+            assert result["errors"] == 0
+            rows = sqlite_postgres_utils.run_sql_query(
+                "SELECT well_id, measurement_date, quality_ph FROM groundwater_data "
+                "ORDER BY id DESC LIMIT 2"
+            )
+            assert sorted(rows) == [("W1", "2024-01-01", 7.1), ("W2", "2024-01-02", None)]
+            after = sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM groundwater_data")[0][0]
+            assert after == before + 2
+        finally:
+            sqlite_postgres_utils.DB_PATH = original_path
+    print("✅ Bulk insert stored typed rows")
+
+
+def test_idempotent_upload():
+    """Re-uploads are skipped by file hash, overlaps are upserted, and old databases are migrated."""
+    import sqlite3
+
+    readings = pd.DataFrame({
+        "well_id": ["W1", "W1", "W2"],
+        "latitude": [12.97, 12.97, 13.01],
+        "longitude": [77.59, 77.59, 77.62],
+        "water_level_meters": [14.2, 13.9, 9.8],
+        "measurement_date": ["2024-01-01", "2024-02-01", "2024-01-01"],
+    })
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "upload.db")
+        simple_setup.create_sqlite_database(db_path)
+        original_path = sqlite_postgres_utils.DB_PATH
+        sqlite_postgres_utils.DB_PATH = db_path
+        try:
+            def upload(df, source_id=""):
+                return tools_minimal.process_uploaded_data(df.to_csv(index=False).encode(), "readings.csv", source_id)
+
+            first = upload(readings)
+            assert (first["new"], first["updated"], first["skipped"]) == (3, 0, 0), first
+
+            # The same bytes again: nothing is read or written
+            again = upload(readings)
+            assert (again["new"], again["updated"], again["skipped"]) == (0, 0, 3), again
+
+            # One corrected reading, one new one, one unchanged, and a repeat within the file
+            revised = pd.concat([readings, readings.tail(1)], ignore_index=True)
+            revised.loc[1, "water_level_meters"] = 13.5
+            revised.loc[3, "measurement_date"] = "2024-02-01"
+            overlap = upload(revised)
+            assert (overlap["new"], overlap["updated"], overlap["skipped"]) == (1, 1, 2), overlap
+
+            # The same readings from another source are stored separately
+            other = upload(readings, source_id="district-office")
+            assert other["new"] == 3, other
+
+            # Two readings of a well on one day are stored as one day's reading, the later one
+            same_day = pd.DataFrame({
+                "well_id": ["W3", "W3"], "latitude": [13.1, 13.1], "longitude": [77.7, 77.7],
+                "water_level_meters": [7.5, 7.2], "measurement_date": ["2024-03-01 08:00", "2024-03-01 17:30"],
+            })
+            day = upload(same_day)
+            assert (day["new"], day["updated"], day["skipped"], day["errors"]) == (1, 0, 1, 0), day
+            assert sqlite_postgres_utils.run_sql_query(
+                "SELECT measurement_date, water_level_meters FROM groundwater_data WHERE well_id = 'W3'"
+            ) == [("2024-03-01", 7.2)]
+
+            count = sqlite_postgres_utils.run_sql_query("SELECT COUNT(*) FROM groundwater_data")[0][0]
+            level = sqlite_postgres_utils.run_sql_query(
+                "SELECT water_level_meters FROM groundwater_data "
+                "WHERE well_id = 'W1' AND measurement_date = '2024-02-01' AND source_id = ''"
+            )
+            assert level == [(13.5,)]
+
+            # A database from before the key: duplicates collapse to the latest copy
+            legacy_path = os.path.join(workdir, "legacy.db")
+            conn = sqlite3.connect(legacy_path)
+            conn.execute(
+                "CREATE TABLE groundwater_data (id INTEGER PRIMARY KEY AUTOINCREMENT, well_id VARCHAR(50) NOT NULL, "
+                "location_name VARCHAR(100), latitude DECIMAL(10, 8), longitude DECIMAL(11, 8), "
+                "depth_meters DECIMAL(8, 2), water_level_meters DECIMAL(8, 2), measurement_date DATE, "
+                "quality_ph DECIMAL(4, 2), quality_tds DECIMAL(8, 2))"
+            )
+            conn.executemany(
+                "INSERT INTO groundwater_data (well_id, water_level_meters, measurement_date) VALUES (?, ?, ?)",
+                [("W1", 14.0, "2024-01-01"), ("W1", 14.2, "2024-01-01"), ("W2", 9.8, "2024-01-01")]
+            )
+            conn.commit()
+            conn.close()
+
+            sqlite_postgres_utils.DB_PATH = legacy_path
+            sqlite_postgres_utils.ensure_upload_schema()
+            rows = sqlite_postgres_utils.run_sql_query(
+                "SELECT well_id, water_level_meters FROM groundwater_data ORDER BY well_id"
+            )
+            assert rows == [("W1", 14.2), ("W2", 9.8)]
+        finally:
+            sqlite_postgres_utils.DB_PATH = original_path
+
+    assert count == 4 + 3 + 1
+    print("✅ Uploads deduplicated and upserted")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing upload readers")
+    print("=" * 50)
+    test_columnar_projection()
+    test_excel_streaming()
+    test_compact_frame_memory()
+    test_bulk_insert()
+    test_idempotent_upload()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
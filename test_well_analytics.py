@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test per-well statistics: trends, seasonality and threshold breaches computed
+for all wells at once, and incremental updates after an upload.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import simple_setup
+import sqlite_postgres_utils
+import sqlite_utils
+import tools_sqlite
+import well_analytics
+
+
+def synthetic_readings() -> pd.DataFrame:
+    """Three years of monthly readings with known trends, seasons and water quality."""
+    dates = pd.date_range("2020-01-01", periods=36, freq="MS") + pd.Timedelta(days=14)
+    years = (dates - pd.Timestamp("2020-01-01")).days / 365.25
+    wells = {
+        # well: (trend m/year, seasonal amplitude m, wettest month, pH, TDS)
+        "W001": (-0.5, 1.5, 8, 7.2, 450.0),
+        "W002": (0.3, 0.5, 2, 7.0, 620.0),
+        "W003": (0.0, 1.0, 11, 8.9, 300.0),
+    }
+    frames = []
+    for well_id, (trend, amplitude, peak, ph, tds) in wells.items():
+        level = 20 + trend * years + amplitude * np.cos(2 * np.pi * (dates.month - peak) / 12)
+        frames.append(pd.DataFrame({
+            "well_id": well_id, "location_name": f"Site {well_id}",
+            "measurement_date": dates.strftime("%Y-%m-%d"), "water_level_meters": level,
+            "quality_ph": ph, "quality_tds": tds,
+        }))
+    readings = pd.concat(frames, ignore_index=True)
+    # A missing reading and a sign error are ignored, not fitted
+    readings.loc[3, "water_level_meters"] = np.nan
+    readings.loc[4, "water_level_meters"] *= -1
+    return readings
+
+
+def test_well_stats():
+    """Trends and seasons are recovered exactly; breaches are counted against the limits."""
+    stats = well_analytics.compute_well_stats(synthetic_readings())
+    assert list(stats.index) == ["W001", "W002", "W003"]
+    assert np.allclose(stats["trend_m_per_year"], [-0.5, 0.3, 0.0])
+    assert np.allclose(stats["seasonal_amplitude_m"], [1.5, 0.5, 1.0])
+    assert list(stats["peak_month"]) == [8, 2, 11]
+    assert list(stats["tds_breaches"]) == [0, 36, 0]
+    assert list(stats["ph_breaches"]) == [0, 0, 36]
+
+    answer = well_analytics.answer_well_question("Which wells are declining fastest?", stats)
+    assert answer.splitlines()[1].startswith("- W001 (Site W001): -0.50 m/year"), answer
+    assert "W002" not in answer
+    answer = well_analytics.answer_well_question("Which wells exceed the TDS limit?", stats)
+    assert "W002" in answer and "pH" not in answer
+    answer = well_analytics.answer_well_question("seasonal swings in Site W003", stats)
+    assert answer.splitlines()[1] == "- W003 (Site W003): ±1.00 m, highest in November", answer
+    assert well_analytics.answer_well_question("average water level", stats) is None
+    # General questions that merely mention depletion, recharge or safety are not well rankings
+    for question in ["What causes groundwater depletion?", "How does the monsoon affect recharging of aquifers?",
+                     "Is the water in North District unsafe to drink?"]:
+        assert well_analytics.classify_well_question(question) is None, question
+    print("✅ Well statistics computed")
+
+
+def test_incremental_update():
+    """After an upload only the wells it touched are read and recomputed."""
+    original_paths = (sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE)
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "wells.db")
+        simple_setup.generate_dataset("sqlite", output=db_path, wells=30, years=3, seed=11)
+        sqlite_postgres_utils.DB_PATH = db_path
+        # Fact passages for these wells go to a scratch search index
+        sqlite_utils.DB_FILE = os.path.join(workdir, "search.db")
+        sqlite_utils.initialize_sqlite()
+        well_analytics.refresh_well_stats("sqlite")
+
+        queries = []
+
+        def run_query(query, params=None):
+            queries.append(params)
+            return sqlite_postgres_utils.run_sql_query(query, params)
+
+        try:
+            before = well_analytics.get_well_stats("sqlite", run_query)
+            assert len(before) == 30
+            assert before["trend_m_per_year"].notna().all()
+
+            # Cached: nothing is read again
+            queries.clear()
+            assert well_analytics.get_well_stats("sqlite", run_query) is before
+            assert queries == []
+
+            # Readings that make one well fall sharply
+            well_id = before.index[0]
+            readings = pd.DataFrame({
+                "well_id": well_id, "latitude": 12.9, "longitude": 77.6,
+                "water_level_meters": [1.0, 0.8, 0.6],
+                "measurement_date": ["2003-01-15", "2003-02-15", "2003-03-15"],
+            })
+            # The upload brings the statistics up to date for its fact passages
+            recomputed = []
+            compute_for_wells = well_analytics.compute_for_wells
+
+            def record_wells(dialect, run_query, well_ids):
+                recomputed.append(list(well_ids))
+                return compute_for_wells(dialect, run_query, well_ids)
+
+            well_analytics.compute_for_wells = record_wells
+            try:
+                result = tools_sqlite.process_uploaded_data(readings.to_csv(index=False).encode(), "late.csv", "logger-9")
+            finally:
+                well_analytics.compute_for_wells = compute_for_wells
+            assert result["new"] == 3, result
+            assert recomputed == [[well_id]], recomputed
+
+            after = well_analytics.get_well_stats("sqlite", run_query)
+            assert queries == [], queries
+            assert after.loc[well_id, "trend_m_per_year"] < before.loc[well_id, "trend_m_per_year"]
+            others = before.index[1:]
+            pd.testing.assert_frame_equal(after.loc[others], before.loc[others])
+
+            answer = tools_sqlite.answer_analytical_question("Which wells are declining fastest?")
+            assert answer.splitlines()[1].startswith(f"- {well_id}"), answer
+            assert tools_sqlite.route_question("which wells are declining fastest") == "analytics"
+            assert tools_sqlite.route_question("What causes groundwater depletion?") == "hybrid"
+
+            # Readings written outside /upload (another worker, simple_setup) show up once the cache expires
+            other = before.index[1]
+            sqlite_postgres_utils.run_sql_query(
+                "UPDATE groundwater_data SET quality_tds = 900 WHERE well_id = ?", (other,)
+            )
+            assert well_analytics.get_well_stats("sqlite", run_query).loc[other, "tds_breaches"] == \
+                before.loc[other, "tds_breaches"]
+            original_ttl = well_analytics.WELL_STATS_TTL
+            well_analytics.WELL_STATS_TTL = 0
+            try:
+                refreshed = well_analytics.get_well_stats("sqlite", run_query)
+            finally:
+                well_analytics.WELL_STATS_TTL = original_ttl
+            assert refreshed.loc[other, "tds_breaches"] == refreshed.loc[other, "readings"]
+        finally:
+            sqlite_postgres_utils.DB_PATH, sqlite_utils.DB_FILE = original_paths
+            well_analytics.refresh_well_stats("sqlite")
+    print("✅ Statistics updated for uploaded wells only")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Testing well analytics")
+    print("=" * 50)
+    test_well_stats()
+    test_incremental_update()
+    print("\n🎉 All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+import re
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+# Tables analytical questions may touch
+ALLOWED_TABLES = ["groundwater_data", "wells", "regions"]
+
+# Row cap added to every generated query that is not a single aggregate
+MAX_SQL_ROWS = 500
+
+# Statement timeout for generated queries, in seconds
+SQL_TIMEOUT_SECONDS = 5
+
+# Seconds before an empty or failed schema introspection is tried again
+SCHEMA_RETRY_SECONDS = 60
+
+# Question phrases mapped to measurement columns and display labels
+METRICS = {
+    "quality_tds": (["tds", "dissolved solids", "salinity"], "TDS (mg/L)"),
+    "quality_ph": (["ph", "acidity", "alkalinity"], "pH"),
+    "depth_meters": (["well depth", "depth", "deep"], "well depth (m)"),
+    "water_level_meters": (["water level", "level", "water table"], "water level (m)"),
+}
+
+AGGREGATIONS = {
+    "AVG": ["average", "avg", "mean", "typical"],
+    "MAX": ["maximum", "max", "highest", "deepest", "peak"],
+    "MIN": ["minimum", "min", "lowest", "shallowest"],
+    "COUNT": ["how many", "count", "number of"],
+    "SUM": ["total", "sum"],
+}
+
+AGGREGATION_LABELS = {"AVG": "Average", "MAX": "Maximum", "MIN": "Minimum", "SUM": "Total"}
+
+GROUPINGS = {
+    "well": ["by well", "per well", "each well", "which well", "which wells", "wells with", "all wells"],
+    "location": ["by location", "per location", "each location", "by district", "per district",
+                 "each district", "by region", "per region", "by area", "which location", "which district"],
+    "month": ["by month", "monthly", "per month", "trend", "over time", "timeseries", "time series"],
+    "year": ["by year", "yearly", "annual", "per year"],
+}
+
+# Statements and functions a generated query may never contain
+FORBIDDEN_KEYWORDS = [
+    "insert", "update", "delete", "drop", "alter", "create", "replace", "truncate",
+    "attach", "detach", "pragma", "vacuum", "reindex", "grant", "revoke", "copy",
+    "execute", "call", "do", "load_extension", "pg_sleep", "pg_read_file", "into",
+    "set", "begin", "commit", "rollback", "savepoint", "lock", "listen", "notify",
+]
+
+AGGREGATE_FUNCTION_PATTERN = re.compile(r'\b(avg|max|min|count|sum)\s*\(', re.IGNORECASE)
+
+# Functions a generated query may call; any other call, e.g. pg_read_binary_file(), is rejected
+ALLOWED_FUNCTIONS = {
+    # Aggregates and window functions
+    "avg", "max", "min", "count", "sum", "stddev", "stddev_pop", "stddev_samp", "variance",
+    "var_pop", "var_samp", "median", "percentile_cont", "percentile_disc", "group_concat",
+    "string_agg", "row_number", "rank", "dense_rank", "ntile", "lag", "lead", "first_value", "last_value",
+    # Dates and formatting
+    "strftime", "to_char", "date", "datetime", "julianday", "date_trunc", "date_part",
+    "year", "month", "cast",
+    # Numbers and text
+    "round", "abs", "ceil", "ceiling", "floor", "sqrt", "power", "coalesce", "nullif", "greatest",
+    "least", "lower", "upper", "trim", "length", "substr", "substring",
+}
+
+# Keywords that may be followed by a parenthesis without calling a function
+_PAREN_KEYWORDS = {
+    "select", "from", "join", "where", "and", "or", "not", "in", "exists", "as", "on", "using",
+    "over", "filter", "within", "any", "all", "some", "when", "then", "else", "by", "having",
+    "union", "intersect", "except", "values", "lateral", "is", "between", "like", "distinct", "limit", "offset",
+}
+
+# "how many wells", "number of active wells": a count of wells rather than of readings
+WELL_COUNT_PATTERN = re.compile(r'\b(?:how many|number of|count of|count)\s+(?:[a-z]+\s+)?wells\b')
+
+# Words that end a FROM item; anything else after a table name is its alias
+FROM_CLAUSE_ENDS = {
+    "where", "group", "order", "limit", "having", "join", "inner", "left", "right", "full", "outer",
+    "cross", "natural", "on", "using", "union", "intersect", "except", "window", "offset", "fetch",
+}
+
+_SQL_TOKEN = re.compile(r"[a-z_][a-z0-9_.$]*|\d+(?:\.\d+)?|\(|\)|,|''|[^\s\w(),']+")
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_.$]*$")
+
+# Schema introspection results per dialect, loaded once at startup
+_schema_cache = {}
+# Per dialect, when an introspection that found no tables may be retried
+_schema_retry_at = {}
+
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL falls outside the read-only grammar."""
+
+
+def load_schema(dialect: str, run_query: Callable) -> Dict:
+    """Introspect the analytical tables and cache their columns and known entities."""
+    schema = {"tables": {}, "locations": [], "region_types": [], "well_statuses": []}
+
+    try:
+        if dialect == "postgres":
+            rows = run_query('''
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name IN (%s, %s, %s)
+                ORDER BY table_name, ordinal_position
+            ''', tuple(ALLOWED_TABLES))
+            for table_name, column_name in rows:
+                schema["tables"].setdefault(table_name, []).append(column_name)
+        else:
+            for table_name in ALLOWED_TABLES:
+                rows = run_query(f"PRAGMA table_info({table_name})")
+                if rows:
+                    schema["tables"][table_name] = [row[1] for row in rows]
+
+        # Entity values used to resolve location and region filters
+        if "groundwater_data" in schema["tables"]:
+            rows = run_query("SELECT DISTINCT location_name FROM groundwater_data WHERE location_name IS NOT NULL LIMIT 1000")
+            schema["locations"] = [row[0] for row in rows]
+        if "regions" in schema["tables"]:
+            rows = run_query("SELECT DISTINCT region_type FROM regions WHERE region_type IS NOT NULL LIMIT 100")
+            schema["region_types"] = [row[0] for row in rows]
+        if "wells" in schema["tables"]:
+            rows = run_query("SELECT DISTINCT status FROM wells WHERE status IS NOT NULL LIMIT 100")
+            schema["well_statuses"] = [row[0] for row in rows]
+
+    except Exception as e:
+        print(f"Error loading schema: {str(e)}")
+
+    # An unreachable or empty database is not introspected again on every question
+    if schema["tables"]:
+        _schema_retry_at.pop(dialect, None)
+    else:
+        _schema_retry_at[dialect] = time.monotonic() + SCHEMA_RETRY_SECONDS
+    _schema_cache[dialect] = schema
+    return schema
+
+
+def cached_schema(dialect: str) -> Optional[Dict]:
+    """The cached schema, or None when it has to be (re)introspected first."""
+    schema = _schema_cache.get(dialect)
+    if schema is not None and not schema["tables"] and time.monotonic() >= _schema_retry_at.get(dialect, 0):
+        return None
+    return schema
+
+
+def get_schema(dialect: str, run_query: Callable) -> Dict:
+    """Return the cached schema, introspecting on first use and, while no tables were found, every SCHEMA_RETRY_SECONDS."""
+    schema = cached_schema(dialect)
+    if schema is None:
+        schema = load_schema(dialect, run_query)
+    return schema
+
+
+def refresh_schema(dialect: str):
+    """Forget the cached schema so the next question re-introspects it."""
+    _schema_cache.pop(dialect, None)
+    _schema_retry_at.pop(dialect, None)
+
+
+def _mentions(question: str, phrases: List[str]) -> bool:
+    return any(re.search(rf'\b{re.escape(phrase)}s?\b', question) for phrase in phrases)
+
+
+def _find_keyword(question: str, options: Dict[str, List[str]]) -> Optional[str]:
+    for name, phrases in options.items():
+        if _mentions(question, phrases):
+            return name
+    return None
+
+
+def _find_metric(question: str) -> Optional[str]:
+    for column, (phrases, _) in METRICS.items():
+        if _mentions(question, phrases):
+            return column
+    return None
+
+
+def is_analytical_question(question: str) -> bool:
+    """Whether a question asks for an aggregate over the measurements."""
+    question_lower = question.lower()
+    has_subject = (
+        _find_metric(question_lower) is not None
+        or _mentions(question_lower, ["measurement", "reading", "sample"])
+        or WELL_COUNT_PATTERN.search(question_lower) is not None
+    )
+    return has_subject and (
+        _find_keyword(question_lower, AGGREGATIONS) is not None
+        or _find_keyword(question_lower, GROUPINGS) is not None
+        or re.search(r'\b(above|below|over|under|greater than|less than)\s+\d', question_lower) is not None
+    )
+
+
+def plan_sql(question: str, schema: Dict, dialect: str = "sqlite", chart: bool = False) -> Dict:
+    """Translate an analytical question into parameterized SQL over groundwater_data ('sqlite', 'postgres' or 'duckdb')."""
+    question_lower = question.lower()
+    placeholder = "%s" if dialect == "postgres" else "?"
+
+    metric = _find_metric(question_lower) or "water_level_meters"
+    metric_label = METRICS[metric][1]
+    aggregation = _find_keyword(question_lower, AGGREGATIONS)
+    grouping = _find_keyword(question_lower, GROUPINGS)
+
+    # Charts always plot a series; default to the monthly average
+    if chart and grouping is None:
+        grouping = "month"
+    if aggregation is None:
+        aggregation = "AVG"
+    count_wells = aggregation == "COUNT" and WELL_COUNT_PATTERN.search(question_lower) is not None
+    if count_wells and grouping == "well":
+        # "how many wells with ..." is one count, not a count per well
+        grouping = None
+
+    conditions = []
+    params = []
+
+    # Well ids such as W001
+    well_ids = sorted(set(match.upper() for match in re.findall(r'\bw\d{3,}\b', question_lower)))
+    if well_ids:
+        conditions.append(f"well_id IN ({', '.join(placeholder for _ in well_ids)})")
+        params.extend(well_ids)
+
+    # Location names known from the schema cache, matched as whole names
+    locations = [
+        location for location in schema.get("locations", [])
+        if location and location.strip()
+        and re.search(rf'\b{re.escape(location.strip().lower())}\b', question_lower)
+    ]
+    if locations:
+        conditions.append(f"location_name IN ({', '.join(placeholder for _ in locations)})")
+        params.extend(locations)
+
+    # Region types resolved through the regions table
+    region_types = [
+        region_type for region_type in schema.get("region_types", [])
+        if re.search(rf'\b{re.escape(region_type.lower())}\b', question_lower)
+    ]
+    if region_types and not locations:
+        wildcard = "'%%'" if dialect == "postgres" else "'%'"
+        conditions.append(
+            "EXISTS (SELECT 1 FROM regions WHERE regions.region_type IN "
+            f"({', '.join(placeholder for _ in region_types)}) "
+            f"AND groundwater_data.location_name LIKE regions.region_name || {wildcard})"
+        )
+        params.extend(region_types)
+
+    # Well statuses, e.g. "active wells", resolved through the wells table
+    statuses = [
+        status for status in schema.get("well_statuses", [])
+        if status and status.strip()
+        and re.search(rf'\b{re.escape(status.strip().lower())}\s+wells?\b', question_lower)
+    ]
+    if statuses:
+        conditions.append(
+            f"well_id IN (SELECT well_id FROM wells WHERE status IN ({', '.join(placeholder for _ in statuses)}))"
+        )
+        params.extend(statuses)
+
+    # Year filter
+    years = re.findall(r'\b((?:19|20)\d{2})\b', question_lower)
+    if years:
+        # DuckDB compares DATE columns with DATE values, not strings
+        bound = f"CAST({placeholder} AS DATE)" if dialect == "duckdb" else placeholder
+        conditions.append(f"measurement_date >= {bound} AND measurement_date < {bound}")
+        start, end = f"{min(years)}-01-01", f"{int(max(years)) + 1}-01-01"
+        if dialect == "postgres":
+            # Typed dates: asyncpg binds them as DATE, where a string would only suit a text column
+            start, end = date.fromisoformat(start), date.fromisoformat(end)
+        params.extend([start, end])
+
+    # Threshold filter, e.g. "TDS above 500"
+    threshold = re.search(r'\b(above|over|greater than|below|under|less than)\s+(\d+(?:\.\d+)?)', question_lower)
+    if threshold:
+        operator = ">" if threshold.group(1) in ("above", "over", "greater than") else "<"
+        conditions.append(f"{metric} {operator} {placeholder}")
+        params.append(float(threshold.group(2)))
+        # "wells with TDS above 500" lists the wells; "how many wells ..." counts them
+        if grouping is None and not count_wells:
+            grouping = "well"
+
+    if dialect == "postgres":
+        month_expression = "to_char(measurement_date, 'YYYY-MM')"
+        year_expression = "to_char(measurement_date, 'YYYY')"
+    elif dialect == "duckdb":
+        month_expression = "strftime(measurement_date, '%Y-%m')"
+        year_expression = "strftime(measurement_date, '%Y')"
+    else:
+        month_expression = "strftime('%Y-%m', measurement_date)"
+        year_expression = "strftime('%Y', measurement_date)"
+
+    label_expressions = {
+        "well": "well_id",
+        "location": "location_name",
+        "month": month_expression,
+        "year": year_expression,
+    }
+
+    # Wells are counted from their readings: uploaded wells have no row in the wells table
+    if count_wells:
+        value_expression = "COUNT(DISTINCT well_id)"
+    elif aggregation == "COUNT":
+        value_expression = "COUNT(*)"
+    else:
+        value_expression = f"{aggregation}({metric})"
+    where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if grouping is None:
+        sql = f"SELECT {value_expression} AS value FROM groundwater_data{where_clause}"
+        columns = ["value"]
+    else:
+        label = label_expressions[grouping]
+        if grouping in ("month", "year"):
+            order_by = "label"
+        else:
+            order_by = "value ASC" if aggregation == "MIN" else "value DESC"
+        sql = (
+            f"SELECT {label} AS label, {value_expression} AS value "
+            f"FROM groundwater_data{where_clause} "
+            f"GROUP BY {label} ORDER BY {order_by} LIMIT {MAX_SQL_ROWS}"
+        )
+        columns = ["label", "value"]
+
+    if count_wells:
+        description = "Number of wells"
+    elif aggregation == "COUNT":
+        description = "Number of measurements"
+    else:
+        description = f"{AGGREGATION_LABELS[aggregation]} {metric_label}"
+    if grouping is not None:
+        description += f" by {grouping}"
+
+    return {
+        "sql": sql,
+        "params": tuple(params),
+        "columns": columns,
+        "grouping": grouping,
+        "metric_label": metric_label,
+        "description": description,
+    }
+
+
+def _matching_paren(tokens: List[str], start: int) -> int:
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i] == "(":
+            depth += 1
+        elif tokens[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise UnsafeQueryError("Unbalanced parentheses")
+
+
+def _check_from_items(tokens: List[str], start: int, allowed: set):
+    """Check every item of the FROM list (or JOIN target) starting at tokens[start]."""
+    i = start
+    while True:
+        token = tokens[i] if i < len(tokens) else None
+        if token == "(":
+            # A subquery; its own FROM is checked where it appears
+            i = _matching_paren(tokens, i) + 1
+        elif token and _IDENTIFIER.match(token) and token not in FROM_CLAUSE_ENDS:
+            if i + 1 < len(tokens) and tokens[i + 1] == "(":
+                raise UnsafeQueryError(f"Table functions are not allowed: {token}")
+            if token not in allowed:
+                raise UnsafeQueryError(f"Table not allowed: {token}")
+            i += 1
+        else:
+            raise UnsafeQueryError("Expected a table name")
+
+        # Optional alias, then either another item or the end of the list
+        if i < len(tokens) and tokens[i] == "as":
+            i += 1
+        if i < len(tokens) and _IDENTIFIER.match(tokens[i]) and tokens[i] not in FROM_CLAUSE_ENDS:
+            i += 1
+        if i < len(tokens) and tokens[i] == ",":
+            i += 1
+            continue
+        return
+
+
+def validate_sql(sql: str, schema: Optional[Dict] = None) -> str:
+    """Check SQL against the read-only grammar and return it with a bounded row count."""
+    statement = sql.strip().rstrip(";").strip()
+
+    if ";" in statement:
+        raise UnsafeQueryError("Only a single statement is allowed")
+    if "--" in statement or "/*" in statement:
+        raise UnsafeQueryError("Comments are not allowed")
+    if not re.match(r'^(select|with)\b', statement, re.IGNORECASE):
+        raise UnsafeQueryError("Only SELECT queries are allowed")
+
+    # Ignore string literals when scanning for keywords and table names
+    code = re.sub(r"'(?:[^']|'')*'", "''", statement).lower()
+
+    for keyword in FORBIDDEN_KEYWORDS:
+        if re.search(rf'\b{keyword}\b', code):
+            raise UnsafeQueryError(f"Keyword not allowed: {keyword.upper()}")
+
+    allowed_tables = set(ALLOWED_TABLES)
+    if schema and schema.get("tables"):
+        allowed_tables &= set(schema["tables"])
+    cte_names = set(re.findall(r'\b(\w+)\s*(?:\([^()]*\))?\s+as\s*\(', code))
+
+    # Every item of every FROM list and JOIN: comma joins and table functions such as
+    # read_text('/etc/passwd') would otherwise slip past a check of the first table only
+    tokens = _SQL_TOKEN.findall(code)
+    for i, token in enumerate(tokens):
+        if token in ("from", "join"):
+            _check_from_items(tokens, i + 1, allowed_tables | cte_names)
+        elif i + 1 < len(tokens) and tokens[i + 1] == "(" and _IDENTIFIER.match(token):
+            if token not in ALLOWED_FUNCTIONS and token not in _PAREN_KEYWORDS and token not in cte_names:
+                raise UnsafeQueryError(f"Function not allowed: {token}")
+
+    return _bound_rows(statement, code)
+
+
+def _limit_count(tokens: List[tuple], i: int) -> tuple:
+    """The row count starting at tokens[i]: a number, a parenthesized number or ALL.
+
+    Returns its (start, end) offsets in the statement, its value (None for ALL) and the next token index.
+    """
+    if i + 2 < len(tokens) and tokens[i][0] == "(" and tokens[i + 2][0] == ")" and tokens[i + 1][0].isdigit():
+        return tokens[i][1], tokens[i + 2][2], int(tokens[i + 1][0]), i + 3
+    if i < len(tokens) and tokens[i][0].isdigit():
+        return tokens[i][1], tokens[i][2], int(tokens[i][0]), i + 1
+    if i < len(tokens) and tokens[i][0] == "all":
+        return tokens[i][1], tokens[i][2], None, i + 1
+    raise UnsafeQueryError("LIMIT must be a whole number")
+
+
+def _bound_rows(statement: str, code: str) -> str:
+    """Clamp the outermost LIMIT to MAX_SQL_ROWS in place, or add one unless the query is a single aggregate row."""
+    # Token offsets into the statement, found with string literals blanked to the same length
+    masked = re.sub(r"'(?:[^']|'')*'", lambda literal: "'" + " " * (len(literal.group()) - 2) + "'", statement).lower()
+    tokens = [(match.group(), match.start(), match.end()) for match in _SQL_TOKEN.finditer(masked)]
+
+    depth = 0
+    limit_at = offset_at = None
+    for i, (token, _, _) in enumerate(tokens):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token == "fetch":
+            raise UnsafeQueryError("Use LIMIT rather than FETCH to bound rows")
+        elif depth == 0 and token == "limit" and limit_at is None:
+            limit_at = i
+        elif depth == 0 and token == "offset" and offset_at is None:
+            offset_at = i
+
+    if limit_at is not None:
+        start, end, count, after = _limit_count(tokens, limit_at + 1)
+        # SQLite's "LIMIT offset, count" form
+        if after < len(tokens) and tokens[after][0] == ",":
+            start, end, count, after = _limit_count(tokens, after + 1)
+        if after < len(tokens) and tokens[after][0] != "offset":
+            raise UnsafeQueryError("LIMIT must be a whole number")
+        if count is None or count > MAX_SQL_ROWS:
+            statement = f"{statement[:start]}{MAX_SQL_ROWS}{statement[end:]}"
+    elif offset_at is not None:
+        # LIMIT goes before OFFSET, which SQLite requires
+        position = tokens[offset_at][1]
+        statement = f"{statement[:position]}LIMIT {MAX_SQL_ROWS} {statement[position:]}"
+    elif not (AGGREGATE_FUNCTION_PATTERN.search(code) and not re.search(r'\bgroup\s+by\b', code)):
+        statement = f"{statement} LIMIT {MAX_SQL_ROWS}"
+
+    return statement
+
+
+def format_sql_answer(plan: Dict, rows: list) -> str:
+    """Render query results as a short text answer."""
+    if not rows or all(value is None for row in rows for value in row):
+        return "No matching groundwater measurements found."
+
+    def format_value(value):
+        return f"{value:,.2f}" if isinstance(value, float) else str(value)
+
+    if plan["grouping"] is None:
+        return f"{plan['description']}: {format_value(rows[0][0])}"
+
+    lines = [f"{plan['description']}:"]
+    for label, value in rows[:20]:
+        lines.append(f"- {label}: {format_value(value)}")
+    if len(rows) > 20:
+        lines.append(f"... and {len(rows) - 20} more")
+    return "\n".join(lines)
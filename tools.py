@@ -1,38 +1,152 @@
-from postgres_utils import run_sql_query
-from qdrant_utils import semantic_search
-from sqlite_utils import bm25_search
+from postgres_utils import (
+    run_sql_query, run_readonly_query, run_readonly_frame, run_bulk_upsert, ensure_upload_schema,
+    register_statement
+)
+from async_postgres_utils import run_readonly_query_async, run_readonly_frame_async, run_queries_async
+from qdrant_utils import semantic_search, semantic_search_batch
+from sqlite_utils import bm25_search, bm25_search_batch
+from llm_utils import fuse_passages, generate_answer, generate_answer_stream, MAX_CONCURRENT_GENERATIONS
+from generation_cache import cache_key, get_cached_answer, store_answer
+from text_to_sql import (
+    cached_schema, get_schema, load_schema, refresh_schema, plan_sql, validate_sql, is_analytical_question,
+    format_sql_answer, SQL_TIMEOUT_SECONDS
+)
+from tracing import span, start_span, record_error, propagate
+from well_analytics import classify_well_question, answer_well_question, get_well_stats, mark_wells_changed
+from facts import refresh_facts
+from upload_readers import (
+    COLUMN_MAPPING, INSERT_COLUMNS, UPLOAD_BATCH_ROWS, UploadSource,
+    compact_frame, file_sha256, iter_upload, insert_rows, unique_readings
+)
+from metrics import inc, observe, in_progress
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import os
-import io
+import time
+import re
 from datetime import datetime
+from typing import Iterator, List, Tuple
 
+# Placeholder and date-function flavour for generated SQL
+SQL_DIALECT = "postgres"
 
-def process_uploaded_data(file_content: bytes, filename: str) -> dict:
-    """Process uploaded Excel/CSV file and insert into database."""
+# Upsert of one batch of readings, one array parameter per column (INSERT_COLUMNS + source_id).
+# The text is the same for any batch size, so it is prepared once per pooled connection.
+UPSERT_MEASUREMENTS = register_statement(
+    "upsert_measurements",
+    ["text[]", "text[]", "float8[]", "float8[]", "float8[]", "float8[]", "date[]", "float8[]", "float8[]", "text[]"],
+    """
+        INSERT INTO groundwater_data AS existing
+        (well_id, location_name, latitude, longitude, depth_meters, 
+         water_level_meters, measurement_date, quality_ph, quality_tds, source_id, geom)
+        SELECT well_id, location_name, latitude, longitude, depth_meters,
+               water_level_meters, measurement_date, quality_ph, quality_tds, source_id,
+               ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
+        FROM unnest($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+            AS batch(well_id, location_name, latitude, longitude, depth_meters,
+                     water_level_meters, measurement_date, quality_ph, quality_tds, source_id)
+        ON CONFLICT (well_id, measurement_date, source_id) DO UPDATE SET
+            location_name = EXCLUDED.location_name, latitude = EXCLUDED.latitude,
+            longitude = EXCLUDED.longitude, depth_meters = EXCLUDED.depth_meters,
+            water_level_meters = EXCLUDED.water_level_meters, quality_ph = EXCLUDED.quality_ph,
+            quality_tds = EXCLUDED.quality_tds, geom = EXCLUDED.geom
+        WHERE (existing.location_name, existing.latitude, existing.longitude, existing.depth_meters,
+               existing.water_level_meters, existing.quality_ph, existing.quality_tds)
+            IS DISTINCT FROM
+              (EXCLUDED.location_name, EXCLUDED.latitude, EXCLUDED.longitude, EXCLUDED.depth_meters,
+               EXCLUDED.water_level_meters, EXCLUDED.quality_ph, EXCLUDED.quality_tds)
+        RETURNING (xmax = 0)
+    """
+)
+
+
+def process_uploaded_data(file_content: UploadSource, filename: str, source_id: str = "") -> dict:
+    """Process uploaded Excel/CSV/Parquet/Arrow bytes or spooled file and upsert it into database."""
+    start_time = time.perf_counter()
     try:
-        # Read the file based on extension
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(file_content))
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(file_content))
-        else:
+        ensure_upload_schema()
+        
+        # An exact re-upload of a file already ingested from this source changes nothing
+        file_hash = file_sha256(file_content)
+        previous = run_sql_query(
+            "SELECT filename, rows_stored FROM upload_files WHERE file_hash = %s AND source_id = %s",
+            (file_hash, source_id)
+        )
+        if previous:
+            inc("upload_rows_total", previous[0][1], status="skipped")
+            return {
+                "message": f"{filename} was already uploaded as {previous[0][0]}; nothing to do",
+                "rows_processed": 0,
+                "new": 0,
+                "updated": 0,
+                "skipped": previous[0][1],
+                "errors": 0,
+                "data_preview": []
+            }
+        
+        # Read the file in chunks based on extension; Excel/Parquet/Arrow keep only the mapped columns
+        chunks = iter_upload(file_content, filename)
+        if chunks is None:
             return {"error": "Unsupported file format"}
         
-        # Data validation and cleaning
-        df_cleaned = clean_groundwater_data(df)
+        new = 0
+        updated = 0
+        skipped = 0
+        errors = 0
+        data_preview = None
+        touched_wells = set()
+        for df in chunks:
+            # Data validation and cleaning
+            df_cleaned = clean_groundwater_data(df)
+            
+            if df_cleaned.empty:
+                continue
+            if data_preview is None:
+                data_preview = df_cleaned.head(5).to_dict('records')
+            
+            # Upsert into database
+            chunk_new, chunk_updated, chunk_skipped, chunk_errors = insert_groundwater_data(df_cleaned, source_id)
+            touched_wells.update(df_cleaned['well_id'].astype(str))
+            new += chunk_new
+            updated += chunk_updated
+            skipped += chunk_skipped
+            errors += chunk_errors
         
-        if df_cleaned.empty:
+        if data_preview is None:
             return {"error": "No valid data found after cleaning"}
         
-        # Insert into database
-        rows_inserted, errors = insert_groundwater_data(df_cleaned)
+        # Remember fully ingested files; ones with failed rows can be uploaded again
+        if errors == 0:
+            run_sql_query(
+                "INSERT INTO upload_files (file_hash, source_id, filename, rows_stored) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
+                (file_hash, source_id, filename, new + updated + skipped)
+            )
+        
+        # Bring the precomputed fact passages for these wells and their locations up to date,
+        # and let the SQL planner see any location names the upload introduced
+        if new or updated:
+            refresh_facts(SQL_DIALECT, run_sql_query, touched_wells)
+            refresh_schema(SQL_DIALECT)
+        
+        # Upload throughput is rate(upload_rows_total) on the metrics side
+        inc("upload_rows_total", new, status="new")
+        inc("upload_rows_total", updated, status="updated")
+        inc("upload_rows_total", skipped, status="skipped")
+        inc("upload_rows_total", errors, status="error")
+        observe("upload_duration_seconds", time.perf_counter() - start_time)
         
         return {
             "message": f"Successfully processed {filename}",
-            "rows_processed": rows_inserted,
+            "rows_processed": new + updated,
+            "new": new,
+            "updated": updated,
+            "skipped": skipped,
             "errors": errors,
-            "data_preview": df_cleaned.head(5).to_dict('records')
+            "data_preview": data_preview
         }
         
     except Exception as e:
@@ -41,29 +155,14 @@ def process_uploaded_data(file_content: bytes, filename: str) -> dict:
 
 def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and validate groundwater data."""
-    df_clean = df.copy()
-    
-    # Remove completely empty rows
-    df_clean = df_clean.dropna(how='all')
+    # Remove completely empty rows (a new frame, so the caller's is untouched)
+    df_clean = df.dropna(how='all')
     
     # Standardize column names (case insensitive)
     df_clean.columns = df_clean.columns.str.lower().str.strip()
     
     # Map common column variations
-    column_mapping = {
-        'well_id': ['well_id', 'wellid', 'well', 'id'],
-        'location_name': ['location_name', 'location', 'site', 'site_name'],
-        'latitude': ['latitude', 'lat', 'y'],
-        'longitude': ['longitude', 'lon', 'lng', 'x'],
-        'water_level_meters': ['water_level_meters', 'water_level', 'level', 'depth'],
-        'measurement_date': ['measurement_date', 'date', 'measurement_date', 'timestamp'],
-        'quality_ph': ['quality_ph', 'ph', 'ph_value'],
-        'quality_tds': ['quality_tds', 'tds', 'tds_value'],
-        'depth_meters': ['depth_meters', 'well_depth', 'total_depth']
-    }
-    
-    # Try to map columns
-    for standard_name, variations in column_mapping.items():
+    for standard_name, variations in COLUMN_MAPPING.items():
         for variation in variations:
             if variation in df_clean.columns:
                 df_clean = df_clean.rename(columns={variation: standard_name})
@@ -79,41 +178,44 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     
     # Data type conversions and cleaning
     try:
-        # Convert date column
-        if 'measurement_date' in df_clean.columns:
+        # Convert date column (typed Parquet/Arrow dates are already datetime64)
+        if 'measurement_date' in df_clean.columns and not pd.api.types.is_datetime64_any_dtype(df_clean['measurement_date']):
             df_clean['measurement_date'] = pd.to_datetime(df_clean['measurement_date'], errors='coerce')
         
         # Convert numeric columns
         numeric_columns = ['latitude', 'longitude', 'water_level_meters', 'quality_ph', 'quality_tds', 'depth_meters']
         for col in numeric_columns:
-            if col in df_clean.columns:
+            if col in df_clean.columns and not pd.api.types.is_numeric_dtype(df_clean[col]):
                 df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
         
-        # Remove rows with invalid coordinates
+        # Categorical ids and float32 measurements before filtering, so the filtered copy is compact;
+        # the PostGIS geometry is built by the INSERT rather than stored as WKT text
+        df_clean = compact_frame(df_clean)
+        
+        # Remove rows with invalid coordinates or water levels (NaN fails every comparison),
+        # filtering once so the frame is copied once
+        valid = pd.Series(True, index=df_clean.index)
         if 'latitude' in df_clean.columns and 'longitude' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['latitude', 'longitude'])
-            df_clean = df_clean[(df_clean['latitude'] >= -90) & (df_clean['latitude'] <= 90)]
-            df_clean = df_clean[(df_clean['longitude'] >= -180) & (df_clean['longitude'] <= 180)]
+            valid &= df_clean['latitude'].between(-90, 90) & df_clean['longitude'].between(-180, 180)
         
-        # Remove rows with invalid water levels
         if 'water_level_meters' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['water_level_meters'])
-            df_clean = df_clean[df_clean['water_level_meters'] > 0]
+            valid &= df_clean['water_level_meters'] > 0
+        
+        # Readings are keyed by well and date, so undated rows cannot be stored
+        valid &= df_clean['measurement_date'].notna()
+        
+        df_clean = df_clean[valid]
         
         # Fill missing location names with well_id
         if 'location_name' in df_clean.columns:
-            df_clean['location_name'] = df_clean['location_name'].fillna(df_clean['well_id'])
+            missing_names = df_clean['location_name'].isna()
+            if missing_names.any():
+                # Via plain values, since a categorical column cannot take names it has not seen
+                filled = df_clean['location_name'].astype(object).where(~missing_names, df_clean['well_id'].astype(object))
+                df_clean['location_name'] = filled.astype('category')
         else:
             df_clean['location_name'] = df_clean['well_id']
         
-        # Create geometry column for PostGIS
-        if 'latitude' in df_clean.columns and 'longitude' in df_clean.columns:
-            df_clean['geom'] = df_clean.apply(
-                lambda row: f"POINT({row['longitude']} {row['latitude']})" 
-                if pd.notna(row['latitude']) and pd.notna(row['longitude']) else None, 
-                axis=1
-            )
-        
         return df_clean
         
     except Exception as e:
@@ -121,122 +223,514 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def insert_groundwater_data(df: pd.DataFrame) -> tuple:
-    """Insert cleaned data into PostgreSQL database."""
-    rows_inserted = 0
+def insert_groundwater_data(df: pd.DataFrame, source_id: str = "") -> tuple:
+    """Upsert cleaned data into PostgreSQL database in batches; returns (new, updated, skipped, errors)."""
+    new = 0
+    updated = 0
     errors = 0
     
+    # UPSERT_MEASUREMENTS leaves rows whose values match what is stored alone; they count as skipped
     try:
-        for _, row in df.iterrows():
+        # A reading repeated within the file, or within a day: the last one wins, the rest are skipped
+        unique = unique_readings(df)
+        rows = insert_rows(unique.assign(source_id=source_id), INSERT_COLUMNS + ['source_id'])
+        
+        for start in range(0, len(rows), UPLOAD_BATCH_ROWS):
+            batch = rows[start:start + UPLOAD_BATCH_ROWS]
             try:
-                # Prepare the insert query
-                insert_query = """
-                    INSERT INTO groundwater_data 
-                    (well_id, location_name, latitude, longitude, depth_meters, 
-                     water_level_meters, measurement_date, quality_ph, quality_tds, geom)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))
-                """
-                
-                # Prepare values
-                values = (
-                    row.get('well_id'),
-                    row.get('location_name'),
-                    row.get('latitude'),
-                    row.get('longitude'),
-                    row.get('depth_meters'),
-                    row.get('water_level_meters'),
-                    row.get('measurement_date'),
-                    row.get('quality_ph'),
-                    row.get('quality_tds'),
-                    row.get('longitude'),
-                    row.get('latitude')
-                )
-                
-                # Execute the query
-                run_sql_query(insert_query, values)
-                rows_inserted += 1
-                
+                batch_new, batch_updated = run_bulk_upsert(UPSERT_MEASUREMENTS, batch)
+                new += batch_new
+                updated += batch_updated
             except Exception as e:
-                print(f"Error inserting row: {str(e)}")
-                errors += 1
-                continue
+                # One bad row fails its whole batch; retry row by row to keep the rest
+                print(f"Error inserting batch, retrying row by row: {str(e)}")
+                for values in batch:
+                    try:
+                        row_new, row_updated = run_bulk_upsert(UPSERT_MEASUREMENTS, [values])
+                        new += row_new
+                        updated += row_updated
+                    except Exception as e:
+                        print(f"Error inserting row: {str(e)}")
+                        errors += 1
         
-        return rows_inserted, errors
+        # Their trend and quality statistics are recomputed on the next lookup
+        mark_wells_changed(SQL_DIALECT, unique['well_id'].unique())
+        return new, updated, len(df) - new - updated - errors, errors
         
     except Exception as e:
         print(f"Database insertion error: {str(e)}")
-        return 0, len(df)
+        return 0, 0, 0, len(df)
+
+
+# Series plotted when the database is not available
+FALLBACK_CHART_ROWS = [
+    (1, '2023-01', 45.2),
+    (2, '2023-02', 47.8),
+    (3, '2023-03', 43.1),
+    (4, '2023-04', 49.5),
+    (5, '2023-05', 52.3),
+    (6, '2023-06', 48.7)
+]
+
+def render_chart(results: pd.DataFrame, query: str, xlabel: str = 'Date', ylabel: str = 'Value') -> str:
+    """Plot the last two columns of a query result as (label, value) and return the URL."""
+    if results.empty:
+        return "No data available to plot"
+    
+    # Use the last two columns as (label, value)
+    df = results.iloc[:, -2:].set_axis(['date', 'value'], axis=1)
+    
+    with in_progress("chart_renders_in_progress"), span("render_chart", backend="matplotlib", points=len(df)):
+        # Create the chart on a Figure of its own: pyplot's global state is not thread-safe
+        figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        
+        # Determine chart type based on query content
+        if 'bar' in query.lower() or 'count' in query.lower():
+            ax.bar(df['date'], df['value'])
+            ax.set_title('Bar Chart - Groundwater Data')
+        else:
+            ax.plot(df['date'], df['value'], marker='o')
+            ax.set_title('Trend Chart - Groundwater Data')
+        
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.tick_params(axis='x', labelrotation=45)
+        figure.tight_layout()
+        
+        # Save chart, renaming a per-thread file into place so concurrent renders never interleave
+        chart_path = 'static/chart.png'
+        tmp_path = f"{chart_path}.{threading.get_ident()}.tmp"
+        figure.savefig(tmp_path, format='png', dpi=300, bbox_inches='tight')
+        os.replace(tmp_path, chart_path)
+    
+    return f"/static/chart.png"
 
 
-def generate_chart(query: str) -> str:
+def generate_chart(query: str, params=None, xlabel: str = 'Date', ylabel: str = 'Value') -> str:
     """Generate a matplotlib chart from SQL query results and return the URL."""
     try:
-        # Try to run the actual query
+        # Try to run the actual query (read-only, with a statement timeout), straight into columns
         try:
-            results = run_sql_query(query)
+            with span("run_sql_query", backend=SQL_DIALECT) as stage:
+                results = run_readonly_frame(query, params, timeout=SQL_TIMEOUT_SECONDS)
+                stage.set(rows=len(results))
         except Exception:
             # Fallback to dummy data if Postgres is not available
-            results = [
-                (1, '2023-01', 45.2),
-                (2, '2023-02', 47.8),
-                (3, '2023-03', 43.1),
-                (4, '2023-04', 49.5),
-                (5, '2023-05', 52.3),
-                (6, '2023-06', 48.7)
-            ]
-        
-        if not results:
-            return "No data available to plot"
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(results, columns=['id', 'date', 'value'])
+            results = pd.DataFrame(FALLBACK_CHART_ROWS)
         
-        # Create the chart
-        plt.figure(figsize=(10, 6))
+        return render_chart(results, query, xlabel, ylabel)
         
-        # Determine chart type based on query content
-        if 'bar' in query.lower() or 'count' in query.lower():
-            plt.bar(df['date'], df['value'])
-            plt.title('Bar Chart - Groundwater Data')
-        else:
-            plt.plot(df['date'], df['value'], marker='o')
-            plt.title('Trend Chart - Groundwater Data')
+    except Exception as e:
+        record_error(e)
+        return f"Error generating chart: {str(e)}"
+
+
+async def generate_chart_async(query: str, params=None, xlabel: str = 'Date', ylabel: str = 'Value') -> str:
+    """generate_chart for async servers: the query is awaited and matplotlib runs on a worker thread."""
+    try:
+        try:
+            with span("run_sql_query", backend=SQL_DIALECT) as stage:
+                results = await run_readonly_frame_async(query, params, timeout=SQL_TIMEOUT_SECONDS)
+                stage.set(rows=len(results))
+        except Exception:
+            # Fallback to dummy data if Postgres is not available
+            results = pd.DataFrame(FALLBACK_CHART_ROWS)
         
-        plt.xlabel('Date')
-        plt.ylabel('Value')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        return await asyncio.to_thread(render_chart, results, query, xlabel, ylabel)
         
-        # Save chart
-        chart_path = 'static/chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
+    except Exception as e:
+        record_error(e)
+        return f"Error generating chart: {str(e)}"
+
+
+MAP_PLACEHOLDER = "[Map tool placeholder: would call PostGIS and return visualization URL]"
+
+
+def load_sql_schema() -> dict:
+    """Introspect and cache the database schema used by the text-to-SQL route."""
+    return load_schema(SQL_DIALECT, run_sql_query)
+
+
+def build_facts() -> int:
+    """Regenerate every precomputed fact passage from the current data."""
+    return refresh_facts(SQL_DIALECT, run_sql_query)
+
+
+def plan_question_sql(question: str, chart: bool = False, schema: dict = None) -> dict:
+    """Turn an analytical question into a validated, parameterized query plan."""
+    schema = schema or get_schema(SQL_DIALECT, run_sql_query)
+    plan = plan_sql(question, schema, SQL_DIALECT, chart=chart)
+    plan["sql"] = validate_sql(plan["sql"], schema)
+    return plan
+
+
+def answer_analytical_question(question: str):
+    """Answer an aggregate question with a bounded, read-only query (None on failure)."""
+    try:
+        # Declining, rising, breaching and seasonal wells come from the cached per-well statistics
+        if classify_well_question(question):
+            with span("well_stats") as stage:
+                stats = get_well_stats(SQL_DIALECT, run_sql_query)
+                stage.set(wells=len(stats))
+            return answer_well_question(question, stats)
         
-        return f"/static/chart.png"
+        with span("plan_sql"):
+            plan = plan_question_sql(question)
+        with span("run_sql_query", backend=SQL_DIALECT) as stage:
+            rows = run_readonly_query(plan["sql"], plan["params"], timeout=SQL_TIMEOUT_SECONDS)
+            stage.set(rows=len(rows))
+        return format_sql_answer(plan, rows)
+    except Exception as e:
+        print(f"Error answering analytical question: {str(e)}")
+        record_error(e)
+        return None
+
+
+def generate_question_chart(question: str) -> str:
+    """Plan the series a chart question asks for and render it."""
+    try:
+        with span("plan_sql"):
+            plan = plan_question_sql(question, chart=True)
+    except Exception as e:
+        record_error(e)
+        return f"Error generating chart: {str(e)}"
+    
+    xlabel = plan["grouping"].title() if plan["grouping"] in ("well", "location") else "Date"
+    return generate_chart(plan["sql"], plan["params"], xlabel=xlabel, ylabel=plan["metric_label"])
+
+
+async def question_schema_async() -> dict:
+    """The cached schema; introspection, when due, runs on a worker thread rather than the event loop."""
+    return cached_schema(SQL_DIALECT) or await asyncio.to_thread(get_schema, SQL_DIALECT, run_sql_query)
+
+
+async def answer_analytical_question_async(question: str):
+    """answer_analytical_question with the query awaited on the async pool (None on failure)."""
+    try:
+        if classify_well_question(question):
+            with span("well_stats") as stage:
+                stats = await asyncio.to_thread(get_well_stats, SQL_DIALECT, run_sql_query)
+                stage.set(wells=len(stats))
+            return answer_well_question(question, stats)
         
+        with span("plan_sql"):
+            plan = plan_question_sql(question, schema=await question_schema_async())
+        with span("run_sql_query", backend=SQL_DIALECT) as stage:
+            rows = await run_readonly_query_async(plan["sql"], plan["params"], timeout=SQL_TIMEOUT_SECONDS)
+            stage.set(rows=len(rows))
+        return format_sql_answer(plan, rows)
+    except Exception as e:
+        print(f"Error answering analytical question: {str(e)}")
+        record_error(e)
+        return None
+
+
+async def answer_analytical_questions_async(questions: List[str]) -> dict:
+    """Answer several analytical questions, their queries run concurrently on the async pool; question -> answer (None on failure)."""
+    answers = {}
+    
+    well_questions = [question for question in questions if classify_well_question(question)]
+    if well_questions:
+        try:
+            with span("well_stats") as stage:
+                stats = await asyncio.to_thread(get_well_stats, SQL_DIALECT, run_sql_query)
+                stage.set(wells=len(stats))
+            for question in well_questions:
+                answers[question] = answer_well_question(question, stats)
+        except Exception as e:
+            print(f"Error answering analytical question: {str(e)}")
+            record_error(e)
+            answers.update((question, None) for question in well_questions)
+    
+    plans = {}
+    with span("plan_sql"):
+        schema = await question_schema_async()
+        for question in questions:
+            if question in answers:
+                continue
+            try:
+                plans[question] = plan_question_sql(question, schema=schema)
+            except Exception as e:
+                record_error(e)
+                answers[question] = None
+    
+    with span("run_sql_query", backend=SQL_DIALECT, queries=len(plans)):
+        results = await run_queries_async(
+            [(plan["sql"], plan["params"]) for plan in plans.values()],
+            timeout=SQL_TIMEOUT_SECONDS, return_exceptions=True
+        )
+    for (question, plan), rows in zip(plans.items(), results):
+        if isinstance(rows, Exception):
+            print(f"Error answering analytical question: {str(rows)}")
+            record_error(rows)
+            answers[question] = None
+        else:
+            answers[question] = format_sql_answer(plan, rows)
+    return answers
+
+
+async def generate_question_chart_async(question: str) -> str:
+    """generate_question_chart with the query awaited on the async pool."""
+    try:
+        with span("plan_sql"):
+            plan = plan_question_sql(question, chart=True, schema=await question_schema_async())
     except Exception as e:
+        record_error(e)
         return f"Error generating chart: {str(e)}"
+    
+    xlabel = plan["grouping"].title() if plan["grouping"] in ("well", "location") else "Date"
+    return await generate_chart_async(plan["sql"], plan["params"], xlabel=xlabel, ylabel=plan["metric_label"])
+
+
+def route_question(question: str) -> str:
+    """Classify a question as a 'map', 'chart', 'analytics' or 'hybrid' search question."""
+    question_lower = question.lower()
+    
+    if "map" in question_lower:
+        return "map"
+    elif any(keyword in question_lower for keyword in ["trend", "timeseries", "chart"]):
+        return "chart"
+    elif is_analytical_question(question) or classify_well_question(question):
+        return "analytics"
+    else:
+        return "hybrid"
+
+
+def select_answer(semantic_results: list, keyword_results: list) -> str:
+    """Return the top hybrid search result safely."""
+    if semantic_results:
+        return semantic_results[0]
+    elif keyword_results:
+        return keyword_results[0]
+    else:
+        return "No results found."
+
+
+def synthesize_answer(question: str, semantic_results: list, keyword_results: list) -> str:
+    """Generate an answer from the fused passages, falling back to the top passage."""
+    passages = fuse_passages(semantic_results, keyword_results)
+    if not passages:
+        return "No results found."
+    
+    with span("generate_answer", backend="ollama", passages=len(passages)) as stage:
+        # Reuse the answer if this question was already asked against the same passages
+        key = cache_key(question, passages)
+        cached_answer = get_cached_answer(key)
+        stage.set(cache_hit=cached_answer is not None)
+        if cached_answer is not None:
+            return cached_answer
+        
+        try:
+            answer = generate_answer(question, passages)
+            if answer:
+                store_answer(key, passages, answer)
+                return answer
+        except Exception as e:
+            print(f"Error generating answer: {str(e)}")
+            stage.record_error(e)
+        
+        stage.set(fallback=True)
+        return select_answer(semantic_results, keyword_results)
 
 
 def run_rag_pipeline(question: str) -> str:
     """Decide retrieval route based on query type."""
+    with span("route") as stage:
+        route = route_question(question)
+        stage.set(route=route)
+    
+    if route == "map":
+        return MAP_PLACEHOLDER
+    elif route == "chart":
+        return generate_question_chart(question)
+    elif route == "analytics":
+        answer = answer_analytical_question(question)
+        if answer is not None:
+            return answer
+    
+    # Try hybrid search
+    semantic_results = semantic_search(question)
+    keyword_results = bm25_search(question)
+    
+    return synthesize_answer(question, semantic_results, keyword_results)
 
 
-    if "map" in question.lower():
-        return "[Map tool placeholder: would call PostGIS and return visualization URL]"
-    elif any(keyword in question.lower() for keyword in ["trend", "timeseries", "chart"]):
-        # Generate a sample SQL query for demonstration
-        sample_query = "SELECT * FROM groundwater_data ORDER BY date LIMIT 10"
-        return generate_chart(sample_query)
+async def run_rag_pipeline_async(question: str) -> str:
+    """run_rag_pipeline without blocking the event loop: queries are awaited, blocking stages run on worker threads."""
+    with span("route") as stage:
+        route = route_question(question)
+        stage.set(route=route)
+    
+    if route == "map":
+        return MAP_PLACEHOLDER
+    elif route == "chart":
+        return await generate_question_chart_async(question)
+    elif route == "analytics":
+        answer = await answer_analytical_question_async(question)
+        if answer is not None:
+            return answer
+    
+    # Semantic and keyword retrieval run concurrently
+    semantic_results, keyword_results = await asyncio.gather(
+        asyncio.to_thread(semantic_search, question),
+        asyncio.to_thread(bm25_search, question),
+    )
+    
+    return await asyncio.to_thread(synthesize_answer, question, semantic_results, keyword_results)
+
+
+def run_rag_pipeline_batch(questions: List[str]) -> List[str]:
+    """Answer a list of questions in order, batching retrieval across them."""
+    with span("route", questions=len(questions)):
+        routes = [route_question(question) for question in questions]
+    answers = [None] * len(questions)
+    
+    # Charts and analytical answers that repeat within the batch are computed once
+    charts = {}
+    analytics = {}
+    for i, (question, route) in enumerate(zip(questions, routes)):
+        if route == "map":
+            answers[i] = MAP_PLACEHOLDER
+        elif route == "chart":
+            if question not in charts:
+                charts[question] = generate_question_chart(question)
+            answers[i] = charts[question]
+        elif route == "analytics":
+            if question not in analytics:
+                analytics[question] = answer_analytical_question(question)
+            answers[i] = analytics[question]
+    
+    # Hybrid questions (and analytical ones that could not be answered with SQL)
+    hybrid_indexes = [i for i, answer in enumerate(answers) if answer is None]
+    if hybrid_indexes:
+        hybrid_answers = answer_hybrid_batch([questions[i] for i in hybrid_indexes])
+        for i, answer in zip(hybrid_indexes, hybrid_answers):
+            answers[i] = answer
+    
+    return answers
+
+
+def answer_hybrid_batch(questions: List[str]) -> List[str]:
+    """Hybrid answers for several questions, sharing one embedding batch, one Qdrant request and one SQLite connection."""
+    semantic_batch = semantic_search_batch(questions)
+    keyword_batch = bm25_search_batch(questions)
+    
+    # Generate answers concurrently, up to the model's in-flight cap
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_GENERATIONS) as executor:
+        return list(executor.map(propagate(synthesize_answer), questions, semantic_batch, keyword_batch))
+
+
+async def run_rag_pipeline_batch_async(questions: List[str]) -> List[str]:
+    """run_rag_pipeline_batch for async servers: analytical queries run concurrently on the async pool,
+    charts are rendered concurrently, and retrieval and generation run on a worker thread."""
+    with span("route", questions=len(questions)):
+        routes = [route_question(question) for question in questions]
+    
+    # Charts and analytical answers that repeat within the batch are computed once
+    charts = list(dict.fromkeys(question for question, route in zip(questions, routes) if route == "chart"))
+    analytical = list(dict.fromkeys(question for question, route in zip(questions, routes) if route == "analytics"))
+    chart_urls, analytical_answers = await asyncio.gather(
+        asyncio.gather(*(generate_question_chart_async(question) for question in charts)),
+        answer_analytical_questions_async(analytical),
+    )
+    chart_urls = dict(zip(charts, chart_urls))
+    
+    answers = []
+    for question, route in zip(questions, routes):
+        if route == "map":
+            answers.append(MAP_PLACEHOLDER)
+        elif route == "chart":
+            answers.append(chart_urls[question])
+        else:
+            answers.append(analytical_answers.get(question))
+    
+    hybrid_indexes = [i for i, answer in enumerate(answers) if answer is None]
+    if hybrid_indexes:
+        hybrid_answers = await asyncio.to_thread(answer_hybrid_batch, [questions[i] for i in hybrid_indexes])
+        for i, answer in zip(hybrid_indexes, hybrid_answers):
+            answers[i] = answer
+    
+    return answers
+
+
+def iter_answer_tokens(answer: str) -> Iterator[str]:
+    """Split an answer into word-sized tokens, keeping trailing whitespace."""
+    for token in re.findall(r'\S+\s*', answer):
+        yield token
+
+
+def run_rag_pipeline_stream(question: str) -> Iterator[Tuple[str, dict]]:
+    """Run the RAG pipeline, yielding (event, data) pairs as each stage completes."""
+    with span("route") as stage:
+        route = route_question(question)
+        stage.set(route=route)
+    yield "route", {"route": route}
+    
+    if route == "map":
+        answer = MAP_PLACEHOLDER
+    elif route == "chart":
+        answer = generate_question_chart(question)
+        yield "chart", {"url": answer}
     else:
+        answer = answer_analytical_question(question) if route == "analytics" else None
+    
+    if answer is None:
         # Try hybrid search
         semantic_results = semantic_search(question)
         keyword_results = bm25_search(question)
-
-        # Return top result safely
-        if semantic_results:
-            return semantic_results[0]
-        elif keyword_results:
-            return keyword_results[0]
-        else:
-            return "No results found."
+        yield "retrieval", {"semantic": semantic_results, "keyword": keyword_results}
+        
+        passages = fuse_passages(semantic_results, keyword_results)
+        key = cache_key(question, passages)
+        cached_answer = get_cached_answer(key) if passages else None
+        
+        # The generation span stays open across yields, so it is ended by hand
+        generation = start_span("generate_answer", backend="ollama", passages=len(passages), cache_hit=cached_answer is not None)
+        
+        if cached_answer is not None:
+            if generation:
+                generation.end()
+            for token in iter_answer_tokens(cached_answer):
+                yield "token", {"text": token}
+            yield "done", {"answer": cached_answer, "cached": True}
+            return
+        
+        # Stream tokens straight from the model as they are generated
+        tokens = []
+        failed = False
+        try:
+            if passages:
+                for token in generate_answer_stream(question, passages):
+                    tokens.append(token)
+                    yield "token", {"text": token}
+                
+                # Only complete generations are cached
+                if tokens:
+                    store_answer(key, passages, "".join(tokens).strip())
+        except Exception as e:
+            print(f"Error generating answer: {str(e)}")
+            failed = True
+            if generation:
+                generation.record_error(e)
+        
+        if generation:
+            generation.set(tokens=len(tokens))
+            generation.end()
+        
+        if tokens and not failed:
+            yield "done", {"answer": "".join(tokens).strip()}
+            return
+        
+        if tokens:
+            # A truncated answer is never presented as complete: the client drops the tokens
+            # it has shown and the top passage follows instead
+            yield "error", {"error": "Answer generation failed partway through", "discard_tokens": True}
+        
+        answer = select_answer(semantic_results, keyword_results)
+    
+    for token in iter_answer_tokens(answer):
+        yield "token", {"text": token}
+    
+    yield "done", {"answer": answer}
@@ -1,36 +1,91 @@
-from sqlite_postgres_utils import run_sql_query
+from sqlite_postgres_utils import run_sql_query, run_bulk_upsert, ensure_upload_schema
 from sqlite_utils import bm25_search
+from upload_readers import (
+    COLUMN_MAPPING, INSERT_COLUMNS, UPLOAD_BATCH_ROWS, UploadSource,
+    compact_frame, file_sha256, iter_upload, insert_rows, unique_readings
+)
+from metrics import inc, observe
 import pandas as pd
 import os
-import io
+import time
 from datetime import datetime
 
 
-def process_uploaded_data(file_content: bytes, filename: str) -> dict:
-    """Process uploaded Excel/CSV file and insert into database."""
+def process_uploaded_data(file_content: UploadSource, filename: str, source_id: str = "") -> dict:
+    """Process uploaded Excel/CSV/Parquet/Arrow bytes or spooled file and upsert it into database."""
+    start_time = time.perf_counter()
     try:
-        # Read the file based on extension
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(file_content))
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(file_content))
-        else:
+        ensure_upload_schema()
+        
+        # An exact re-upload of a file already ingested from this source changes nothing
+        file_hash = file_sha256(file_content)
+        previous = run_sql_query(
+            "SELECT filename, rows_stored FROM upload_files WHERE file_hash = ? AND source_id = ?",
+            (file_hash, source_id)
+        )
+        if previous:
+            inc("upload_rows_total", previous[0][1], status="skipped")
+            return {
+                "message": f"{filename} was already uploaded as {previous[0][0]}; nothing to do",
+                "rows_processed": 0,
+                "new": 0,
+                "updated": 0,
+                "skipped": previous[0][1],
+                "errors": 0,
+                "data_preview": []
+            }
+        
+        # Read the file in chunks based on extension; Excel/Parquet/Arrow keep only the mapped columns
+        chunks = iter_upload(file_content, filename)
+        if chunks is None:
             return {"error": "Unsupported file format"}
         
-        # Data validation and cleaning
-        df_cleaned = clean_groundwater_data(df)
+        new = 0
+        updated = 0
+        skipped = 0
+        errors = 0
+        data_preview = None
+        for df in chunks:
+            # Data validation and cleaning
+            df_cleaned = clean_groundwater_data(df)
+            
+            if df_cleaned.empty:
+                continue
+            if data_preview is None:
+                data_preview = df_cleaned.head(5).to_dict('records')
+            
+            # Upsert into database
+            chunk_new, chunk_updated, chunk_skipped, chunk_errors = insert_groundwater_data(df_cleaned, source_id)
+            new += chunk_new
+            updated += chunk_updated
+            skipped += chunk_skipped
+            errors += chunk_errors
         
-        if df_cleaned.empty:
+        if data_preview is None:
             return {"error": "No valid data found after cleaning"}
         
-        # Insert into database
-        rows_inserted, errors = insert_groundwater_data(df_cleaned)
+        # Remember fully ingested files; ones with failed rows can be uploaded again
+        if errors == 0:
+            run_sql_query(
+                "INSERT OR IGNORE INTO upload_files (file_hash, source_id, filename, rows_stored) VALUES (?, ?, ?, ?)",
+                (file_hash, source_id, filename, new + updated + skipped)
+            )
+        
+        # Upload throughput is rate(upload_rows_total) on the metrics side
+        inc("upload_rows_total", new, status="new")
+        inc("upload_rows_total", updated, status="updated")
+        inc("upload_rows_total", skipped, status="skipped")
+        inc("upload_rows_total", errors, status="error")
+        observe("upload_duration_seconds", time.perf_counter() - start_time)
         
         return {
             "message": f"Successfully processed {filename}",
-            "rows_processed": rows_inserted,
+            "rows_processed": new + updated,
+            "new": new,
+            "updated": updated,
+            "skipped": skipped,
             "errors": errors,
-            "data_preview": df_cleaned.head(5).to_dict('records')
+            "data_preview": data_preview
         }
         
     except Exception as e:
@@ -39,29 +94,14 @@ def process_uploaded_data(file_content: bytes, filename: str) -> dict:
 
 def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and validate groundwater data."""
-    df_clean = df.copy()
-    
-    # Remove completely empty rows
-    df_clean = df_clean.dropna(how='all')
+    # Remove completely empty rows (a new frame, so the caller's is untouched)
+    df_clean = df.dropna(how='all')
     
     # Standardize column names (case insensitive)
     df_clean.columns = df_clean.columns.str.lower().str.strip()
     
     # Map common column variations
-    column_mapping = {
-        'well_id': ['well_id', 'wellid', 'well', 'id'],
-        'location_name': ['location_name', 'location', 'site', 'site_name'],
-        'latitude': ['latitude', 'lat', 'y'],
-        'longitude': ['longitude', 'lon', 'lng', 'x'],
-        'water_level_meters': ['water_level_meters', 'water_level', 'level', 'depth'],
-        'measurement_date': ['measurement_date', 'date', 'measurement_date', 'timestamp'],
-        'quality_ph': ['quality_ph', 'ph', 'ph_value'],
-        'quality_tds': ['quality_tds', 'tds', 'tds_value'],
-        'depth_meters': ['depth_meters', 'well_depth', 'total_depth']
-    }
-    
-    # Try to map columns
-    for standard_name, variations in column_mapping.items():
+    for standard_name, variations in COLUMN_MAPPING.items():
         for variation in variations:
             if variation in df_clean.columns:
                 df_clean = df_clean.rename(columns={variation: standard_name})
@@ -77,30 +117,40 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     
     # Data type conversions and cleaning
     try:
-        # Convert date column
-        if 'measurement_date' in df_clean.columns:
+        # Convert date column (typed Parquet/Arrow dates are already datetime64)
+        if 'measurement_date' in df_clean.columns and not pd.api.types.is_datetime64_any_dtype(df_clean['measurement_date']):
             df_clean['measurement_date'] = pd.to_datetime(df_clean['measurement_date'], errors='coerce')
         
         # Convert numeric columns
         numeric_columns = ['latitude', 'longitude', 'water_level_meters', 'quality_ph', 'quality_tds', 'depth_meters']
         for col in numeric_columns:
-            if col in df_clean.columns:
+            if col in df_clean.columns and not pd.api.types.is_numeric_dtype(df_clean[col]):
                 df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
         
-        # Remove rows with invalid coordinates
+        # Categorical ids and float32 measurements before filtering, so the filtered copy is compact
+        df_clean = compact_frame(df_clean)
+        
+        # Remove rows with invalid coordinates or water levels (NaN fails every comparison),
+        # filtering once so the frame is copied once
+        valid = pd.Series(True, index=df_clean.index)
         if 'latitude' in df_clean.columns and 'longitude' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['latitude', 'longitude'])
-            df_clean = df_clean[(df_clean['latitude'] >= -90) & (df_clean['latitude'] <= 90)]
-            df_clean = df_clean[(df_clean['longitude'] >= -180) & (df_clean['longitude'] <= 180)]
+            valid &= df_clean['latitude'].between(-90, 90) & df_clean['longitude'].between(-180, 180)
         
-        # Remove rows with invalid water levels
         if 'water_level_meters' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['water_level_meters'])
-            df_clean = df_clean[df_clean['water_level_meters'] > 0]
+            valid &= df_clean['water_level_meters'] > 0
+        
+        # Readings are keyed by well and date, so undated rows cannot be stored
+        valid &= df_clean['measurement_date'].notna()
+        
+        df_clean = df_clean[valid]
         
         # Fill missing location names with well_id
         if 'location_name' in df_clean.columns:
-            df_clean['location_name'] = df_clean['location_name'].fillna(df_clean['well_id'])
+            missing_names = df_clean['location_name'].isna()
+            if missing_names.any():
+                # Via plain values, since a categorical column cannot take names it has not seen
+                filled = df_clean['location_name'].astype(object).where(~missing_names, df_clean['well_id'].astype(object))
+                df_clean['location_name'] = filled.astype('category')
         else:
             df_clean['location_name'] = df_clean['well_id']
         
@@ -111,49 +161,59 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def insert_groundwater_data(df: pd.DataFrame) -> tuple:
-    """Insert cleaned data into SQLite database."""
-    rows_inserted = 0
+def insert_groundwater_data(df: pd.DataFrame, source_id: str = "") -> tuple:
+    """Upsert cleaned data into SQLite database in batches; returns (new, updated, skipped, errors)."""
+    new = 0
+    updated = 0
     errors = 0
     
+    # Rows whose values match what is stored are left alone and count as skipped
+    upsert_query = """
+        INSERT INTO groundwater_data 
+        (well_id, location_name, latitude, longitude, depth_meters, 
+         water_level_meters, measurement_date, quality_ph, quality_tds, source_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (well_id, measurement_date, source_id) DO UPDATE SET
+            location_name = excluded.location_name, latitude = excluded.latitude,
+            longitude = excluded.longitude, depth_meters = excluded.depth_meters,
+            water_level_meters = excluded.water_level_meters, quality_ph = excluded.quality_ph,
+            quality_tds = excluded.quality_tds
+        WHERE (groundwater_data.location_name, groundwater_data.latitude, groundwater_data.longitude,
+               groundwater_data.depth_meters, groundwater_data.water_level_meters,
+               groundwater_data.quality_ph, groundwater_data.quality_tds)
+            IS NOT
+              (excluded.location_name, excluded.latitude, excluded.longitude, excluded.depth_meters,
+               excluded.water_level_meters, excluded.quality_ph, excluded.quality_tds)
+    """
+    
     try:
-        for _, row in df.iterrows():
+        # A reading repeated within the file, or within a day: the last one wins, the rest are skipped
+        unique = unique_readings(df)
+        rows = insert_rows(unique.assign(source_id=source_id), INSERT_COLUMNS + ['source_id'])
+        
+        for start in range(0, len(rows), UPLOAD_BATCH_ROWS):
+            batch = rows[start:start + UPLOAD_BATCH_ROWS]
             try:
-                # Prepare the insert query for SQLite
-                insert_query = """
-                    INSERT INTO groundwater_data 
-                    (well_id, location_name, latitude, longitude, depth_meters, 
-                     water_level_meters, measurement_date, quality_ph, quality_tds)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                
-                # Prepare values
-                values = (
-                    row.get('well_id'),
-                    row.get('location_name'),
-                    row.get('latitude'),
-                    row.get('longitude'),
-                    row.get('depth_meters'),
-                    row.get('water_level_meters'),
-                    row.get('measurement_date'),
-                    row.get('quality_ph'),
-                    row.get('quality_tds')
-                )
-                
-                # Execute the query
-                run_sql_query(insert_query, values)
-                rows_inserted += 1
-                
+                batch_new, batch_updated = run_bulk_upsert(upsert_query, batch)
+                new += batch_new
+                updated += batch_updated
             except Exception as e:
-                print(f"Error inserting row: {str(e)}")
-                errors += 1
-                continue
+                # One bad row fails its whole batch; retry row by row to keep the rest
+                print(f"Error inserting batch, retrying row by row: {str(e)}")
+                for values in batch:
+                    try:
+                        row_new, row_updated = run_bulk_upsert(upsert_query, [values])
+                        new += row_new
+                        updated += row_updated
+                    except Exception as e:
+                        print(f"Error inserting row: {str(e)}")
+                        errors += 1
         
-        return rows_inserted, errors
+        return new, updated, len(df) - new - updated - errors, errors
         
     except Exception as e:
         print(f"Database insertion error: {str(e)}")
-        return 0, len(df)
+        return 0, 0, 0, len(df)
 
 
 def generate_chart(query: str) -> str:
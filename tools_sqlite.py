@@ -1,38 +1,119 @@
-from sqlite_postgres_utils import run_sql_query
-from qdrant_utils import semantic_search
-from sqlite_utils import bm25_search
+from sqlite_postgres_utils import run_sql_query, run_bulk_upsert, ensure_upload_schema
+from analytics_engine import analytics_dialect, run_analytics_query, run_analytics_frame
+from qdrant_utils import semantic_search, semantic_search_batch
+from sqlite_utils import bm25_search, bm25_search_batch
+from llm_utils import fuse_passages, generate_answer, generate_answer_stream, MAX_CONCURRENT_GENERATIONS
+from generation_cache import cache_key, get_cached_answer, store_answer
+from text_to_sql import (
+    get_schema, load_schema, refresh_schema, plan_sql, validate_sql, is_analytical_question,
+    format_sql_answer, SQL_TIMEOUT_SECONDS
+)
+from tracing import span, start_span, record_error, propagate
+from well_analytics import classify_well_question, answer_well_question, get_well_stats, mark_wells_changed
+from facts import refresh_facts
+from upload_readers import (
+    COLUMN_MAPPING, INSERT_COLUMNS, UPLOAD_BATCH_ROWS, UploadSource,
+    compact_frame, file_sha256, iter_upload, insert_rows, unique_readings
+)
+from metrics import inc, observe, in_progress
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import os
-import io
+import threading
+import time
+import re
 from datetime import datetime
+from typing import Iterator, List, Tuple
 
+# Placeholder and date-function flavour for generated SQL
+SQL_DIALECT = "sqlite"
 
-def process_uploaded_data(file_content: bytes, filename: str) -> dict:
-    """Process uploaded Excel/CSV file and insert into database."""
+
+def process_uploaded_data(file_content: UploadSource, filename: str, source_id: str = "") -> dict:
+    """Process uploaded Excel/CSV/Parquet/Arrow bytes or spooled file and upsert it into database."""
+    start_time = time.perf_counter()
     try:
-        # Read the file based on extension
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(file_content))
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(file_content))
-        else:
+        ensure_upload_schema()
+        
+        # An exact re-upload of a file already ingested from this source changes nothing
+        file_hash = file_sha256(file_content)
+        previous = run_sql_query(
+            "SELECT filename, rows_stored FROM upload_files WHERE file_hash = ? AND source_id = ?",
+            (file_hash, source_id)
+        )
+        if previous:
+            inc("upload_rows_total", previous[0][1], status="skipped")
+            return {
+                "message": f"{filename} was already uploaded as {previous[0][0]}; nothing to do",
+                "rows_processed": 0,
+                "new": 0,
+                "updated": 0,
+                "skipped": previous[0][1],
+                "errors": 0,
+                "data_preview": []
+            }
+        
+        # Read the file in chunks based on extension; Excel/Parquet/Arrow keep only the mapped columns
+        chunks = iter_upload(file_content, filename)
+        if chunks is None:
             return {"error": "Unsupported file format"}
         
-        # Data validation and cleaning
-        df_cleaned = clean_groundwater_data(df)
+        new = 0
+        updated = 0
+        skipped = 0
+        errors = 0
+        data_preview = None
+        touched_wells = set()
+        for df in chunks:
+            # Data validation and cleaning
+            df_cleaned = clean_groundwater_data(df)
+            
+            if df_cleaned.empty:
+                continue
+            if data_preview is None:
+                data_preview = df_cleaned.head(5).to_dict('records')
+            
+            # Upsert into database
+            chunk_new, chunk_updated, chunk_skipped, chunk_errors = insert_groundwater_data(df_cleaned, source_id)
+            touched_wells.update(df_cleaned['well_id'].astype(str))
+            new += chunk_new
+            updated += chunk_updated
+            skipped += chunk_skipped
+            errors += chunk_errors
         
-        if df_cleaned.empty:
+        if data_preview is None:
             return {"error": "No valid data found after cleaning"}
         
-        # Insert into database
-        rows_inserted, errors = insert_groundwater_data(df_cleaned)
+        # Remember fully ingested files; ones with failed rows can be uploaded again
+        if errors == 0:
+            run_sql_query(
+                "INSERT OR IGNORE INTO upload_files (file_hash, source_id, filename, rows_stored) VALUES (?, ?, ?, ?)",
+                (file_hash, source_id, filename, new + updated + skipped)
+            )
+        
+        # Bring the precomputed fact passages for these wells and their locations up to date,
+        # and let the SQL planner see any location names the upload introduced
+        if new or updated:
+            refresh_facts(SQL_DIALECT, run_sql_query, touched_wells)
+            refresh_schema(SQL_DIALECT)
+        
+        # Upload throughput is rate(upload_rows_total) on the metrics side
+        inc("upload_rows_total", new, status="new")
+        inc("upload_rows_total", updated, status="updated")
+        inc("upload_rows_total", skipped, status="skipped")
+        inc("upload_rows_total", errors, status="error")
+        observe("upload_duration_seconds", time.perf_counter() - start_time)
         
         return {
             "message": f"Successfully processed {filename}",
-            "rows_processed": rows_inserted,
+            "rows_processed": new + updated,
+            "new": new,
+            "updated": updated,
+            "skipped": skipped,
             "errors": errors,
-            "data_preview": df_cleaned.head(5).to_dict('records')
+            "data_preview": data_preview
         }
         
     except Exception as e:
@@ -41,29 +122,14 @@ def process_uploaded_data(file_content: bytes, filename: str) -> dict:
 
 def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and validate groundwater data."""
-    df_clean = df.copy()
-    
-    # Remove completely empty rows
-    df_clean = df_clean.dropna(how='all')
+    # Remove completely empty rows (a new frame, so the caller's is untouched)
+    df_clean = df.dropna(how='all')
     
     # Standardize column names (case insensitive)
     df_clean.columns = df_clean.columns.str.lower().str.strip()
     
     # Map common column variations
-    column_mapping = {
-        'well_id': ['well_id', 'wellid', 'well', 'id'],
-        'location_name': ['location_name', 'location', 'site', 'site_name'],
-        'latitude': ['latitude', 'lat', 'y'],
-        'longitude': ['longitude', 'lon', 'lng', 'x'],
-        'water_level_meters': ['water_level_meters', 'water_level', 'level', 'depth'],
-        'measurement_date': ['measurement_date', 'date', 'measurement_date', 'timestamp'],
-        'quality_ph': ['quality_ph', 'ph', 'ph_value'],
-        'quality_tds': ['quality_tds', 'tds', 'tds_value'],
-        'depth_meters': ['depth_meters', 'well_depth', 'total_depth']
-    }
-    
-    # Try to map columns
-    for standard_name, variations in column_mapping.items():
+    for standard_name, variations in COLUMN_MAPPING.items():
         for variation in variations:
             if variation in df_clean.columns:
                 df_clean = df_clean.rename(columns={variation: standard_name})
@@ -79,30 +145,40 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
     
     # Data type conversions and cleaning
     try:
-        # Convert date column
-        if 'measurement_date' in df_clean.columns:
+        # Convert date column (typed Parquet/Arrow dates are already datetime64)
+        if 'measurement_date' in df_clean.columns and not pd.api.types.is_datetime64_any_dtype(df_clean['measurement_date']):
             df_clean['measurement_date'] = pd.to_datetime(df_clean['measurement_date'], errors='coerce')
         
         # Convert numeric columns
         numeric_columns = ['latitude', 'longitude', 'water_level_meters', 'quality_ph', 'quality_tds', 'depth_meters']
         for col in numeric_columns:
-            if col in df_clean.columns:
+            if col in df_clean.columns and not pd.api.types.is_numeric_dtype(df_clean[col]):
                 df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
         
-        # Remove rows with invalid coordinates
+        # Categorical ids and float32 measurements before filtering, so the filtered copy is compact
+        df_clean = compact_frame(df_clean)
+        
+        # Remove rows with invalid coordinates or water levels (NaN fails every comparison),
+        # filtering once so the frame is copied once
+        valid = pd.Series(True, index=df_clean.index)
         if 'latitude' in df_clean.columns and 'longitude' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['latitude', 'longitude'])
-            df_clean = df_clean[(df_clean['latitude'] >= -90) & (df_clean['latitude'] <= 90)]
-            df_clean = df_clean[(df_clean['longitude'] >= -180) & (df_clean['longitude'] <= 180)]
+            valid &= df_clean['latitude'].between(-90, 90) & df_clean['longitude'].between(-180, 180)
         
-        # Remove rows with invalid water levels
         if 'water_level_meters' in df_clean.columns:
-            df_clean = df_clean.dropna(subset=['water_level_meters'])
-            df_clean = df_clean[df_clean['water_level_meters'] > 0]
+            valid &= df_clean['water_level_meters'] > 0
+        
+        # Readings are keyed by well and date, so undated rows cannot be stored
+        valid &= df_clean['measurement_date'].notna()
+        
+        df_clean = df_clean[valid]
         
         # Fill missing location names with well_id
         if 'location_name' in df_clean.columns:
-            df_clean['location_name'] = df_clean['location_name'].fillna(df_clean['well_id'])
+            missing_names = df_clean['location_name'].isna()
+            if missing_names.any():
+                # Via plain values, since a categorical column cannot take names it has not seen
+                filled = df_clean['location_name'].astype(object).where(~missing_names, df_clean['well_id'].astype(object))
+                df_clean['location_name'] = filled.astype('category')
         else:
             df_clean['location_name'] = df_clean['well_id']
         
@@ -113,119 +189,365 @@ def clean_groundwater_data(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def insert_groundwater_data(df: pd.DataFrame) -> tuple:
-    """Insert cleaned data into SQLite database."""
-    rows_inserted = 0
+def insert_groundwater_data(df: pd.DataFrame, source_id: str = "") -> tuple:
+    """Upsert cleaned data into SQLite database in batches; returns (new, updated, skipped, errors)."""
+    new = 0
+    updated = 0
     errors = 0
     
+    # Rows whose values match what is stored are left alone and count as skipped
+    upsert_query = """
+        INSERT INTO groundwater_data 
+        (well_id, location_name, latitude, longitude, depth_meters, 
+         water_level_meters, measurement_date, quality_ph, quality_tds, source_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (well_id, measurement_date, source_id) DO UPDATE SET
+            location_name = excluded.location_name, latitude = excluded.latitude,
+            longitude = excluded.longitude, depth_meters = excluded.depth_meters,
+            water_level_meters = excluded.water_level_meters, quality_ph = excluded.quality_ph,
+            quality_tds = excluded.quality_tds
+        WHERE (groundwater_data.location_name, groundwater_data.latitude, groundwater_data.longitude,
+               groundwater_data.depth_meters, groundwater_data.water_level_meters,
+               groundwater_data.quality_ph, groundwater_data.quality_tds)
+            IS NOT
+              (excluded.location_name, excluded.latitude, excluded.longitude, excluded.depth_meters,
+               excluded.water_level_meters, excluded.quality_ph, excluded.quality_tds)
+    """
+    
     try:
-        for _, row in df.iterrows():
+        # A reading repeated within the file, or within a day: the last one wins, the rest are skipped
+        unique = unique_readings(df)
+        rows = insert_rows(unique.assign(source_id=source_id), INSERT_COLUMNS + ['source_id'])
+        
+        for start in range(0, len(rows), UPLOAD_BATCH_ROWS):
+            batch = rows[start:start + UPLOAD_BATCH_ROWS]
             try:
-                # Prepare the insert query for SQLite
-                insert_query = """
-                    INSERT INTO groundwater_data 
-                    (well_id, location_name, latitude, longitude, depth_meters, 
-                     water_level_meters, measurement_date, quality_ph, quality_tds)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                
-                # Prepare values
-                values = (
-                    row.get('well_id'),
-                    row.get('location_name'),
-                    row.get('latitude'),
-                    row.get('longitude'),
-                    row.get('depth_meters'),
-                    row.get('water_level_meters'),
-                    row.get('measurement_date'),
-                    row.get('quality_ph'),
-                    row.get('quality_tds')
-                )
-                
-                # Execute the query
-                run_sql_query(insert_query, values)
-                rows_inserted += 1
-                
+                batch_new, batch_updated = run_bulk_upsert(upsert_query, batch)
+                new += batch_new
+                updated += batch_updated
             except Exception as e:
-                print(f"Error inserting row: {str(e)}")
-                errors += 1
-                continue
+                # One bad row fails its whole batch; retry row by row to keep the rest
+                print(f"Error inserting batch, retrying row by row: {str(e)}")
+                for values in batch:
+                    try:
+                        row_new, row_updated = run_bulk_upsert(upsert_query, [values])
+                        new += row_new
+                        updated += row_updated
+                    except Exception as e:
+                        print(f"Error inserting row: {str(e)}")
+                        errors += 1
         
-        return rows_inserted, errors
+        # Their trend and quality statistics are recomputed on the next lookup
+        mark_wells_changed(SQL_DIALECT, unique['well_id'].unique())
+        return new, updated, len(df) - new - updated - errors, errors
         
     except Exception as e:
         print(f"Database insertion error: {str(e)}")
-        return 0, len(df)
+        return 0, 0, 0, len(df)
 
 
-def generate_chart(query: str) -> str:
+def generate_chart(query: str, params=None, xlabel: str = 'Date', ylabel: str = 'Value') -> str:
     """Generate a matplotlib chart from SQL query results and return the URL."""
     try:
-        # Try to run the actual query
+        # Try to run the actual query (read-only, with a statement timeout), straight into columns
         try:
-            results = run_sql_query(query)
+            with span("run_sql_query", backend=analytics_dialect()) as stage:
+                results = run_analytics_frame(query, params, timeout=SQL_TIMEOUT_SECONDS)
+                stage.set(rows=len(results))
         except Exception:
             # Fallback to dummy data if database is not available
-            results = [
+            results = pd.DataFrame([
                 (1, '2023-01', 45.2),
                 (2, '2023-02', 47.8),
                 (3, '2023-03', 43.1),
                 (4, '2023-04', 49.5),
                 (5, '2023-05', 52.3),
                 (6, '2023-06', 48.7)
-            ]
+            ])
         
-        if not results:
+        if results.empty:
             return "No data available to plot"
         
-        # Convert to DataFrame
-        df = pd.DataFrame(results, columns=['id', 'date', 'value'])
-        
-        # Create the chart
-        plt.figure(figsize=(10, 6))
-        
-        # Determine chart type based on query content
-        if 'bar' in query.lower() or 'count' in query.lower():
-            plt.bar(df['date'], df['value'])
-            plt.title('Bar Chart - Groundwater Data')
-        else:
-            plt.plot(df['date'], df['value'], marker='o')
-            plt.title('Trend Chart - Groundwater Data')
-        
-        plt.xlabel('Date')
-        plt.ylabel('Value')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        # Use the last two columns as (label, value)
+        df = results.iloc[:, -2:].set_axis(['date', 'value'], axis=1)
         
-        # Save chart
-        chart_path = 'static/chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        with in_progress("chart_renders_in_progress"), span("render_chart", backend="matplotlib", points=len(df)):
+            # Create the chart on a Figure of its own: pyplot's global state is not thread-safe
+            figure = Figure(figsize=(10, 6))
+            FigureCanvasAgg(figure)
+            ax = figure.add_subplot()
+            
+            # Determine chart type based on query content
+            if 'bar' in query.lower() or 'count' in query.lower():
+                ax.bar(df['date'], df['value'])
+                ax.set_title('Bar Chart - Groundwater Data')
+            else:
+                ax.plot(df['date'], df['value'], marker='o')
+                ax.set_title('Trend Chart - Groundwater Data')
+            
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            ax.tick_params(axis='x', labelrotation=45)
+            figure.tight_layout()
+            
+            # Save chart, renaming a per-thread file into place so concurrent renders never interleave
+            chart_path = 'static/chart.png'
+            tmp_path = f"{chart_path}.{threading.get_ident()}.tmp"
+            figure.savefig(tmp_path, format='png', dpi=300, bbox_inches='tight')
+            os.replace(tmp_path, chart_path)
         
         return f"/static/chart.png"
         
     except Exception as e:
+        record_error(e)
         return f"Error generating chart: {str(e)}"
 
 
+MAP_PLACEHOLDER = "[Map tool placeholder: would call PostGIS and return visualization URL]"
+
+
+def load_sql_schema() -> dict:
+    """Introspect and cache the database schema used by the text-to-SQL route."""
+    return load_schema(SQL_DIALECT, run_sql_query)
+
+
+def build_facts() -> int:
+    """Regenerate every precomputed fact passage from the current data."""
+    return refresh_facts(SQL_DIALECT, run_sql_query)
+
+
+def plan_question_sql(question: str, chart: bool = False) -> dict:
+    """Turn an analytical question into a validated, parameterized query plan."""
+    schema = get_schema(SQL_DIALECT, run_sql_query)
+    # Planned for the engine that runs it: DuckDB when enabled, else SQLite
+    plan = plan_sql(question, schema, analytics_dialect(), chart=chart)
+    plan["sql"] = validate_sql(plan["sql"], schema)
+    return plan
+
+
+def answer_analytical_question(question: str):
+    """Answer an aggregate question with a bounded, read-only query (None on failure)."""
+    try:
+        # Declining, rising, breaching and seasonal wells come from the cached per-well statistics
+        if classify_well_question(question):
+            with span("well_stats") as stage:
+                stats = get_well_stats(SQL_DIALECT, run_sql_query)
+                stage.set(wells=len(stats))
+            return answer_well_question(question, stats)
+        
+        with span("plan_sql"):
+            plan = plan_question_sql(question)
+        with span("run_sql_query", backend=analytics_dialect()) as stage:
+            rows = run_analytics_query(plan["sql"], plan["params"], timeout=SQL_TIMEOUT_SECONDS)
+            stage.set(rows=len(rows))
+        return format_sql_answer(plan, rows)
+    except Exception as e:
+        print(f"Error answering analytical question: {str(e)}")
+        record_error(e)
+        return None
+
+
+def generate_question_chart(question: str) -> str:
+    """Plan the series a chart question asks for and render it."""
+    try:
+        with span("plan_sql"):
+            plan = plan_question_sql(question, chart=True)
+    except Exception as e:
+        record_error(e)
+        return f"Error generating chart: {str(e)}"
+    
+    xlabel = plan["grouping"].title() if plan["grouping"] in ("well", "location") else "Date"
+    return generate_chart(plan["sql"], plan["params"], xlabel=xlabel, ylabel=plan["metric_label"])
+
+
+def route_question(question: str) -> str:
+    """Classify a question as a 'map', 'chart', 'analytics' or 'hybrid' search question."""
+    question_lower = question.lower()
+    
+    if "map" in question_lower:
+        return "map"
+    elif any(keyword in question_lower for keyword in ["trend", "timeseries", "chart"]):
+        return "chart"
+    elif is_analytical_question(question) or classify_well_question(question):
+        return "analytics"
+    else:
+        return "hybrid"
+
+
+def select_answer(semantic_results: list, keyword_results: list) -> str:
+    """Return the top hybrid search result safely."""
+    if semantic_results:
+        return semantic_results[0]
+    elif keyword_results:
+        return keyword_results[0]
+    else:
+        return "No results found."
+
+
+def synthesize_answer(question: str, semantic_results: list, keyword_results: list) -> str:
+    """Generate an answer from the fused passages, falling back to the top passage."""
+    passages = fuse_passages(semantic_results, keyword_results)
+    if not passages:
+        return "No results found."
+    
+    with span("generate_answer", backend="ollama", passages=len(passages)) as stage:
+        # Reuse the answer if this question was already asked against the same passages
+        key = cache_key(question, passages)
+        cached_answer = get_cached_answer(key)
+        stage.set(cache_hit=cached_answer is not None)
+        if cached_answer is not None:
+            return cached_answer
+        
+        try:
+            answer = generate_answer(question, passages)
+            if answer:
+                store_answer(key, passages, answer)
+                return answer
+        except Exception as e:
+            print(f"Error generating answer: {str(e)}")
+            stage.record_error(e)
+        
+        stage.set(fallback=True)
+        return select_answer(semantic_results, keyword_results)
+
+
 def run_rag_pipeline(question: str) -> str:
     """Decide retrieval route based on query type."""
+    with span("route") as stage:
+        route = route_question(question)
+        stage.set(route=route)
+    
+    if route == "map":
+        return MAP_PLACEHOLDER
+    elif route == "chart":
+        return generate_question_chart(question)
+    elif route == "analytics":
+        answer = answer_analytical_question(question)
+        if answer is not None:
+            return answer
+    
+    # Try hybrid search
+    semantic_results = semantic_search(question)
+    keyword_results = bm25_search(question)
+    
+    return synthesize_answer(question, semantic_results, keyword_results)
+
+
+def run_rag_pipeline_batch(questions: List[str]) -> List[str]:
+    """Answer a list of questions in order, batching retrieval across them."""
+    with span("route", questions=len(questions)):
+        routes = [route_question(question) for question in questions]
+    answers = [None] * len(questions)
+    
+    # Charts and analytical answers that repeat within the batch are computed once
+    charts = {}
+    analytics = {}
+    for i, (question, route) in enumerate(zip(questions, routes)):
+        if route == "map":
+            answers[i] = MAP_PLACEHOLDER
+        elif route == "chart":
+            if question not in charts:
+                charts[question] = generate_question_chart(question)
+            answers[i] = charts[question]
+        elif route == "analytics":
+            if question not in analytics:
+                analytics[question] = answer_analytical_question(question)
+            answers[i] = analytics[question]
+    
+    # Hybrid questions (and analytical ones that could not be answered with SQL)
+    # share one embedding batch, one Qdrant request and one SQLite connection
+    hybrid_indexes = [i for i, answer in enumerate(answers) if answer is None]
+    hybrid_questions = [questions[i] for i in hybrid_indexes]
+    
+    if hybrid_questions:
+        semantic_batch = semantic_search_batch(hybrid_questions)
+        keyword_batch = bm25_search_batch(hybrid_questions)
+        
+        # Generate answers concurrently, up to the model's in-flight cap
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_GENERATIONS) as executor:
+            hybrid_answers = executor.map(propagate(synthesize_answer), hybrid_questions, semantic_batch, keyword_batch)
+            for i, answer in zip(hybrid_indexes, hybrid_answers):
+                answers[i] = answer
     
-    if "map" in question.lower():
-        return "[Map tool placeholder: would call PostGIS and return visualization URL]"
-    elif any(keyword in question.lower() for keyword in ["trend", "timeseries", "chart"]):
-        # Generate a sample SQL query for demonstration
-        sample_query = "SELECT * FROM groundwater_data ORDER BY measurement_date LIMIT 10"
-        return generate_chart(sample_query)
+    return answers
+
+
+def iter_answer_tokens(answer: str) -> Iterator[str]:
+    """Split an answer into word-sized tokens, keeping trailing whitespace."""
+    for token in re.findall(r'\S+\s*', answer):
+        yield token
+
+
+def run_rag_pipeline_stream(question: str) -> Iterator[Tuple[str, dict]]:
+    """Run the RAG pipeline, yielding (event, data) pairs as each stage completes."""
+    with span("route") as stage:
+        route = route_question(question)
+        stage.set(route=route)
+    yield "route", {"route": route}
+    
+    if route == "map":
+        answer = MAP_PLACEHOLDER
+    elif route == "chart":
+        answer = generate_question_chart(question)
+        yield "chart", {"url": answer}
     else:
+        answer = answer_analytical_question(question) if route == "analytics" else None
+    
+    if answer is None:
         # Try hybrid search
         semantic_results = semantic_search(question)
         keyword_results = bm25_search(question)
-
-        # Return top result safely
-        if semantic_results:
-            return semantic_results[0]
-        elif keyword_results:
-            return keyword_results[0]
-        else:
-            return "No results found."
+        yield "retrieval", {"semantic": semantic_results, "keyword": keyword_results}
+        
+        passages = fuse_passages(semantic_results, keyword_results)
+        key = cache_key(question, passages)
+        cached_answer = get_cached_answer(key) if passages else None
+        
+        # The generation span stays open across yields, so it is ended by hand
+        generation = start_span("generate_answer", backend="ollama", passages=len(passages), cache_hit=cached_answer is not None)
+        
+        if cached_answer is not None:
+            if generation:
+                generation.end()
+            for token in iter_answer_tokens(cached_answer):
+                yield "token", {"text": token}
+            yield "done", {"answer": cached_answer, "cached": True}
+            return
+        
+        # Stream tokens straight from the model as they are generated
+        tokens = []
+        failed = False
+        try:
+            if passages:
+                for token in generate_answer_stream(question, passages):
+                    tokens.append(token)
+                    yield "token", {"text": token}
+                
+                # Only complete generations are cached
+                if tokens:
+                    store_answer(key, passages, "".join(tokens).strip())
+        except Exception as e:
+            print(f"Error generating answer: {str(e)}")
+            failed = True
+            if generation:
+                generation.record_error(e)
+        
+        if generation:
+            generation.set(tokens=len(tokens))
+            generation.end()
+        
+        if tokens and not failed:
+            yield "done", {"answer": "".join(tokens).strip()}
+            return
+        
+        if tokens:
+            # A truncated answer is never presented as complete: the client drops the tokens
+            # it has shown and the top passage follows instead
+            yield "error", {"error": "Answer generation failed partway through", "discard_tokens": True}
+        
+        answer = select_answer(semantic_results, keyword_results)
+    
+    for token in iter_answer_tokens(answer):
+        yield "token", {"text": token}
+    
+    yield "done", {"answer": answer}
@@ -0,0 +1,271 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from metrics import observe
+
+# Where finished traces are exported. TRACE_LOG_PATH takes a file path or
+# "stdout" and receives one JSON object per trace; TRACE_OTLP_PATH receives
+# OTLP/JSON export requests, one per line, which the OpenTelemetry
+# collector's otlpjsonfile receiver (or any OTLP/JSON reader) can ingest.
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH")
+TRACE_OTLP_PATH = os.getenv("TRACE_OTLP_PATH")
+
+# Add an X-Timing breakdown to every response, not only when the client asks
+TIMING_HEADER_ALWAYS = os.getenv("TIMING_HEADER", "0") == "1"
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "ingres-api")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """A timed stage of a trace carrying attributes and an optional error."""
+
+    def __init__(self, trace, name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, **attributes):
+        """Attach attributes such as row counts or cache hits."""
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            # Stage latencies also feed the /metrics histograms; request roots are counted there already
+            if self.trace is None or self.parent_id is not None:
+                observe("pipeline_stage_duration_seconds", (self.end_ns - self.start_ns) / 1e9, stage=self.name)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """All spans recorded while handling one request."""
+
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = secrets.token_hex(16)
+        self.lock = threading.Lock()
+        self.spans = []
+        self.root = self.add_span(name, None, attributes)
+
+    def add_span(self, name: str, parent_id: Optional[str], attributes: dict) -> Span:
+        span = Span(self, name, parent_id, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def timing_summary(self) -> str:
+        """Summarize total and per-stage milliseconds for the X-Timing header."""
+        totals = {}
+        with self.lock:
+            for span in self.spans[1:]:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        parts = [f"total={self.root.duration_ms:.1f}ms"]
+        parts.extend(f"{name}={duration:.1f}ms" for name, duration in totals.items())
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "attributes": self.root.attributes,
+            "error": self.root.error,
+            "spans": [
+                {
+                    "name": span.name,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "offset_ms": round((span.start_ns - self.root.start_ns) / 1e6, 3),
+                    "duration_ms": round(span.duration_ms, 3),
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in self.spans[1:]
+            ],
+        }
+
+    def to_otlp(self) -> dict:
+        """Render the trace as an OTLP/JSON ExportTraceServiceRequest."""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        otlp_spans = []
+        for span in self.spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 2 if span is self.root else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "ingres.tracing"}, "spans": otlp_spans}],
+            }]
+        }
+
+
+def _append_line(path: str, record: dict):
+    line = json.dumps(record, default=str)
+    with _export_lock:
+        if path == "stdout":
+            print(line, flush=True)
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def export_trace(trace: Trace):
+    """Write a finished trace to the configured JSON log and OTLP file."""
+    try:
+        if TRACE_LOG_PATH:
+            _append_line(TRACE_LOG_PATH, trace.to_dict())
+        if TRACE_OTLP_PATH:
+            _append_line(TRACE_OTLP_PATH, trace.to_otlp())
+    except Exception as e:
+        print(f"Error exporting trace: {str(e)}")
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Trace]:
+    """Record a trace for the enclosed work and export it when it finishes."""
+    current = Trace(name, attributes)
+    previous_trace = _current_trace.get()
+    previous_span = _current_span.get()
+    _current_trace.set(current)
+    _current_span.set(current.root)
+    try:
+        yield current
+    except Exception as e:
+        current.root.record_error(e)
+        raise
+    finally:
+        current.root.end()
+        _current_trace.set(previous_trace)
+        _current_span.set(previous_span)
+        export_trace(current)
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Start a span under the current one without making it current (None outside a trace)."""
+    current = _current_trace.get()
+    if current is None:
+        return None
+    parent = _current_span.get()
+    return current.add_span(name, parent.span_id if parent else None, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time a pipeline stage; exceptions are recorded on the span and re-raised."""
+    current = start_span(name, **attributes)
+    if current is None:
+        # Not inside a trace: hand out a detached span that is timed but never exported
+        detached = Span(None, name, None, attributes)
+        try:
+            yield detached
+        finally:
+            detached.end()
+        return
+
+    previous = _current_span.get()
+    _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end()
+        _current_span.set(previous)
+
+
+def record_error(error):
+    """Mark the current span as failed for errors a layer handles itself."""
+    current = _current_span.get()
+    if current is not None:
+        current.record_error(error)
+
+
+def propagate(fn):
+    """Wrap fn so calls on worker threads join the caller's trace."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def trace_stream(name: str, events: Iterator, **attributes) -> Iterator:
+    """Trace a generator whose steps may each run on a different thread."""
+    current = Trace(name, attributes)
+    try:
+        while True:
+            # Re-enter the trace for every step; the caller's context may differ each time
+            trace_token = _current_trace.set(current)
+            span_token = _current_span.set(current.root)
+            try:
+                item = next(events)
+            except StopIteration:
+                break
+            except Exception as e:
+                current.root.record_error(e)
+                raise
+            finally:
+                # Restore whatever the caller had, which may be a trace of its own
+                _current_span.reset(span_token)
+                _current_trace.reset(trace_token)
+            yield item
+    finally:
+        current.root.end()
+        export_trace(current)
+
+
+def add_tracing_middleware(app):
+    """Trace every request and add X-Timing when asked for (or TIMING_HEADER=1)."""
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        with trace(f"{request.method} {request.url.path}", http_method=request.method, http_path=request.url.path) as current:
+            response = await call_next(request)
+            current.root.set(http_status=response.status_code)
+
+        if TIMING_HEADER_ALWAYS or request.headers.get("x-timing"):
+            response.headers["X-Timing"] = current.timing_summary()
+        return response
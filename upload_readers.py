@@ -0,0 +1,240 @@
+import hashlib
+import io
+from typing import Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+# Standard groundwater columns and the header spellings accepted for each
+COLUMN_MAPPING = {
+    'well_id': ['well_id', 'wellid', 'well', 'id'],
+    'location_name': ['location_name', 'location', 'site', 'site_name'],
+    'latitude': ['latitude', 'lat', 'y'],
+    'longitude': ['longitude', 'lon', 'lng', 'x'],
+    'water_level_meters': ['water_level_meters', 'water_level', 'level', 'depth'],
+    'measurement_date': ['measurement_date', 'date', 'measurement_date', 'timestamp'],
+    'quality_ph': ['quality_ph', 'ph', 'ph_value'],
+    'quality_tds': ['quality_tds', 'tds', 'tds_value'],
+    'depth_meters': ['depth_meters', 'well_depth', 'total_depth']
+}
+
+# Column order of the groundwater_data INSERT
+INSERT_COLUMNS = ['well_id', 'location_name', 'latitude', 'longitude', 'depth_meters',
+                  'water_level_meters', 'measurement_date', 'quality_ph', 'quality_tds']
+
+# A reading is identified by well and date (plus the upload's source id, kept in the database)
+MEASUREMENT_KEY = ['well_id', 'measurement_date']
+
+# Repeated identifiers stored once per distinct value in cleaned frames
+CATEGORICAL_COLUMNS = ['well_id', 'location_name']
+
+# Measurements stored as float32 when that keeps them within FLOAT32_TOLERANCE; the
+# database keeps two decimals, so half a hundredth is all the precision that matters.
+# Coordinates stay float64: float32 would move a well by up to a metre.
+FLOAT32_COLUMNS = ['water_level_meters', 'depth_meters', 'quality_ph', 'quality_tds']
+FLOAT32_TOLERANCE = 0.005
+FLOAT32_DECIMALS = 2
+
+# Memory budget per million cleaned rows, checked by test_upload_readers.py. Measured with
+# the synthetic generator: the cleaned frame is ~43 MB (93 MB with object strings and
+# float64), and cleaning raises peak RSS by ~63 MB over the input frame.
+CLEANED_MB_PER_MILLION_ROWS = 60
+CLEANING_PEAK_RSS_MB_PER_MILLION_ROWS = 120
+
+# Columnar formats; Arrow covers both the IPC file (Feather v2) and stream layouts
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.arrows', '.feather', '.ipc')
+
+# Rows read, cleaned and inserted at a time, so large files are never held in memory whole
+UPLOAD_CHUNK_ROWS = 50000
+
+# Rows read for a file preview
+PREVIEW_ROWS = 10
+
+# Rows sent to the database per INSERT batch
+UPLOAD_BATCH_ROWS = 5000
+
+# Bytes read at a time when hashing a file on disk
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Raw upload bytes, or the path of an upload spooled to disk
+UploadSource = Union[bytes, str]
+
+
+def mapped_columns(names) -> list:
+    """File columns that map onto a groundwater column, in file order."""
+    accepted = {variation for variations in COLUMN_MAPPING.values() for variation in variations}
+    return [name for name in names if str(name).lower().strip() in accepted]
+
+
+def open_source(file_content: UploadSource):
+    """A file object for upload bytes; paths are passed through for readers to open themselves."""
+    return io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+
+
+def file_sha256(file_content: UploadSource) -> str:
+    """SHA-256 of the upload, reading a spooled file block by block."""
+    if isinstance(file_content, bytes):
+        return hashlib.sha256(file_content).hexdigest()
+    digest = hashlib.sha256()
+    with open(file_content, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def arrow_to_pandas(table) -> pd.DataFrame:
+    """Convert an Arrow table to pandas keeping dates typed and without consolidating blocks."""
+    # self_destruct frees each Arrow column as soon as it is converted
+    return table.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+
+
+def iter_parquet(file_content: UploadSource, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Read only the groundwater columns of a Parquet file, chunk_rows at a time."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source = pa.BufferReader(file_content) if isinstance(file_content, bytes) else file_content
+    parquet_file = pq.ParquetFile(source, memory_map=True)
+    columns = mapped_columns(parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield arrow_to_pandas(pa.Table.from_batches([batch]))
+
+
+def iter_arrow(file_content: UploadSource, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Read only the groundwater columns of an Arrow IPC file or stream, chunk_rows at a time."""
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    # Spooled files are memory-mapped, so batches are paged in from disk as they are read
+    buffer = pa.py_buffer(file_content) if isinstance(file_content, bytes) else pa.memory_map(file_content)
+    try:
+        reader = pa.ipc.open_file(buffer)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        if not isinstance(file_content, bytes):
+            buffer = pa.memory_map(file_content)
+        reader = pa.ipc.open_stream(buffer)
+        batches = iter(reader)
+
+    # Record batches reference the upload buffer, so selecting and slicing copies nothing
+    columns = mapped_columns(reader.schema.names)
+    for batch in batches:
+        batch = batch.select(columns)
+        for offset in range(0, batch.num_rows, chunk_rows):
+            yield arrow_to_pandas(pa.Table.from_batches([batch.slice(offset, chunk_rows)]))
+
+
+def iter_excel(file_content: UploadSource, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Stream the groundwater columns of every sheet in an .xlsx workbook, chunk_rows at a time."""
+    from openpyxl import load_workbook
+
+    # read_only parses the sheet XML as it is iterated instead of building the whole workbook
+    workbook = load_workbook(open_source(file_content), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header:
+                continue
+
+            # Skip sheets without groundwater columns (notes, legends, pivot tables)
+            names = [str(name).strip() if name is not None else '' for name in header]
+            columns = mapped_columns(names)
+            if not columns:
+                continue
+            positions = [names.index(column) for column in columns]
+
+            chunk = []
+            for row in rows:
+                values = [row[i] if i < len(row) else None for i in positions]
+                if all(value is None for value in values):
+                    continue
+                chunk.append(values)
+                if len(chunk) >= chunk_rows:
+                    yield pd.DataFrame(chunk, columns=columns)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_upload(file_content: UploadSource, filename: str, chunk_rows: int = UPLOAD_CHUNK_ROWS):
+    """Iterate an uploaded file as DataFrame chunks, or None if the format is not supported."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return pd.read_csv(open_source(file_content), chunksize=chunk_rows)
+    if name.endswith('.xlsx'):
+        return iter_excel(file_content, chunk_rows)
+    if name.endswith('.xls'):
+        # Legacy binary workbooks have no streaming reader
+        return iter([pd.read_excel(open_source(file_content))])
+    if name.endswith(PARQUET_EXTENSIONS):
+        return iter_parquet(file_content, chunk_rows)
+    if name.endswith(ARROW_EXTENSIONS):
+        return iter_arrow(file_content, chunk_rows)
+    return None
+
+
+def preview_upload(file_content: UploadSource, filename: str, rows: int = PREVIEW_ROWS):
+    """The first rows of an uploaded file, read without parsing the rest, or None if unsupported."""
+    chunks = iter_upload(file_content, filename, chunk_rows=rows)
+    if chunks is None:
+        return None
+    try:
+        return next(iter(chunks), pd.DataFrame()).head(rows)
+    finally:
+        # Stop the reader so an open workbook is closed straight away
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Shrink a cleaned frame in place: categorical identifiers and float32 measurements."""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns and df[column].dtype == np.float64:
+            values = df[column].to_numpy()
+            compact = values.astype(np.float32)
+            if np.allclose(compact, values, rtol=0, atol=FLOAT32_TOLERANCE, equal_nan=True):
+                df[column] = compact
+
+    return df
+
+
+def unique_readings(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per MEASUREMENT_KEY as the database stores it: dates are kept to the day,
+    so two readings of a well on the same day are one reading, and the last one wins."""
+    dates = df['measurement_date']
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        df = df.assign(measurement_date=dates.dt.normalize())
+    return df.drop_duplicates(subset=MEASUREMENT_KEY, keep='last')
+
+
+def insert_rows(df: pd.DataFrame, columns: list) -> list:
+    """Parameter tuples for the given columns, built column by column instead of per row."""
+    values = []
+    for column in columns:
+        if column not in df.columns:
+            values.append([None] * len(df))
+            continue
+
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Database drivers cannot bind pandas Timestamps; send ISO dates
+            series = series.dt.strftime('%Y-%m-%d')
+        elif series.dtype == np.float32:
+            # Widen float32 without its binary noise (7.1 rather than 7.099999904632568)
+            series = series.astype(np.float64).round(FLOAT32_DECIMALS)
+
+        missing = series.isna().to_numpy()
+        if missing.any():
+            values.append(series.astype(object).where(~missing, None).tolist())
+        else:
+            values.append(series.tolist())
+
+    return list(zip(*values))
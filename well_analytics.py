@@ -0,0 +1,250 @@
+"""
+Per-well trend, seasonality and water-quality statistics.
+
+Statistics for all wells are computed together with grouped pandas
+operations (no per-well Python loops), cached per backend, and brought up to
+date incrementally: uploads mark the wells they touched, and only those wells
+are recomputed on the next lookup. Questions such as "which wells are
+declining fastest" are then answered from the cache.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+# Drinking-water limits (BIS IS 10500 acceptable limits)
+TDS_LIMIT = 500.0
+PH_MIN = 6.5
+PH_MAX = 8.5
+
+# A trend needs this many level readings spanning at least this many days; over a year,
+# so some calendar months are measured in more than one year
+MIN_TREND_READINGS = 6
+MIN_TREND_DAYS = 400
+
+# Seasonality needs readings in this many distinct calendar months
+MIN_SEASONAL_MONTHS = 12
+
+# Wells loaded and computed per query, which bounds memory on a full refresh
+WELL_STATS_BATCH = 500
+
+# Wells listed in an answer
+WELL_ANSWER_LIMIT = 10
+
+READING_COLUMNS = ["well_id", "location_name", "measurement_date", "water_level_meters", "quality_ph", "quality_tds"]
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December"]
+
+# Question phrases for each kind of well statistics answer
+WELL_QUESTIONS = {
+    "declining": ["declining", "decline", "falling", "dropping", "depleting", "depletion"],
+    "rising": ["rising", "recovering", "recharging", "increasing level"],
+    "breaches": ["breach", "exceed", "unsafe", "contaminat", "above the limit", "over the limit"],
+    "seasonal": ["seasonal", "seasonality", "monsoon swing"],
+}
+
+# A question is about particular wells only if it also asks which wells, ranks them or names one;
+# otherwise "what causes groundwater depletion?" would get a list of wells
+WELL_INTENT = re.compile(
+    r"\bwhich\s+(?:\w+\s+){0,2}wells?\b"
+    r"|\b(?:list|rank|show)\b.*\bwells?\b"
+    r"|\bwells?\s+(?:that|with|where|exceed|breach|declin|ris|fall|drop|los)"
+    r"|\b(?:fastest|steepest|largest|biggest|worst)\b"
+    r"|\btop\s+\d+\b"
+    r"|\bw\d+\b"
+)
+
+# Cached statistics are recomputed in full after this many seconds, so data loaded outside
+# /upload (simple_setup, populate_dummy_data) or by other API workers is picked up
+WELL_STATS_TTL = float(os.getenv("WELL_STATS_TTL", "300"))
+
+# Per backend: the cached statistics, indexed by well_id, when they were computed, and wells changed since
+_stats_cache: Dict[str, pd.DataFrame] = {}
+_stats_computed_at: Dict[str, float] = {}
+_changed_wells: Dict[str, set] = {}
+_stats_lock = threading.Lock()
+_changed_lock = threading.Lock()
+
+
+def compute_well_stats(readings: pd.DataFrame) -> pd.DataFrame:
+    """Statistics for every well in a frame of READING_COLUMNS, one row per well_id."""
+    dates = pd.to_datetime(readings["measurement_date"], errors="coerce")
+    well = readings["well_id"].astype(str)
+    level = pd.to_numeric(readings["water_level_meters"], errors="coerce")
+    ph = pd.to_numeric(readings["quality_ph"], errors="coerce")
+    tds = pd.to_numeric(readings["quality_tds"], errors="coerce")
+    by_well = readings.groupby(well, sort=True)
+
+    # Level trend: least-squares slope per well in metres per year, fitted within each calendar
+    # month (each month compared with the same month in other years) so seasons do not bias it.
+    # Missing and non-positive levels (sign errors) are left out.
+    valid = level.gt(0) & dates.notna()
+    g, y, d = well[valid], level[valid], dates[valid]
+    t = (d - pd.Timestamp("2000-01-01")).dt.days / 365.25
+    month = d.dt.month
+    tc = t - t.groupby([g, month]).transform("mean")
+    yc = y - y.groupby([g, month]).transform("mean")
+    sxx = (tc * tc).groupby(g).sum()
+    slope = (tc * yc).groupby(g).sum() / sxx.where(sxx > 0)
+    readings_used = y.groupby(g).size()
+    span_days = (d.groupby(g).max() - d.groupby(g).min()).dt.days
+    slope = slope.where((readings_used >= MIN_TREND_READINGS) & (span_days >= MIN_TREND_DAYS))
+    mean_level = y.groupby(g).mean()
+
+    # Seasonality: mean detrended level per calendar month, centred per well
+    residual = y - t * g.map(slope)
+    monthly = residual.groupby([g, month]).mean().dropna()
+    monthly = monthly - monthly.groupby(level=0).transform("mean")
+    monthly.index.names = ["well_id", "month"]
+    by_month = monthly.groupby(level=0)
+    amplitude = ((by_month.max() - by_month.min()) / 2).where(by_month.size() >= MIN_SEASONAL_MONTHS)
+    peaks = monthly.reset_index(name="effect").sort_values("effect").drop_duplicates("well_id", keep="last")
+    peak_month = peaks.set_index("well_id")["month"].where(amplitude.notna())
+
+    # Latest reading per well
+    latest = readings.assign(_date=dates, _ph=ph, _tds=tds, _well=well).sort_values("_date")
+    latest = latest.groupby("_well").last()
+
+    stats = pd.DataFrame({
+        "location_name": by_well["location_name"].first(),
+        "readings": by_well.size(),
+        "first_date": dates.groupby(well).min(),
+        "last_date": dates.groupby(well).max(),
+        "mean_level_m": mean_level,
+        "trend_m_per_year": slope,
+        "trend_pct_per_year": slope / mean_level * 100,
+        "seasonal_amplitude_m": amplitude,
+        "peak_month": peak_month,
+        "tds_breaches": tds.gt(TDS_LIMIT).groupby(well).sum(),
+        "ph_breaches": (ph.lt(PH_MIN) | ph.gt(PH_MAX)).groupby(well).sum(),
+        "max_tds": tds.groupby(well).max(),
+        "latest_tds": latest["_tds"],
+        "latest_ph": latest["_ph"],
+    })
+    stats.index.name = "well_id"
+    return stats
+
+
+def load_readings(dialect: str, run_query: Callable, well_ids: List[str]) -> pd.DataFrame:
+    """The readings of some wells, read with run_query(query, params)."""
+    placeholder = "%s" if dialect == "postgres" else "?"
+    query = (f"SELECT {', '.join(READING_COLUMNS)} FROM groundwater_data "
+             f"WHERE well_id IN ({', '.join([placeholder] * len(well_ids))})")
+    return pd.DataFrame(run_query(query, tuple(well_ids)), columns=READING_COLUMNS)
+
+
+def compute_for_wells(dialect: str, run_query: Callable, well_ids: List[str]) -> pd.DataFrame:
+    """Load and compute statistics WELL_STATS_BATCH wells at a time."""
+    parts = [
+        compute_well_stats(load_readings(dialect, run_query, well_ids[start:start + WELL_STATS_BATCH]))
+        for start in range(0, len(well_ids), WELL_STATS_BATCH)
+    ]
+    return pd.concat(parts) if parts else compute_well_stats(pd.DataFrame(columns=READING_COLUMNS))
+
+
+def mark_wells_changed(dialect: str, well_ids):
+    """Record that uploads changed these wells; their statistics are recomputed on the next lookup."""
+    with _changed_lock:
+        _changed_wells.setdefault(dialect, set()).update(str(well_id) for well_id in well_ids)
+
+
+def refresh_well_stats(dialect: str):
+    """Drop the cached statistics so the next lookup recomputes every well."""
+    with _stats_lock:
+        _stats_cache.pop(dialect, None)
+
+
+def get_well_stats(dialect: str, run_query: Callable) -> pd.DataFrame:
+    """Cached statistics for all wells, computed on first use and every WELL_STATS_TTL seconds, with wells changed since recomputed."""
+    with _stats_lock:
+        with _changed_lock:
+            changed = _changed_wells.pop(dialect, set())
+        stats = _stats_cache.get(dialect)
+        if stats is not None and time.monotonic() - _stats_computed_at[dialect] > WELL_STATS_TTL:
+            stats = None
+        try:
+            if stats is None:
+                well_ids = [row[0] for row in run_query("SELECT DISTINCT well_id FROM groundwater_data", None)]
+                stats = compute_for_wells(dialect, run_query, sorted(well_ids))
+                _stats_computed_at[dialect] = time.monotonic()
+            elif changed:
+                fresh = compute_for_wells(dialect, run_query, sorted(changed))
+                stats = pd.concat([stats.drop(index=list(changed), errors="ignore"), fresh]).sort_index()
+        except Exception:
+            # Keep the changes for the next attempt
+            mark_wells_changed(dialect, changed)
+            raise
+        _stats_cache[dialect] = stats
+        return stats
+
+
+def classify_well_question(question: str) -> Optional[str]:
+    """The kind of well statistics a question asks for: 'declining', 'rising', 'breaches', 'seasonal' or None."""
+    question_lower = question.lower()
+    if not WELL_INTENT.search(question_lower):
+        return None
+    for kind, phrases in WELL_QUESTIONS.items():
+        if any(phrase in question_lower for phrase in phrases):
+            return kind
+    return None
+
+
+def format_well(well_id: str, row: pd.Series) -> str:
+    location = f" ({row['location_name']})" if isinstance(row["location_name"], str) and row["location_name"] != well_id else ""
+    return f"- {well_id}{location}"
+
+
+def answer_well_question(question: str, stats: pd.DataFrame) -> Optional[str]:
+    """Answer a declining/rising/breaches/seasonal question from well statistics (None if it is not one)."""
+    kind = classify_well_question(question)
+    if kind is None:
+        return None
+    question_lower = question.lower()
+
+    # Restrict to locations the question names
+    locations = [name for name in stats["location_name"].dropna().unique() if str(name).lower() in question_lower]
+    if locations:
+        stats = stats[stats["location_name"].isin(locations)]
+    where = f" in {', '.join(locations)}" if locations else ""
+
+    lines = []
+    if kind in ("declining", "rising"):
+        trends = stats["trend_m_per_year"]
+        selected = stats[trends < 0].sort_values("trend_m_per_year") if kind == "declining" \
+            else stats[trends > 0].sort_values("trend_m_per_year", ascending=False)
+        if selected.empty:
+            return f"No wells{where} show a {'falling' if kind == 'declining' else 'rising'} water level trend."
+        lines.append(f"Wells{where} with the fastest {'falling' if kind == 'declining' else 'rising'} water levels "
+                     f"({len(selected)} of {len(stats)}):")
+        for well_id, row in selected.head(WELL_ANSWER_LIMIT).iterrows():
+            lines.append(f"{format_well(well_id, row)}: {row['trend_m_per_year']:+.2f} m/year "
+                         f"({row['trend_pct_per_year']:+.1f}%/year) over {row['readings']} readings")
+
+    elif kind == "breaches":
+        checks = []
+        if "ph" not in re.findall(r"\w+", question_lower):
+            checks.append(("tds_breaches", f"TDS above {TDS_LIMIT:g} mg/L"))
+        if "tds" not in question_lower:
+            checks.append(("ph_breaches", f"pH outside {PH_MIN:g}-{PH_MAX:g}"))
+        for column, label in checks:
+            selected = stats[stats[column] > 0].sort_values(column, ascending=False)
+            lines.append(f"Wells{where} with {label}: {len(selected)} of {len(stats)}")
+            for well_id, row in selected.head(WELL_ANSWER_LIMIT).iterrows():
+                detail = f", max {row['max_tds']:,.0f} mg/L" if column == "tds_breaches" else f", latest pH {row['latest_ph']:.2f}"
+                lines.append(f"{format_well(well_id, row)}: {int(row[column])} of {row['readings']} readings{detail}")
+
+    else:
+        selected = stats.dropna(subset=["seasonal_amplitude_m"]).sort_values("seasonal_amplitude_m", ascending=False)
+        if selected.empty:
+            return f"Not enough readings{where} to measure seasonal swings."
+        lines.append(f"Wells{where} with the largest seasonal swings in water level:")
+        for well_id, row in selected.head(WELL_ANSWER_LIMIT).iterrows():
+            lines.append(f"{format_well(well_id, row)}: ±{row['seasonal_amplitude_m']:.2f} m, "
+                         f"highest in {MONTH_NAMES[int(row['peak_month']) - 1]}")
+
+    return "\n".join(lines)